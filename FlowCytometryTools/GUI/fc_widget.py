@@ -579,11 +579,15 @@ class PolyDrawer(AxesWidget):
 
 class FCGateManager(EventGenerator):
     """Manages gate creation widgets and gates."""
+    #: Number of bins (along each axis) of the plotted histograms
+    bins = 200
+
     def __init__(self, ax, callback_list=None):
         self.gates = []
         self.fig = ax.figure
         self.ax = ax
         self._plt_data = None
+        self._histograms = {}
         self.active_gate = None
         self.sample = None
         self.canvas = self.fig.canvas
@@ -720,6 +724,7 @@ class FCGateManager(EventGenerator):
         self._sample_loaded_event()
 
     def _sample_loaded_event(self):
+        self._histograms = {}
         if self.sample is not None:
             self.current_channels = list(self.sample.channel_names[0:2])
             self.set_axes(self.current_channels, self.ax)
@@ -764,8 +769,8 @@ class FCGateManager(EventGenerator):
         # Remove existing gates
         for gate in self.gates:
             gate.remove_spawned_gates()
-        ## 
-        # Has a clear axis command inside!!
+        ##
+        # Clears the axes when switching to (or from) a 1d histogram,
         # which will "force kill" spawned gates
         self.plot_data()
 
@@ -784,37 +789,28 @@ class FCGateManager(EventGenerator):
     ####################
 
     def plot_data(self):
-        """ Plots the loaded data """
+        """
+        Plots the loaded data.
+
+        2d densities are drawn as an image, which is updated in place (set_data)
+        when the channels change, from histograms that are computed once per
+        channel pair (see _get_histogram).
+        """
         if self.sample is None: return
 
-        # Clear the axes
-        self.ax.cla()
-        sample = self.sample
         ax = self.ax
 
-        ###
-        # Potential code to clear axis
-        # will be easier to use in future version
-        # of matplotlib
-        #
-        #    #if self._plt_data is not None:
-        #        ## HARD CODED FOR SPEED NEEDS FIXING
-        #        #if self._plt_data[0] == '1dhist':
-        #            #patches = self._plt_data[1]
-        #            #[p.remove() for p in patches] # removes patches
-        #        #elif self._plt_data[0] == '2dhist':
-        #            #axes_image = self._plt_data[1]
-        #            #print axes_image
-        #            #print type(axes_image)
-        #            #axes_image.remove()
-        #        #self._plt_data = None
-
         if self.current_channels is None:
             self.current_channels = self.sample.channel_names[:2]
 
         channels = self.current_channels
-        channels_to_plot = channels[0] if len(channels) == 1 else channels
-        out = self.sample.plot(channels_to_plot, ax=self.ax)
+        if len(channels) == 1:
+            # Clear the axes
+            ax.cla()
+            self._plt_data = None
+            self.sample.plot(channels[0], ax=ax, bins=self.bins)
+        else:
+            self._plot_density(channels)
 
         # Set pickers for x and y axis
         self.xlabel_artist = ax.get_xaxis().get_label()
@@ -824,6 +820,47 @@ class FCGateManager(EventGenerator):
 
         self.fig.canvas.draw()
 
+    def _plot_density(self, channels):
+        """ Draws the 2d histogram of the sample in the channels, reusing the existing image if any. """
+        ax = self.ax
+        hist = self._get_histogram(channels)
+        xedges, yedges = hist.edges
+        extent = (xedges[0], xedges[-1], yedges[0], yedges[-1])
+        density = numpy.ma.masked_less(hist.counts.T, 1)  # Empty bins are not drawn
+
+        if self._plt_data is not None and self._plt_data[0] == '2dhist':
+            image = self._plt_data[1]
+            image.set_data(density)
+            image.set_extent(extent)
+            if density.count():
+                image.autoscale()
+        else:
+            ax.cla()
+            image = ax.imshow(density, extent=extent, origin='lower', aspect='auto',
+                              interpolation='nearest', cmap=pl.cm.copper,
+                              norm=matplotlib.colors.LogNorm())
+            self._plt_data = ('2dhist', image)
+
+        ax.set_xlim(extent[:2])
+        ax.set_ylim(extent[2:])
+        ax.set_xlabel(channels[0], size=16)
+        ax.set_ylabel(channels[1], size=16)
+
+    def _get_histogram(self, channels):
+        """
+        Returns the histogram of the sample in the channels.
+
+        Histograms are cached by (channels, bins, transformations of the sample),
+        so switching back to channels that were already displayed does not read
+        or bin the events again.
+        """
+        transforms = tuple(repr(params) for action, params in self.sample.history
+                           if action == 'transform')
+        key = (tuple(channels), self.bins, transforms)
+        if key not in self._histograms:
+            self._histograms[key] = self.sample.histogram(list(channels), bins=self.bins)
+        return self._histograms[key]
+
     def get_generation_code(self):
         """Returns python code that generates all drawn gates.
         """
@@ -0,0 +1,234 @@
+"""
+A persistent on-disk cache of parsed FCS files.
+
+Parsed files are stored in a cache directory, keyed by the content of the file
+and the parser options. The events are stored as a single array in column major order
+(each channel is contiguous), so that they can be memory mapped when the file is opened again,
+together with the parsed meta data.
+
+The cache is disabled by default. Enable it by setting the cache directory:
+
+>>> from FlowCytometryTools.IO.cache import disk_cache
+>>> disk_cache.set_path('/path/to/cache/directory')
+"""
+from __future__ import absolute_import
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from FlowCytometryTools.IO.fcsreader import FCS_Parser, parse_fcs
+
+_version = 3 # Increment when the layout of the cache changes
+_block_size = 2 ** 20
+
+
+def _content_hash(path):
+    """ Returns the sha1 hash of the content of the file. """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(_block_size)
+        while block:
+            sha1.update(block)
+            block = f.read(_block_size)
+    return sha1.hexdigest()
+
+
+def _hash(*args):
+    return hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Cache of parsed FCS files stored in a directory.
+
+    Layout of the cache directory:
+
+    * files/<hash of path, size and modification time> : content hash of the file
+      (so that files are only hashed once).
+    * <content hash>-<hash of options>/meta.pkl : the parsed meta data.
+    * <content hash>-<hash of options>/data.pkl : the channel names.
+    * <content hash>-<hash of options>/data.npy : the events (events x channels, in column major
+      order), or a record array if the channels hold values of different types.
+    """
+
+    def __init__(self, path=None):
+        """
+        Parameters
+        ----------
+        path : str | None
+            Cache directory. None disables the cache.
+        """
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+        self.set_path(path)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def set_path(self, path):
+        """ Sets the cache directory (created if needed). None disables the cache. """
+        if path is not None:
+            path = os.path.abspath(path)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.path = path
+
+    def clear(self):
+        """ Removes all the cached files and resets the counters. """
+        if self.enabled:
+            for name in os.listdir(self.path):
+                full_name = os.path.join(self.path, name)
+                if os.path.isdir(full_name):
+                    shutil.rmtree(full_name)
+                else:
+                    os.remove(full_name)
+        self.hits = 0
+        self.misses = 0
+
+    def get_content_hash(self, datafile):
+        """
+        Returns the content hash of the datafile.
+        The hash is stored in the cache, keyed on the path, size and modification time of the file.
+        """
+        stat = os.stat(datafile)
+        key = _hash(os.path.abspath(datafile), stat.st_size, stat.st_mtime)
+        hash_file = os.path.join(self.path, 'files', key)
+        if os.path.exists(hash_file):
+            with open(hash_file, 'r') as f:
+                return f.read()
+        content_hash = _content_hash(datafile)
+        self._write(os.path.join(self.path, 'files'), {key: content_hash.encode('ascii')})
+        return content_hash
+
+    def _get_entry_path(self, datafile, kind, **options):
+        options = sorted(options.items())
+        return os.path.join(self.path, '{0}-{1}-{2}'.format(self.get_content_hash(datafile),
+                                                             kind, _hash(_version, options)))
+
+    def _write(self, directory, files):
+        """
+        Writes the files (name:bytes) into the directory.
+        The files are first written to a temporary directory which is then renamed,
+        so that readers never see a partially written entry.
+        """
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass # Created concurrently
+        tmp_dir = tempfile.mkdtemp(dir=self.path)
+        try:
+            for name, content in files.items():
+                tmp_name = os.path.join(tmp_dir, name)
+                with open(tmp_name, 'wb') as f:
+                    if isinstance(content, numpy.ndarray):
+                        numpy.save(f, content)
+                    else:
+                        f.write(content)
+                os.rename(tmp_name, os.path.join(directory, name))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def read_meta(self, datafile, channel_naming='$PnS'):
+        """
+        Returns the meta data of the datafile (as returned by
+        parse_fcs(datafile, meta_data_only=True, reformat_meta='lazy')),
+        parsing the file only if it is not in the cache.
+        """
+        entry = self._get_entry_path(datafile, 'meta', channel_naming=channel_naming)
+        meta_file = os.path.join(entry, 'meta.pkl')
+        if os.path.exists(meta_file):
+            self.hits += 1
+            with open(meta_file, 'rb') as f:
+                return pickle.load(f)
+
+        self.misses += 1
+        meta = parse_fcs(datafile, meta_data_only=True, reformat_meta='lazy',
+                         channel_naming=channel_naming)
+        self._write(entry, {'meta.pkl': pickle.dumps(meta, 2)})
+        return meta
+
+    def read_data(self, datafile, channels=None, channel_naming='$PnS', mmap=False):
+        """
+        Returns the data of the datafile as a DataFrame (see parse_fcs),
+        parsing the file only if it is not in the cache.
+
+        All the channels of the file are stored in the cache, and only the requested
+        channels are loaded from it. (The mmap option of the parser is not relevant,
+        since the cached events are always memory mapped.)
+
+        The returned DataFrame refers to the memory mapped events (copy-on-write,
+        so that modifying it does not modify the cache), unless the requested channels
+        are not consecutive channels of the file, in which case they are copied,
+        or the channels of the file hold values of different types.
+        """
+        entry = self._get_entry_path(datafile, 'data', channel_naming=channel_naming)
+        names_file = os.path.join(entry, 'data.pkl')
+
+        if os.path.exists(names_file):
+            self.hits += 1
+            with open(names_file, 'rb') as f:
+                channel_names = pickle.load(f)
+        else:
+            self.misses += 1
+            parser = FCS_Parser(datafile, channel_naming=channel_naming, mmap=True)
+            channel_names = list(parser.get_channel_names())
+            files = OrderedDict([('data.npy', _get_events_array(parser, len(channel_names))),
+                                 ('data.pkl', pickle.dumps(channel_names, 2))])  # Written last: marks a complete entry
+            self._write(entry, files)
+
+        if channels is None:
+            channels = channel_names
+        indexes = []
+        for channel in channels:
+            if isinstance(channel, (int, numpy.integer)):
+                indexes.append(int(channel))
+            elif channel in channel_names:
+                indexes.append(channel_names.index(channel))
+            else:
+                raise ValueError("Channel '{}' does not exist in the FCS file '{}'. "
+                                 "Available channels are {}.".format(channel, datafile, channel_names))
+        names = [channel_names[i] for i in indexes]
+
+        events = numpy.load(os.path.join(entry, 'data.npy'), mmap_mode='c')
+        if events.dtype.names is not None:
+            return pandas.DataFrame(OrderedDict((name, events[events.dtype.names[i]])
+                                                for name, i in zip(names, indexes)),
+                                    columns=names)
+        if indexes and indexes == list(range(indexes[0], indexes[-1] + 1)):
+            events = events[:, indexes[0]:indexes[-1] + 1]  # A view
+        else:
+            events = events[:, indexes]
+        return pandas.DataFrame(events, columns=names, copy=False)
+
+
+def _get_events_array(parser, num_channels):
+    """
+    Returns the events of the parsed file as a single array (events x channels)
+    in column major order, or as a record array if the channels hold values of different types.
+    """
+    columns = [parser.get_channel_data(i) for i in range(num_channels)]
+    dtypes = [c.dtype for c in columns]
+    num_events = len(columns[0]) if columns else 0
+    if len(set(dtypes)) > 1:
+        events = numpy.empty(num_events, dtype=[(str(i), t) for i, t in enumerate(dtypes)])
+        for i, column in enumerate(columns):
+            events[str(i)] = column
+        return events
+    events = numpy.empty((num_events, num_channels), dtype=dtypes[0] if dtypes else float, order='F')
+    for i, column in enumerate(columns):
+        events[:, i] = column
+    return events
+
+
+#: Cache shared by all measurements in the process (disabled by default).
+disk_cache = DiskCache()
@@ -14,6 +14,11 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import sys, warnings, string, os
+from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError: # python 2
+    from collections import MutableMapping
 import numpy
 
 try:
@@ -34,6 +39,13 @@ def raise_parser_feature_not_implemented(message):
               {0} """.format(message))
     raise NotImplementedError(message)
 
+def _get_column(data, index):
+    """ Returns a view of a single column of a 2d array or of a structured (record) array. """
+    if data.dtype.names:
+        return data[data.dtype.names[index]]
+    else:
+        return data[:, index]
+
 class FCS_Parser(object):
     """
     A Parser for .fcs files.
@@ -52,7 +64,7 @@ class FCS_Parser(object):
         self.channel_names holds the chosen names of the channels
         self.channel_names_alternate holds the alternate names of the channels
     """
-    def __init__(self, path, read_data=True, channel_naming='$PnS'):
+    def __init__(self, path, read_data=True, channel_naming='$PnS', mmap=False, channels=None):
         """
         Parameters
         ----------
@@ -75,9 +87,21 @@ class FCS_Parser(object):
 
             Note: These names are not flipped in the implementation.
             It looks like they were swapped for some reason in the official FCS specification.
+        mmap : bool
+            If True, the DATA segment is memory mapped instead of being read into memory.
+            self.data is then a numpy.memmap that keeps the byte order of the file,
+            and get_channel_data converts individual channels to native byte order
+            on first access.
+        channels : None | iterable of (int | str)
+            If specified, only these channels are read from the DATA segment.
+            (See read_data)
         """
         self._data = None
         self._channel_naming = channel_naming
+        self._mmap = mmap
+        self._channels_to_read = channels
+        self._data_channels = None
+        self._native_channels = {}
 
         self._file_size = os.path.getsize(path)
 
@@ -271,17 +295,19 @@ class FCS_Parser(object):
 
         return channel_names
 
-    def read_data(self, file_handle):
-        """ Reads the DATA segment of the FCS file. """
-        self._check_assumptions()
+    def _get_data_layout(self):
+        """
+        Figures out how events are laid out in the DATA segment.
+
+        Returns
+        -------
+        endian : '<' | '>'
+            Byte order of the values stored in the file.
+        par_numeric_type_list : list of str
+            numpy type string of each of the parameters (channels).
+        """
         text = self.annotation
 
-        if (self._data_start > self._file_size) or (self._data_end > self._file_size):
-            raise ValueError("The FCS file '{}' is corrupted. Part of the data segment is missing.".format(self.path))
-
-        num_events = text['$TOT'] # Number of events recorded
-        num_pars   = text['$PAR'] # Number of parameters recorded
-
         if text['$BYTEORD'].strip() == '1,2,3,4' or text['$BYTEORD'].strip() == '1,2':
             endian = '<'
         elif text['$BYTEORD'].strip() == '4,3,2,1' or text['$BYTEORD'].strip() == '2,1':
@@ -296,40 +322,253 @@ class FCS_Parser(object):
         # Calculations to figure out data types of each of parameters
         bytes_per_par_list   = [text['$P{0}B'.format(i)] // 8  for i in self.channel_numbers] # $PnB specifies the number of bits reserved for a measurement of parameter n
         par_numeric_type_list   = ['{endian}{type}{size}'.format(endian=endian, type=conversion_dict[text['$DATATYPE']], size=bytes_per_par) for bytes_per_par in bytes_per_par_list]
-        bytes_per_event = sum(bytes_per_par_list)
-        total_bytes = bytes_per_event * num_events
+        return endian, par_numeric_type_list
+
+    def _get_data_dtype(self):
+        """
+        Returns the numpy dtype and the shape of the DATA segment (in the byte order of the file).
+        """
+        text = self.annotation
+        num_events = text['$TOT'] # Number of events recorded
+        num_pars   = text['$PAR'] # Number of parameters recorded
 
-        # Parser for list mode. Here, the order is a list of tuples. where each tuples stores event related information
-        file_handle.seek(self._data_start, 0) # Go to the part of the file where data starts
+        endian, par_numeric_type_list = self._get_data_layout()
 
-        ##
-        # Read in the data
         if len(set(par_numeric_type_list)) > 1:
             # values saved in mixed data formats
-            dtype = ','.join(par_numeric_type_list)
-            data = numpy.fromfile(file_handle, dtype=dtype, count=num_events)
-            data.dtype.names = self.get_channel_names()
+            dtype = numpy.dtype(','.join(par_numeric_type_list))
+            dtype.names = self.get_channel_names()
+            shape = (num_events,)
         else:
             # values saved in a single data format
-            dtype = par_numeric_type_list[0]
-            data = numpy.fromfile(file_handle, dtype=dtype, count=num_events * num_pars)
-            data = data.reshape((num_events, num_pars))
+            dtype = numpy.dtype(par_numeric_type_list[0])
+            shape = (num_events, num_pars)
+        return dtype, shape
+
+    def _map_data_segment(self, file_handle):
+        """
+        Memory maps the DATA segment of the FCS file.
+        Nothing is read here. The OS pages in the parts of the file that are actually used.
+        """
+        self._check_assumptions()
+
+        if (self._data_start > self._file_size) or (self._data_end > self._file_size):
+            raise ValueError("The FCS file '{}' is corrupted. Part of the data segment is missing.".format(self.path))
+
+        dtype, shape = self._get_data_dtype()
+        return numpy.memmap(file_handle, dtype=dtype, mode='r',
+                            offset=self._data_start, shape=shape)
+
+    def get_channel_indexes(self, channels):
+        """
+        Converts channel names or positions into channel positions (starting from 0).
+
+        Parameters
+        ----------
+        channels : iterable of (int | str)
+            Channel names (as returned by get_channel_names) or channel positions.
+
+        Returns
+        -------
+        list of int
+        """
+        channel_names = list(self.get_channel_names())
+        indexes = []
+        for channel in channels:
+            if isinstance(channel, (int, numpy.integer)):
+                if not 0 <= channel < len(channel_names):
+                    raise ValueError("Channel position {} is out of range for the FCS file '{}' "
+                                     "which has {} channels.".format(channel, self.path, len(channel_names)))
+                indexes.append(int(channel))
+            elif channel in channel_names:
+                indexes.append(channel_names.index(channel))
+            else:
+                raise ValueError("Channel '{}' does not exist in the FCS file '{}'. "
+                                 "Available channels are {}.".format(channel, self.path, channel_names))
+        return indexes
+
+    def read_data(self, file_handle, channels=None):
+        """
+        Reads the DATA segment of the FCS file.
+
+        Parameters
+        ----------
+        file_handle : file
+            Handle of the opened FCS file.
+        channels : None | iterable of (int | str)
+            If None, all channels are read.
+            Otherwise only the given channels are decoded from the interleaved
+            event records, in the given order. (See get_channel_indexes)
+        """
+        if channels is None:
+            channels = self._channels_to_read
+
+        if channels is not None:
+            self._read_channels(file_handle, self.get_channel_indexes(channels))
+            return
+
+        ##
+        # Read in the data
+        if self._mmap:
+            data = self._map_data_segment(file_handle)
+        else:
+            self._check_assumptions()
+
+            if (self._data_start > self._file_size) or (self._data_end > self._file_size):
+                raise ValueError("The FCS file '{}' is corrupted. Part of the data segment is missing.".format(self.path))
+
+            dtype, shape = self._get_data_dtype()
+
+            # Parser for list mode. Here, the order is a list of tuples. where each tuples stores event related information
+            file_handle.seek(self._data_start, 0) # Go to the part of the file where data starts
+            data = numpy.fromfile(file_handle, dtype=dtype, count=int(numpy.prod(shape)))
+            data = data.reshape(shape)
+
+        self._native_channels = {}
+        self._data_channels = None
+
         ##
         # Convert to native byte order 
         # This is needed for working with pandas datastructures
-        native_code = '<' if (sys.byteorder == 'little') else '>'
-        if endian != native_code:
-            # swaps the actual bytes and also the endianness
-            data = data.byteswap().newbyteorder()
+        # A memory mapped segment is left as is. (see get_channel_data)
+        if not data.dtype.isnative and not self._mmap:
+            # swaps the actual bytes (in place, to avoid a second copy) and also the endianness
+            data = data.byteswap(True).newbyteorder()
 
         self._data = data
 
+    def _decode_channels(self, records, indexes):
+        """
+        Copies the channels at the given positions out of the (raw) event records
+        into a new array in native byte order.
+        """
+        columns = [_get_column(records, i) for i in indexes]
+        native_dtypes = [c.dtype.newbyteorder('=') for c in columns]
+
+        if len(set(native_dtypes)) > 1:
+            channel_names = self.get_channel_names()
+            dtype = [(channel_names[i], t) for i, t in zip(indexes, native_dtypes)]
+            data = numpy.empty(records.shape[0], dtype=dtype)
+            for name, column in zip(data.dtype.names, columns):
+                data[name] = column
+        else:
+            data = numpy.empty((records.shape[0], len(indexes)), dtype=native_dtypes[0])
+            for j, column in enumerate(columns):
+                data[:, j] = column # Byte order is converted on assignment
+        return data
+
+    def _read_channels(self, file_handle, indexes):
+        """
+        Decodes only the channels at the given positions from the DATA segment.
+
+        The event records are memory mapped, and each requested channel is copied
+        from a strided view over the mapped records into a native byte order array.
+        """
+        raw = self._map_data_segment(file_handle)
+        self._native_channels = {}
+        self._data_channels = indexes
+        self._data = self._decode_channels(raw, indexes)
+
+    def iter_chunks(self, chunk_events=100000, channels=None, output_format='DataFrame'):
+        """
+        Iterates over the DATA segment in blocks of consecutive events.
+
+        Only a single block is decoded at a time, so files that are larger than
+        the available memory can be processed. The DATA segment is not stored in self.data.
+
+        Parameters
+        ----------
+        chunk_events : int
+            Maximal number of events in each block.
+        channels : None | iterable of (int | str)
+            If None, all channels are read. Otherwise only the given channels are
+            decoded, in the given order. (See get_channel_indexes)
+        output_format : 'DataFrame' | 'ndarray'
+            Format of the yielded blocks.
+
+        Yields
+        ------
+        Blocks of events in native byte order (DataFrame or ndarray).
+        The index of a DataFrame block holds the positions of the events in the file.
+        """
+        if chunk_events < 1:
+            raise ValueError('chunk_events must be a positive integer.')
+        if output_format not in ('DataFrame', 'ndarray'):
+            raise ValueError("The output_format must be either 'ndarray' or 'DataFrame'")
+        if output_format == 'DataFrame' and pandas_found == False:
+            raise ImportError('You do not have pandas installed.')
+
+        if channels is None:
+            indexes = list(range(self.annotation['$PAR']))
+        else:
+            indexes = self.get_channel_indexes(channels)
+        channel_names = self.get_channel_names()
+        column_names = [channel_names[i] for i in indexes]
+
+        with open(self.path, 'rb') as f:
+            raw = self._map_data_segment(f)
+
+        num_events = raw.shape[0]
+        for start in range(0, num_events, chunk_events):
+            stop = min(start + chunk_events, num_events)
+            data = self._decode_channels(raw[start:stop], indexes)
+            if output_format == 'DataFrame':
+                data = pandas.DataFrame(data, columns=column_names,
+                                        index=numpy.arange(start, stop))
+            yield data
+
+    def get_data_channel_names(self):
+        """
+        Returns the names of the channels held in self.data.
+        These are all the channels unless the data was read for a subset of channels.
+        """
+        channel_names = self.get_channel_names()
+        if self._data_channels is None:
+            return channel_names
+        return tuple(channel_names[i] for i in self._data_channels)
+
+    def get_channel_data(self, channel):
+        """
+        Returns the values of a single channel in native byte order.
+
+        When the DATA segment is memory mapped, the channel is returned as a strided
+        view into the mapped file if the file byte order is native.
+        Otherwise, only this channel is converted (once) and the result is cached.
+
+        Parameters
+        ----------
+        channel : int | str
+            Position of the channel (starting from 0) or its name.
+
+        Returns
+        -------
+        1d ndarray
+        """
+        index = self.get_channel_indexes([channel])[0]
+
+        if index in self._native_channels:
+            return self._native_channels[index]
+
+        data = self.data
+        if self._data_channels is not None:
+            if index not in self._data_channels:
+                raise ValueError("Channel '{}' was not read from the FCS file '{}'.".format(channel, self.path))
+            values = _get_column(data, self._data_channels.index(index))
+        else:
+            values = _get_column(data, index)
+
+        if not values.dtype.isnative:
+            values = values.astype(values.dtype.newbyteorder('='))
+            self._native_channels[index] = values
+
+        return values
+
     @property
     def data(self):
         """ Holds the parsed DATA segment of the FCS file. """
         if self._data is None:
             with open(self.path, 'rb') as f:
-                self.read_data()
+                self.read_data(f)
         return self._data
 
     @property
@@ -340,9 +579,15 @@ class FCS_Parser(object):
                 self.read_analysis()
         return self._analysis
 
-    def reformat_meta(self):
+    def reformat_meta(self, lazy=False):
         """ Collects the meta data information in a more user friendly format.
         Function looks through the meta data, collecting the channel related information into a dataframe and moving it into the _channels_ key
+
+        Parameters
+        ----------
+        lazy : bool
+            If True, the _channels_ DataFrame is only built when it is first accessed.
+            (self.annotation is replaced by a LazyMeta dictionary.)
         """
         meta = self.annotation # For shorthand (passed by reference)
         channel_properties = []
@@ -362,19 +607,84 @@ class FCS_Parser(object):
                 if key in meta:
                     meta.pop(key)
 
-        num_channels = meta['$PAR']
         column_names = ['$Pn{0}'.format(p) for p in channel_properties]
 
-        df = pandas.DataFrame(channel_matrix, columns=column_names, index=(1+numpy.arange(num_channels)))
+        if lazy:
+            meta = LazyMeta(meta, channel_matrix, column_names)
+            self.annotation = meta
+        else:
+            meta['_channels_'] = _make_channels_frame(channel_matrix, column_names)
+        meta['_channel_names_'] = self.get_channel_names()
 
-        if '$PnE' in column_names:
-            df['$PnE'] = df['$PnE'].apply(lambda x : x.split(','))
+def _make_channels_frame(channel_matrix, column_names):
+    """ Creates the DataFrame that holds the channel properties (the _channels_ meta data key). """
+    num_channels = len(channel_matrix)
+    df = pandas.DataFrame(channel_matrix, columns=column_names, index=(1+numpy.arange(num_channels)))
 
-        df.index.name = 'Channel Number'
-        meta['_channels_'] = df
-        meta['_channel_names_'] = self.get_channel_names()
+    if '$PnE' in column_names:
+        df['$PnE'] = df['$PnE'].apply(lambda x : x.split(','))
+
+    df.index.name = 'Channel Number'
+    return df
+
+class LazyMeta(MutableMapping):
+    """
+    A dictionary holding the parsed TEXT segment, in which the '_channels_' DataFrame
+    is only built when it is needed.
+
+    Building a DataFrame of the channel properties is the most expensive step
+    of parsing the TEXT segment. It is not needed for most of the files
+    in a collection (e.g., when only reading IDs or a few keywords).
+    Looking up other keys does not build it, while listing the keys
+    (keys, items, iteration, len, copy, etc.) does, so that the dictionary
+    always holds the same keys as the meta data reformatted with lazy=False.
+    """
+    def __init__(self, text, channel_matrix, column_names):
+        self._text = dict(text)
+        self._channel_matrix = channel_matrix
+        self._column_names = column_names
+
+    def _get_text(self):
+        """ Returns the TEXT segment, building the '_channels_' DataFrame if it was not built. """
+        if self._channel_matrix is not None:
+            self._text['_channels_'] = _make_channels_frame(self._channel_matrix, self._column_names)
+            self._channel_matrix = None
+        return self._text
+
+    def __getitem__(self, key):
+        if key == '_channels_':
+            return self._get_text()[key]
+        return self._text[key]
+
+    def __setitem__(self, key, value):
+        if key == '_channels_':
+            self._channel_matrix = None
+        self._text[key] = value
+
+    def __delitem__(self, key):
+        if key == '_channels_' and self._channel_matrix is not None:
+            self._channel_matrix = None
+        else:
+            del self._text[key]
 
-def parse_fcs(path, meta_data_only=False, output_format='DataFrame', compensate=False, channel_naming='$PnS', reformat_meta=False):
+    def __contains__(self, key):
+        return key in self._text or (key == '_channels_' and self._channel_matrix is not None)
+
+    def __iter__(self):
+        return iter(self._get_text())
+
+    def __len__(self):
+        return len(self._get_text())
+
+    def __repr__(self):
+        return repr(self._get_text())
+
+    def copy(self):
+        """ Returns a dict holding the meta data. """
+        return dict(self._get_text())
+
+def parse_fcs(path, meta_data_only=False, output_format='DataFrame', compensate=False, channel_naming='$PnS', reformat_meta=False,
+              mmap=False, channels=None):
     """
     Parse an fcs file at the location specified by the path.
 
@@ -398,9 +708,19 @@ def parse_fcs(path, meta_data_only=False, output_format='DataFrame', compensate=
         Note: These names are not flipped in the implementation.
         It looks like they were swapped for some reason in the official FCS specification.
 
-    reformat_meta : bool
+    reformat_meta : bool | 'lazy'
         If true, the meta data is reformatted with the channel information organized into a DataFrame an moved
         into the '_channels_' key
+        If 'lazy', the '_channels_' DataFrame is only created when it is first accessed.
+        (This is much faster when reading the meta data of many files.)
+    mmap : bool
+        If True, the DATA segment is memory mapped rather than read into memory.
+        With output_format='ndarray' the returned array is a numpy.memmap in the byte order of the file.
+        With output_format='DataFrame' the DataFrame is backed by the mapped file when the
+        file byte order is native; otherwise each channel is converted to native byte order.
+    channels : None | iterable of (int | str)
+        If specified, only these channels are decoded from the DATA segment (in the given order).
+        Channels are given by name (see channel_naming) or by position (starting from 0).
 
     Returns
     -------
@@ -424,10 +744,11 @@ def parse_fcs(path, meta_data_only=False, output_format='DataFrame', compensate=
 
     read_data = not meta_data_only
 
-    parsed_FCS = FCS_Parser(path, read_data=read_data, channel_naming=channel_naming)
+    parsed_FCS = FCS_Parser(path, read_data=read_data, channel_naming=channel_naming, mmap=mmap,
+                            channels=channels)
 
     if reformat_meta:
-        parsed_FCS.reformat_meta()
+        parsed_FCS.reformat_meta(lazy=(reformat_meta == 'lazy'))
 
     meta = parsed_FCS.annotation
 
@@ -438,8 +759,13 @@ def parse_fcs(path, meta_data_only=False, output_format='DataFrame', compensate=
         if pandas_found == False:
             raise ImportError('You do not have pandas installed.')
         data = parsed_FCS.data
-        channel_names = parsed_FCS.get_channel_names()
-        data = pandas.DataFrame(data, columns=channel_names)
+        channel_names = parsed_FCS.get_data_channel_names()
+        if mmap and (data.dtype.names or not data.dtype.isnative):
+            columns = [parsed_FCS.get_channel_data(name) for name in channel_names]
+            data = pandas.DataFrame(OrderedDict(enumerate(columns)))
+            data.columns = channel_names
+        else:
+            data = pandas.DataFrame(data, columns=channel_names)
         return meta, data
     elif output_format == 'ndarray':
         """ Constructs numpy matrix """
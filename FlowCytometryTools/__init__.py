@@ -7,7 +7,8 @@ import os
 from fcsparser.api import parse as parse_fcs
 
 from FlowCytometryTools.core.containers import FCMeasurement, FCCollection, FCOrderedCollection, FCPlate
-from FlowCytometryTools.core.gates import ThresholdGate, IntervalGate, QuadGate, PolyGate
+from FlowCytometryTools.core.gates import ThresholdGate, IntervalGate, QuadGate, PolyGate, EllipseGate, RectangleGate, GateSet
+from FlowCytometryTools.core.gating_tree import GatingTree
 import FlowCytometryTools.core.graph as graph
 from FlowCytometryTools.core.graph import plotFCM
 
@@ -13,6 +13,20 @@ factory methods for construction from files.
 using shelve|PyTables|pandas HDFStore
 '''
 import os, inspect, decorator
+import hashlib
+import multiprocessing
+from multiprocessing.pool import Pool, ThreadPool
+import pickle
+import sys
+import threading
+import weakref
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # python 2 without the futures backport
+    ProcessPoolExecutor = None
+from collections import OrderedDict
+from copy import copy, deepcopy
+from itertools import groupby
 import pylab as pl
 from pandas import DataFrame as DF
 from numpy import nan, unravel_index
@@ -63,6 +77,121 @@ def _assign_IDS_to_datafiles(datafiles, parser, measurement_class=None, **kwargs
     return d
 
 
+def _map_jobs(func, items, executor='serial', n_jobs=None):
+    """
+    Apply func to each of the items, possibly concurrently.
+
+    Parameters
+    ----------
+    func : callable
+        Must be picklable (i.e., defined at module level) when executor='processes'.
+    items : iterable
+    executor : ['serial' | 'threads' | 'processes' | object with a map method]
+        * 'serial' : apply func to the items one at a time.
+        * 'threads' : use a pool of threads.
+        * 'processes' : use a pool of processes.
+        * object with a map method : e.g., an existing multiprocessing Pool.
+    n_jobs : int | None
+        Number of workers. If None, the number of CPUs is used.
+
+    Returns
+    -------
+    List of results, in the same order as the items.
+    """
+    items = list(items)
+    if hasattr(executor, 'map'):
+        return list(executor.map(func, items))
+    if executor not in ('serial', 'threads', 'processes'):
+        raise ValueError('Encountered unsupported value "%s" for executor parameter.' % executor)
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be a positive integer or None.')
+    if executor == 'serial' or n_jobs == 1 or len(items) <= 1:
+        return [func(x) for x in items]
+
+    n_jobs = min(n_jobs, len(items))
+    if executor == 'threads':
+        pool = ThreadPool(n_jobs)
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+    try:
+        result = pool.map(func, items)
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return result
+
+
+def _uses_processes(executor):
+    """
+    Returns True if the executor (see _map_jobs) applies func in other processes,
+    i.e., 'processes' or an existing pool of processes.
+    """
+    if isinstance(executor, ThreadPool):  # A subclass of Pool
+        return False
+    return executor == 'processes' or isinstance(executor, Pool) or (
+        ProcessPoolExecutor is not None and isinstance(executor, ProcessPoolExecutor))
+
+
+class _MethodCaller(object):
+    """
+    Calls the named method of its argument with the given arguments.
+    Same as operator.methodcaller, but can be pickled (for use with a pool of processes).
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, obj):
+        return getattr(obj, self.name)(*self.args, **self.kwargs)
+
+
+class _WorkerCaller(object):
+    """
+    Rebuilds the measurements sent to a worker process (see Measurement._get_worker_payload)
+    before calling func with them. Can be pickled.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, measurement):
+        return self.func(measurement._from_worker_payload())
+
+
+def _load_measurement(args):
+    """
+    Create a measurement from a datafile.
+    Errors are re-raised as an IOError that contains the path of the datafile.
+    Defined at module level, so that it can be used with a pool of processes.
+    """
+    measurement_class, ID, datafile, kwargs = args
+    try:
+        return measurement_class(ID, datafile=datafile, **kwargs)
+    except Exception as e:
+        msg = 'Error occurred while trying to parse file: %s\n%s: %s' % (datafile, type(e).__name__, e)
+        raise IOError(msg)
+
+
+def _load_measurements(measurement_class, id_to_datafile, readdata=False,
+                       readdata_kwargs={}, readmeta_kwargs={}, n_jobs=1, executor='threads'):
+    """
+    Create the measurements for a mapping of ID:datafile, reading the files concurrently
+    if requested. Measurements are returned in the iteration order of the mapping.
+    """
+    kwargs = dict(readdata=readdata, readdata_kwargs=readdata_kwargs,
+                  readmeta_kwargs=readmeta_kwargs)
+    jobs = [(measurement_class, ID, dfile, kwargs) for ID, dfile in id_to_datafile.items()]
+    return _map_jobs(_load_measurement, jobs, executor=executor, n_jobs=n_jobs)
+
+
 def int2letters(x, alphabet):
     """
     Return the alphabet representation of a non-negative integer x.
@@ -103,11 +232,13 @@ def queueable(fun, *args, **kwargs):
     params.update(kws)
     if params[_now]:
         out = fun(*args, **kwargs)
+        source = params.pop('self')  # Recorded as in the queue, so that the history can be replayed
         out.queue = []
         out.history.append((f_name, params))
+        out._data_from_file = source._data is None or source._data_from_file
         return out
     else:
-        new = params['self'].copy()
+        new = params['self']._copy_sharing_data()
         del params['self']
         params[_now] = True
 
@@ -115,6 +246,178 @@ def queueable(fun, *args, **kwargs):
         return new
 
 
+def _nbytes(value):
+    """ Estimates the memory (in bytes) held by a value. """
+    if hasattr(value, 'memory_usage'):  # DataFrame
+        return int(value.memory_usage(index=True).sum())
+    elif hasattr(value, 'nbytes'):  # ndarray
+        return int(value.nbytes)
+    else:
+        return sys.getsizeof(value)
+
+
+class DataCache(object):
+    """
+    A least recently used (LRU) cache of measurement data with a memory budget.
+
+    A single instance (data_cache) is shared by all measurements in the process.
+    It is used by Measurement.get_data for data that is read from a datafile
+    (possibly with queued actions applied), so that collections larger than the
+    available memory can be analysed without reading each file over and over again.
+
+    The cache is disabled by default. Enable it by setting a memory budget:
+
+    >>> from FlowCytometryTools.core.bases import data_cache
+    >>> data_cache.resize(2 * 1024 ** 3) # 2 GB
+
+    .. warning::
+        Data returned from the cache is shared. Do not modify it in place.
+    """
+
+    def __init__(self, max_bytes=0):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Memory budget in bytes. 0 disables the cache.
+        """
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """ Returns the cached value (or None), marking it as the most recently used. """
+        with self._lock:
+            try:
+                value, nbytes = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = (value, nbytes)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores the value, evicting the least recently used values to stay within the budget.
+        Values larger than the whole budget are not stored.
+        """
+        if value is None:
+            return
+        nbytes = _nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            key, (value, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """ Sets the memory budget (in bytes), evicting values if needed. 0 disables the cache. """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """ Removes all values and resets the counters. """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def stats(self):
+        """ A dictionary with the hit, miss and eviction counters and the memory in use. """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+
+#: Data cache shared by all measurements in the process (disabled by default).
+data_cache = DataCache()
+
+
+def _reference(value):
+    """ Returns a weak reference to the value (or a strong one if it does not support weak references). """
+    if value is None:
+        return None
+    try:
+        return weakref.ref(value)
+    except TypeError:
+        return lambda: value
+
+
+def _pickled(value):
+    """ Returns the pickled value, or a new object (equal to nothing else) if it cannot be pickled. """
+    try:
+        return pickle.dumps(value, 2)
+    except Exception:
+        return object()
+
+
+class _DataSignature(object):
+    """
+    Identifies the data of a measurement, for caches of values computed from the data
+    (see Measurement._get_data_signature).
+
+    Two signatures are equal if they refer to the same data objects (self._data and self._rows),
+    datafile, read options and queued actions. The data objects are held by weak references,
+    so a signature is never equal to the signature of data created after its data was released
+    (unlike the ids of the objects, which can be reused).
+    Signatures are not equal to anything once pickled.
+    """
+
+    def __init__(self, measurement):
+        objects = (measurement._data, measurement._rows)
+        self._refs = tuple(_reference(v) for v in objects)
+        self._key = (tuple(id(v) for v in objects), measurement.datafile,
+                     _pickled(measurement.readdata_kwargs), _pickled(measurement.queue))
+
+    def _is_alive(self):
+        return self._refs is not None and all(r is None or r() is not None for r in self._refs)
+
+    def __eq__(self, other):
+        # Objects that are alive at the same time have different ids
+        return (isinstance(other, _DataSignature) and self._key == other._key and
+                self._is_alive() and other._is_alive())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        return {'_key': self._key, '_refs': None}
+
+
 class BaseObject(object):
     '''
     Object providing common utility methods.
@@ -163,6 +466,15 @@ class Measurement(BaseObject):
     a single well or a single tube.
     '''
 
+    #: Positions (in self._data) of the events that belong to the measurement,
+    #: for measurements that are views of the data of another measurement.
+    #: None if all the events of self._data belong to the measurement.
+    _rows = None
+
+    #: True if self._data was read from the datafile and then modified only by the actions
+    #: in the history, so that it can be rebuilt by replaying them (see _get_worker_payload).
+    _data_from_file = False
+
     def __init__(self, ID,
                  datafile=None, readdata=False, readdata_kwargs={},
                  metafile=None, readmeta=True, readmeta_kwargs={}):
@@ -173,11 +485,57 @@ class Measurement(BaseObject):
         self._meta = None
         self.readdata_kwargs = readdata_kwargs
         self.readmeta_kwargs = readmeta_kwargs
-        if readdata: self.set_data()
-        if readmeta: self.set_meta()
         self.position = {}
         self.history = []
         self.queue = []
+        if readdata: self.set_data()
+        if readmeta: self.set_meta()
+
+    def _copy_sharing_data(self):
+        '''
+        Copies the measurement, except for the data (and the positions of the events
+        of views, see _rows) which is shared with the copy.
+
+        Used by the methods that derive new measurements (gate, transform, subsample,
+        apply_queued), which never modify the data in place, so that gating a measurement
+        several times does not copy the events each time.
+        Unlike copy, the data of the returned measurement must not be modified in place.
+        '''
+        memo = {id(self._data): self._data, id(self._rows): self._rows}
+        return deepcopy(self, memo)
+
+    def _get_data_signature(self):
+        '''
+        Returns a value that changes when the data of the measurement is replaced,
+        or when actions are queued (see _DataSignature). Used to invalidate cached values
+        computed from the data.
+        '''
+        return _DataSignature(self)
+
+    def _get_worker_payload(self):
+        '''
+        Returns the measurement to send to a worker process.
+        If the data can be rebuilt from the datafile (see _data_from_file), it is left out,
+        and the worker reads the datafile and replays the history instead
+        (see _from_worker_payload), so that the events are not pickled.
+        '''
+        if self._data is None or not self._data_from_file or self.datafile is None:
+            return self
+        payload = copy(self)
+        payload._data = None
+        payload._rows = None
+        payload._replay_history = True
+        return payload
+
+    def _from_worker_payload(self):
+        ''' Rebuilds the data of a measurement returned by _get_worker_payload. '''
+        if not self.__dict__.pop('_replay_history', False):
+            return self
+        queue = self.queue
+        self.queue, self.history = self.history, []
+        new = self.apply_queued()
+        new.queue = queue
+        return new
 
     def _set_position(self, orderedcollection_id, pos):
         self.position[orderedcollection_id] = pos
@@ -189,11 +547,35 @@ class Measurement(BaseObject):
         else:
             return self.data.shape
 
+    #: Names of queueable actions that derived classes can apply
+    #: in a single pass over the data (see _apply_fused).
+    _fusable_actions = ()
+
     def apply_queued(self):
-        new = self.copy()
+        '''
+        Applies the queued actions, returning a new measurement.
+        Consecutive actions that can be fused (see _fusable_actions) are applied together
+        in a single pass over the data.
+        '''
+        new = self._copy_sharing_data()
         new.queue = []
-        for a in self.queue:
-            name, params = a
+        for fusable, actions in groupby(self.queue, lambda a: a[0] in self._fusable_actions):
+            if fusable:
+                new = new._apply_fused(list(actions))
+            else:
+                new = Measurement._apply_fused(new, list(actions))
+        new._data_from_file = self._data is None or self._data_from_file
+        return new
+
+    def _apply_fused(self, actions):
+        '''
+        Applies the actions (a list of (name, params) tuples, as held in the queue)
+        in a single pass over the data, returning a new measurement.
+        Derived classes that declare fusable actions should override it;
+        by default, the actions are applied one at a time.
+        '''
+        new = self
+        for name, params in actions:
             new = getattr(new, name)(**params)
         return new
 
@@ -245,7 +627,11 @@ class Measurement(BaseObject):
         '''
         if data is None:
             data = self.get_data(**kwargs)
+            self._data_from_file = self._data is None or self._data_from_file
+        else:
+            self._data_from_file = False
         setattr(self, '_data', data)
+        self._rows = None
         self.history += self.queue
         self.queue = []
 
@@ -279,16 +665,42 @@ class Measurement(BaseObject):
             value = getattr(self, 'read_%s' % name)(**parser_kwargs)
         return value
 
+    def _data_cache_key(self):
+        '''
+        Key of the data of this measurement in the data cache.
+        None if the data cannot be cached: the cache is disabled,
+        the data is held in memory or the queued actions cannot be pickled.
+        '''
+        if not data_cache.enabled or self._data is not None or self.datafile is None:
+            return None
+        try:
+            mtime = os.path.getmtime(self.datafile)
+            actions = pickle.dumps((self.readdata_kwargs, self.history, self.queue), 2)
+        except Exception:
+            return None
+        return (type(self), os.path.abspath(self.datafile), mtime, hashlib.md5(actions).hexdigest())
+
     def get_data(self, **kwargs):
         '''
         Get the measurement data.
         If data is not set, read from 'self.datafile' using 'self.read_data'.
+        When the data cache is enabled (see DataCache), data read from file is cached.
         '''
+        key = self._data_cache_key()
+        if key is not None:
+            data = data_cache.get(key)
+            if data is not None:
+                return data
         if self.queue:
             new = self.apply_queued()
-            return new.get_data()
+            data = new.get_data()
         else:
-            return self._get_attr_from_file('data', **kwargs)
+            data = self._get_attr_from_file('data', **kwargs)
+            if self._rows is not None:
+                data = data.iloc[self._rows]
+        if key is not None:
+            data_cache.put(key, data)
+        return data
 
     def get_meta(self, **kwargs):
         '''
@@ -341,14 +753,13 @@ class Measurement(BaseObject):
         """
         applyto = applyto.lower()
         if applyto == 'data':
-            if self.data is not None:
-                data = self.data
-            elif self.datafile is None:
+            if self._data is None and self.datafile is None:
                 return noneval
-            else:
-                data = self.read_data()
-                if setdata:
-                    self.data = data
+            data = self.get_data()
+            if data is None:
+                return noneval
+            if setdata and self._data is None:
+                self.set_data(data=data)
             return func(data)
         elif applyto == 'measurement':
             return func(self)
@@ -391,7 +802,8 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
 
     @classmethod
     @doc_replacer
-    def from_files(cls, ID, datafiles, parser, readdata_kwargs={}, readmeta_kwargs={}, **ID_kwargs):
+    def from_files(cls, ID, datafiles, parser, readdata_kwargs={}, readmeta_kwargs={},
+                   readdata=False, n_jobs=1, executor='threads', **ID_kwargs):
         """
         Create a Collection of measurements from a set of data files.
 
@@ -400,24 +812,21 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
         {_bases_ID}
         {_bases_data_files}
         {_bases_filename_parser}
+        {_bases_parallel_loading}
         {_bases_ID_kwargs}
         """
         d = _assign_IDS_to_datafiles(datafiles, parser, cls._measurement_class, **ID_kwargs)
-        measurements = []
-        for sID, dfile in d.iteritems():
-            try:
-                measurements.append(cls._measurement_class(sID, datafile=dfile,
-                                                           readdata_kwargs=readdata_kwargs,
-                                                           readmeta_kwargs=readmeta_kwargs))
-            except:
-                msg = 'Error occurred while trying to parse file: %s' % dfile
-                raise IOError(msg)
+        measurements = _load_measurements(cls._measurement_class, d, readdata=readdata,
+                                          readdata_kwargs=readdata_kwargs,
+                                          readmeta_kwargs=readmeta_kwargs,
+                                          n_jobs=n_jobs, executor=executor)
         return cls(ID, measurements)
 
     @classmethod
     @doc_replacer
     def from_dir(cls, ID, datadir, parser, pattern='*.fcs', recursive=False,
-                 readdata_kwargs={}, readmeta_kwargs={}, **ID_kwargs):
+                 readdata_kwargs={}, readmeta_kwargs={},
+                 readdata=False, n_jobs=1, executor='threads', **ID_kwargs):
         """
         Create a Collection of measurements from data files contained in a directory.
 
@@ -432,11 +841,13 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
         recursive : bool
             Recursively look for files matching pattern in subdirectories.
         {_bases_filename_parser}
+        {_bases_parallel_loading}
         {_bases_ID_kwargs}
         """
         datafiles = get_files(datadir, pattern, recursive)
         return cls.from_files(ID, datafiles, parser,
                               readdata_kwargs=readdata_kwargs, readmeta_kwargs=readmeta_kwargs,
+                              readdata=readdata, n_jobs=n_jobs, executor=executor,
                               **ID_kwargs)
 
     # ----------------------
@@ -465,11 +876,24 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
     def __len__(self):
         return len(self.data)
 
+    def _copy_sharing_data(self):
+        '''
+        Copies the collection, sharing the data of the measurements with the copy
+        (see Measurement._copy_sharing_data).
+        '''
+        memo = {}
+        for measurement in self.values():
+            memo[id(measurement._data)] = measurement._data
+            memo[id(measurement._rows)] = measurement._rows
+        return deepcopy(self, memo)
+
     # ----------------------
     # User methods
     # ----------------------
+    @doc_replacer
     def apply(self, func, ids=None, applyto='measurement', noneval=nan,
               setdata=False, output_format='dict', ID=None,
+              executor='serial', n_jobs=None,
               **kwargs):
         '''
         Apply func to each of the specified measurements.
@@ -493,6 +917,8 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
             * collection : keeps result as collection
             WARNING: For collection, func should return a copy of the measurement instance rather
             than the original measurement instance.
+        {_bases_executor}
+
         Returns
         -------
         Dictionary keyed by measurement keys containing the corresponding output of func
@@ -502,7 +928,18 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
             ids = self.keys()
         else:
             ids = to_list(ids)
-        result = dict((i, self[i].apply(func, applyto, noneval, setdata)) for i in ids)
+        uses_processes = _uses_processes(executor)
+        if setdata and uses_processes:
+            raise ValueError('setdata cannot be used with a pool of processes, '
+                             'since the data would only be set in the worker processes.')
+        apply_func = _MethodCaller('apply', func, applyto, noneval, setdata)
+        measurements = [self[i] for i in ids]
+        if uses_processes:
+            # Workers rebuild the data from the datafiles when possible, rather than receiving it
+            measurements = [m._get_worker_payload() for m in measurements]
+            apply_func = _WorkerCaller(apply_func)
+        outputs = _map_jobs(apply_func, measurements, executor=executor, n_jobs=n_jobs)
+        result = dict(zip(ids, outputs))
 
         if output_format == 'collection':
             can_keep_as_collection = all(
@@ -512,7 +949,8 @@ class MeasurementCollection(collections.MutableMapping, BaseObject):
                     'Cannot turn output into a collection. The provided func must return results of type {}'.format(
                         self._measurement_class))
 
-            new_collection = self.copy()
+            # The measurements are replaced by the results, so their data is not copied
+            new_collection = self._copy_sharing_data()
             # Locate IDs to remove
             ids_to_remove = [x for x in self.keys() if x not in ids]
             # Remove data for these IDs
@@ -745,7 +1183,8 @@ class OrderedCollection(MeasurementCollection):
     @doc_replacer
     def from_files(cls, ID, datafiles, parser='name',
                    position_mapper=None,
-                   readdata_kwargs={}, readmeta_kwargs={}, ID_kwargs={}, **kwargs):
+                   readdata_kwargs={}, readmeta_kwargs={}, ID_kwargs={},
+                   readdata=False, n_jobs=1, executor='threads', **kwargs):
         """
         Create an OrderedCollection of measurements from a set of data files.
 
@@ -756,6 +1195,7 @@ class OrderedCollection(MeasurementCollection):
         {_bases_filename_parser}
         {_bases_position_mapper}
         {_bases_ID_kwargs}
+        {_bases_parallel_loading}
         kwargs : dict
             Additional key word arguments to be passed to constructor.
         """
@@ -766,15 +1206,10 @@ class OrderedCollection(MeasurementCollection):
                 msg = "When using a custom parser, you must specify the position_mapper keyword."
                 raise ValueError(msg)
         d = _assign_IDS_to_datafiles(datafiles, parser, cls._measurement_class, **ID_kwargs)
-        measurements = []
-        for sID, dfile in d.iteritems():
-            try:
-                measurements.append(cls._measurement_class(sID, datafile=dfile,
-                                                           readdata_kwargs=readdata_kwargs,
-                                                           readmeta_kwargs=readmeta_kwargs))
-            except:
-                msg = 'Error occured while trying to parse file: %s' % dfile
-                raise IOError(msg)
+        measurements = _load_measurements(cls._measurement_class, d, readdata=readdata,
+                                          readdata_kwargs=readdata_kwargs,
+                                          readmeta_kwargs=readmeta_kwargs,
+                                          n_jobs=n_jobs, executor=executor)
         return cls(ID, measurements, position_mapper, **kwargs)
 
     @classmethod
@@ -782,7 +1217,8 @@ class OrderedCollection(MeasurementCollection):
     def from_dir(cls, ID, path,
                  parser='name',
                  position_mapper=None, pattern='*.fcs', recursive=False,
-                 readdata_kwargs={}, readmeta_kwargs={}, ID_kwargs={}, **kwargs):
+                 readdata_kwargs={}, readmeta_kwargs={}, ID_kwargs={},
+                 readdata=False, n_jobs=1, executor='threads', **kwargs):
         """
         Create a Collection of measurements from data files contained in a directory.
 
@@ -798,13 +1234,15 @@ class OrderedCollection(MeasurementCollection):
         {_bases_filename_parser}
         {_bases_position_mapper}
         {_bases_ID_kwargs}
+        {_bases_parallel_loading}
         kwargs : dict
             Additional key word arguments to be passed to constructor.
         """
         datafiles = get_files(path, pattern, recursive)
         return cls.from_files(ID, datafiles, parser=parser, position_mapper=position_mapper,
                               readdata_kwargs=readdata_kwargs, readmeta_kwargs=readmeta_kwargs,
-                              ID_kwargs=ID_kwargs, **kwargs)
+                              ID_kwargs=ID_kwargs,
+                              readdata=readdata, n_jobs=n_jobs, executor=executor, **kwargs)
 
     def set_labels(self, labels, axis='rows'):
         '''
@@ -956,9 +1394,11 @@ class OrderedCollection(MeasurementCollection):
     def shape(self):
         return (len(self.row_labels), len(self.col_labels))
 
+    @doc_replacer
     def apply(self, func, ids=None, applyto='measurement',
               output_format='DataFrame', noneval=nan,
-              setdata=False, dropna=False, ID=None):
+              setdata=False, dropna=False, ID=None,
+              executor='serial', n_jobs=None):
         """
         Apply func to each of the specified measurements.
 
@@ -984,6 +1424,7 @@ class OrderedCollection(MeasurementCollection):
             ID is used as the new ID for the collection.
             If None, then the old ID is retained.
             Note: Only applicable when output is a collection.
+        {_bases_executor}
 
         Returns
         -------
@@ -992,7 +1433,8 @@ class OrderedCollection(MeasurementCollection):
         _output = 'collection' if output_format == 'collection' else 'dict'
         result = super(OrderedCollection, self).apply(func, ids, applyto,
                                                       noneval, setdata,
-                                                      output_format=_output)
+                                                      output_format=_output, ID=ID,
+                                                      executor=executor, n_jobs=n_jobs)
 
         # Note: result should be of type dict or collection for the code
         # below to work
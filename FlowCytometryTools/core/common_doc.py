@@ -53,9 +53,43 @@ ID_kwargs: dict
     Additional parameters to be used when assigning IDs.
     Passed to '_assign_IDS_to_datafiles' method.""",
 
+_bases_parallel_loading="""\
+readdata : bool
+    If True, the data of each measurement is read into memory
+    when the collection is created.
+n_jobs : int | None
+    Number of files to read concurrently.
+    If None, the number of CPUs is used.
+executor : ['threads' | 'processes' | object with a map method]
+    How to read the files concurrently (only used when n_jobs is not 1).
+
+    * 'threads' : use a pool of threads.
+    * 'processes' : use a pool of processes.
+    * object with a map method : e.g., an existing multiprocessing Pool.""",
+
+_bases_executor="""\
+executor : ['serial' | 'threads' | 'processes' | object with a map method]
+    Specifies how the measurements are processed.
+
+    * 'serial' : one measurement at a time.
+    * 'threads' : use a pool of threads.
+    * 'processes' : use a pool of processes. The function must be picklable
+      (e.g., defined at module level, not a lambda).
+      Measurements are sent to the workers as the path of the datafile together
+      with the actions applied to the data (history) and the queued actions,
+      and the workers read the data. Only measurements whose data cannot be rebuilt
+      from the datafile (e.g., data set by the user) are sent with their data.
+    * object with a map method : e.g., an existing multiprocessing Pool.
+      A pool of processes (multiprocessing.Pool or concurrent.futures.ProcessPoolExecutor)
+      is used as with 'processes'.
+n_jobs : int | None
+    Number of workers (ignored when executor is 'serial').
+    If None, the number of CPUs is used.""",
+
 _gate_available_classes="""\
 [:class:`~FlowCytometryTools.ThresholdGate` | :class:`~FlowCytometryTools.IntervalGate` | \
 :class:`~FlowCytometryTools.QuadGate` | :class:`~FlowCytometryTools.PolyGate` | \
+:class:`~FlowCytometryTools.EllipseGate` | :class:`~FlowCytometryTools.RectangleGate` | \
 :class:`~FlowCytometryTools.core.gates.CompositeGate`]
 """,
 
@@ -92,6 +126,10 @@ auto_range : bool
 use_spln : bool
     If True th transform is done using a spline.
     See Transformation.transform for more details.
+use_lut : bool
+    If True and the data holds integers ($DATATYPE = 'I'), the transform is computed once
+    for each of the $PnR possible values and applied using a lookup table.
+    (The lookup table holds the exact transformed values, so no spline is used in this case.)
 get_transformer : bool
     If True the transformer is returned in addition to the new Measurement.
 args :
@@ -134,7 +172,17 @@ auto_resize : [False | True]
     For example, if there are only 1000 events in the fcs sample,
     but the key is set to subsample 2000 events, then an error will be raised.
     However, with auto_resize set to True, the key will be adjusted
-    to 1000 events.""",
+    to 1000 events.
+seed : int | None
+    Seed of the random sampling (order='random'), for reproducible samples.
+    If None, the sample is different each time.
+sort : [False | True]
+    If True, randomly sampled events keep their order in the data.
+    Otherwise, they are in random order.
+stream : [False | True]
+    If True, the events are sampled (order='random' only) in a single pass
+    over blocks of events read from the file (see iter_data), using reservoir
+    sampling, so that the data is never all held in memory.""",
 
 graph_plotFCM_pars = """\
 channel_names : [str | iterable of str]
@@ -164,6 +212,12 @@ bins : int | ndarray | [ndarray]
     according to minimum and maximum values of data from across all the
     FCMeasurements. If this is confusing for you, just specify the
     bin locations explicitely.
+max_points : None | int
+    Maximal number of events drawn in scatter plots (None for all the events).
+    The events are subsampled so that the density of the events is preserved
+    (see graph.stratified_sample).
+seed : None | int
+    Seed of the subsampling (used with max_points), so that plots are reproducible.
     """,
 
 common_plot_ax="""\
@@ -1,21 +1,24 @@
 from __future__ import absolute_import
 
 import collections
+import hashlib
 import inspect
 from itertools import cycle
-from random import sample
 import warnings
 
-from fcsparser import parse as parse_fcs
 from pandas import DataFrame
 import numpy as np
 import matplotlib
 
 from GoreUtilities.util import to_list as to_iter
-from GoreUtilities.graph import plot_ndpanel
-
-from FlowCytometryTools.core.transforms import Transformation
-from FlowCytometryTools.core.bases import Measurement, MeasurementCollection, OrderedCollection, queueable
+from GoreUtilities.graph import plot_ndpanel, scale_subplots
+
+from FlowCytometryTools.IO.fcsreader import FCS_Parser, parse_fcs
+from FlowCytometryTools.IO.cache import disk_cache
+from FlowCytometryTools.core.transforms import Transformation, _max_lut_size
+from FlowCytometryTools.core.gates import _get_gate_channels
+from FlowCytometryTools.core.bases import (Measurement, MeasurementCollection, OrderedCollection,
+                                           queueable, data_cache, _MethodCaller)
 import FlowCytometryTools.core.graph as graph
 from FlowCytometryTools.core.common_doc import doc_replacer
 
@@ -29,12 +32,21 @@ def to_list(obj):
     return obj
 
 
+# Number of histograms cached by each measurement (see FCMeasurement.histogram)
+_max_cached_histograms = 16
+
+
 class FCMeasurement(Measurement):
     """
     A class for holding flow cytometry data from
     a single well or a single tube.
     """
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_histograms', None)  # Cached histograms are not copied or pickled
+        return state
+
     @property
     def channels(self):
         """ A DataFrame containing complete channel information """
@@ -55,10 +67,104 @@ class FCMeasurement(Measurement):
 
         It's advised not to use this method, but instead to access
         the data through the FCMeasurement.data attribute.
+
+        The keyword arguments (FCMeasurement.readdata_kwargs) are passed to the parser.
+        For example, readdata_kwargs={'channels': ['FSC-A', 'SSC-A']} reads
+        only the listed channels from the file.
+
+        If the disk cache is enabled (FlowCytometryTools.IO.cache.disk_cache),
+        the data is loaded from the cache when the file was parsed before.
         '''
+        if disk_cache.enabled and set(kwargs) <= set(['channels', 'channel_naming', 'mmap']):
+            return disk_cache.read_data(self.datafile, **kwargs)
         meta, data = parse_fcs(self.datafile, **kwargs)
         return data
 
+    def iter_data(self, chunk_events=100000, channels=None):
+        '''
+        Iterate over the events of the measurement in blocks.
+
+        Only one block is held in memory at a time, so measurements that
+        are larger than the available memory can be processed.
+        Queued actions (e.g., gates added with apply_now=False)
+        are applied to each block separately. Queued transformations are computed
+        exactly (use_spln=False), rather than through a spline fitted to the range
+        of each block, so that the events do not depend on chunk_events.
+
+        Parameters
+        ----------
+        chunk_events : int
+            Maximal number of events read from the file for each block.
+        channels : str | list of str | None
+            Names of channels to include in each block.
+            If None is given, all channels are included.
+
+        Returns
+        -------
+        Generator of DataFrames.
+
+        Examples
+        --------
+        >>> counts = sum(gate._identify(block).sum() for block in sample.iter_data(10**6))
+        '''
+        channels = to_list(channels)
+
+        if self._data is not None:
+            data, rows = self._data, self._rows
+            if rows is None:
+                blocks = (data.iloc[i:i + chunk_events] for i in range(0, data.shape[0], chunk_events))
+            else:
+                blocks = (data.iloc[rows[i:i + chunk_events]] for i in range(0, len(rows), chunk_events))
+        else:
+            read_channels = self.readdata_kwargs.get('channels')
+            if not self.queue and channels is not None:
+                read_channels = channels
+            channel_naming = self.readdata_kwargs.get('channel_naming', '$PnS')
+            parser = FCS_Parser(self.datafile, read_data=False, channel_naming=channel_naming)
+            blocks = parser.iter_chunks(chunk_events, channels=read_channels)
+
+        queue = self._get_streaming_queue()
+        for block in blocks:
+            if queue:
+                block = self._apply_queued_to_block(block, queue)
+            if channels is not None:
+                block = block[channels]
+            yield block
+
+    def _get_streaming_queue(self):
+        '''
+        Returns the queued actions as applied to each block by iter_data.
+        Splines are fitted to the range of the values that they transform, which differs
+        between blocks, so transformations are computed without splines.
+        '''
+        queue = []
+        for name, params in self.queue:
+            if name == 'transform' and params.get('use_spln', True):
+                params = dict(params, use_spln=False)
+            queue.append((name, params))
+        return queue
+
+    def _streams_exactly(self):
+        '''
+        Returns True if the blocks of iter_data hold the same events as the data,
+        i.e., unless queued transformations would be computed through a spline
+        (see _get_streaming_queue). Values computed from the data (counts, histograms,
+        ranges) are only streamed from the file when they do not depend on it.
+        '''
+        return not any(name == 'transform' and params.get('use_spln', True)
+                       for name, params in self.queue)
+
+    def _apply_queued_to_block(self, block, queue):
+        '''
+        Apply the queued actions to a block of events (see iter_data).
+        '''
+        new = self.copy(deep=False)
+        new._data = block
+        new._rows = None
+        new.history = list(self.history)
+        new.queue = list(queue)
+        return new.apply_queued().get_data()
+
     def read_meta(self, **kwargs):
         '''
         Read only the annotation of the FCS file (without reading DATA segment).
@@ -72,8 +178,10 @@ class FCMeasurement(Measurement):
         # as **kwargs to the read_data function.
         if 'channel_naming' in self.readdata_kwargs:
             kwargs['channel_naming'] = self.readdata_kwargs['channel_naming']
+        if disk_cache.enabled and set(kwargs) <= set(['channel_naming']):
+            return disk_cache.read_meta(self.datafile, **kwargs)
         meta = parse_fcs(self.datafile,
-                         reformat_meta=True,
+                         reformat_meta='lazy',
                          meta_data_only=True, **kwargs)
         return meta
 
@@ -135,7 +243,13 @@ class FCMeasurement(Measurement):
         channel_names = to_list(channel_names)
         gates = to_list(gates)
 
-        plot_output = graph.plotFCM(self.data, channel_names, kind=kind, **kwargs)
+        if (len(channel_names) == 1 or kind == 'histogram') and 'weights' not in kwargs:
+            # The counts are computed once (and cached) for the bins, and reused when replotting.
+            data = self.histogram(channel_names, bins=kwargs.pop('bins', 200),
+                                  range=kwargs.pop('range', None))
+        else:
+            data = self.data
+        plot_output = graph.plotFCM(data, channel_names, kind=kind, **kwargs)
 
         if gates is not None:
             if gate_colors is None:
@@ -154,7 +268,7 @@ class FCMeasurement(Measurement):
     def view(self, channel_names='auto',
              gates=None,
              diag_kw={}, offdiag_kw={},
-             gate_colors=None, **kwargs):
+             gate_colors=None, offdiag_plot='histogram', max_points=None, seed=0, **kwargs):
         """
         Generates a matrix of subplots allowing for a quick way
         to examine how the sample looks in different channels.
@@ -165,6 +279,11 @@ class FCMeasurement(Measurement):
             List of channel names to plot.
         offdiag_plot : ['histogram' | 'scatter']
             Specifies the type of plot for the off-diagonal elements.
+        max_points : None | int
+            Maximal number of events drawn in each scatter plot (None for all the events).
+            The events are subsampled so that their density is preserved.
+        seed : None | int
+            Seed of the subsampling (used with max_points).
         diag_kw : dict
             Not implemented
 
@@ -179,10 +298,13 @@ class FCMeasurement(Measurement):
         def plot_region(channels, **kwargs):
             if channels[0] == channels[1]:
                 channels = channels[0]
-            kind = 'histogram'
+                kind = 'histogram'
+            else:
+                kind = offdiag_plot
 
             self.plot(channels, kind=kind, gates=gates,
-                      gate_colors=gate_colors, autolabel=False)
+                      gate_colors=gate_colors, autolabel=False,
+                      max_points=max_points, seed=seed)
 
         channel_list = np.array(list(channel_names), dtype=object)
         channel_mat = [[(x, y) for x in channel_list] for y in channel_list]
@@ -241,7 +363,7 @@ class FCMeasurement(Measurement):
     def transform(self, transform, direction='forward',
                   channels=None, return_all=True, auto_range=True,
                   use_spln=True, get_transformer=False, ID=None,
-                  apply_now=True,
+                  apply_now=True, use_lut=True,
                   args=(), **kwargs):
         """
         Applies a transformation to the specified channels.
@@ -269,13 +391,35 @@ class FCMeasurement(Measurement):
         {FCMeasurement_transform_examples}
         """
         # Create new measurement
-        new = self.copy()
+        new = self._copy_sharing_data()
         data = new.data
 
         channels = to_list(channels)
         if channels is None:
             channels = data.columns
-        ## create transformer
+        transformer = self._get_transformer(transform, direction, channels, auto_range, args, kwargs)
+        ## create new data
+        lut_range = self._get_lut_range(data, channels) if use_lut else None
+        transformed = transformer(data[channels], use_spln, lut_range=lut_range)
+        if return_all:
+            # The data may be shared with other measurements (see Measurement._copy_sharing_data)
+            # or with the data cache, so it is copied before being modified.
+            new_data = data.copy()
+        else:
+            new_data = data.filter(channels)
+        new_data[channels] = transformed
+        ## update new Measurement
+        new.data = new_data
+
+        if ID is not None:
+            new.ID = ID
+        if get_transformer:
+            return new, transformer
+        else:
+            return new
+
+    def _get_transformer(self, transform, direction, channels, auto_range, args, kwargs):
+        ''' Returns the Transformation used by transform (see transform for the parameters). '''
         if isinstance(transform, Transformation):
             transformer = transform
         else:
@@ -297,25 +441,36 @@ class FCMeasurement(Measurement):
                             You'll need to provide the name of the channel in the transform.""")
                     kwargs['d'] = np.log10(ranges[0])
             transformer = Transformation(transform, direction, args, **kwargs)
-        ## create new data
-        transformed = transformer(data[channels], use_spln)
-        if return_all:
-            new_data = data
-        else:
-            new_data = data.filter(columns)
-        new_data[channels] = transformed
-        ## update new Measurement
-        new.data = new_data
+        return transformer
 
-        if ID is not None:
-            new.ID = ID
-        if get_transformer:
-            return new, transformer
-        else:
-            return new
+    def _get_lut_range(self, data, channels):
+        '''
+        Returns the number of possible values ($PnR) of the channels if they hold
+        integer data ($DATATYPE = 'I'), so that transformations can use a lookup table.
+        Otherwise returns None.
+        If data is None, the data is assumed to be as read from the datafile.
+        '''
+        if self.get_meta().get('$DATATYPE') != 'I':
+            return None
+        if data is not None and not all(data[c].dtype.kind in 'ui' for c in channels):
+            return None
+        # the -1 below because the channel numbers begin from 1 instead of 0
+        ranges = [int(float(r['$PnR'])) for i, r in self.channels.iterrows() if
+                  self.channel_names[i - 1] in channels]
+        return max(ranges) if ranges else None
+
+    def _lut_applies(self, channels):
+        '''
+        Returns True if transformations of the channels will use a lookup table
+        (see _get_lut_range), without reading the data.
+        '''
+        if any(name == 'transform' for name, params in self.queue):
+            return False
+        lut_range = self._get_lut_range(self._data, channels)
+        return lut_range is not None and lut_range <= _max_lut_size
 
     @doc_replacer
-    def subsample(self, key, order='random', auto_resize=False):
+    def subsample(self, key, order='random', auto_resize=False, seed=None, sort=False, stream=False):
         """
         Allows arbitrary slicing (subsampling) of the data.
 
@@ -328,9 +483,16 @@ class FCMeasurement(Measurement):
         FCMeasurement
             Sample with subsampled data.
         """
-
-        data = self.get_data()
-        num_events = data.shape[0]
+        if stream:
+            if order != 'random' or not isinstance(key, (int, float)):
+                raise ValueError("stream=True requires order='random' and an int or float key.")
+            if self._streams_exactly():
+                num_events = self.counts
+            else:  # The number of events of the blocks that are sampled
+                num_events = sum(block.shape[0] for block in self.iter_data())
+        else:
+            data = self.get_data()
+            num_events = data.shape[0]
 
         if isinstance(key, float):
             if (key > 1.0) or (key < 0.0):
@@ -344,6 +506,14 @@ class FCMeasurement(Measurement):
             stop = int(num_events * key[1])
             key = slice(start, stop)  # Convert to a slice
 
+        if stream:
+            if auto_resize:
+                key = min(key, num_events)
+            newdata = _reservoir_sample(self.iter_data(), max(key, 0), seed=seed, sort=sort)
+            newsample = self._copy_sharing_data()
+            newsample.set_data(data=newdata)
+            return newsample
+
         try:
             if isinstance(key, slice):
                 if auto_resize:
@@ -359,7 +529,10 @@ class FCMeasurement(Measurement):
                     # EDGE CAES: Must return an empty sample
                     order = 'start'
                 if order == 'random':
-                    newdata = data.loc[sample(data.index, key)]  # Use loc not iloc here!!
+                    positions = _get_random_generator(seed).choice(num_events, key, replace=False)
+                    if sort:
+                        positions.sort()
+                    newdata = data.take(positions)  # Positions, not labels
                 elif order == 'start':
                     newdata = data.iloc[:key]
                 elif order == 'end':
@@ -372,19 +545,25 @@ class FCMeasurement(Measurement):
             print("If you're encountering an out-of-bounds error, "
                   "try to setting 'auto_resize' to True.")
             raise
-        newsample = self.copy()
+        newsample = self._copy_sharing_data()
         newsample.set_data(data=newdata)
         return newsample
 
     @queueable
     @doc_replacer
-    def gate(self, gate, apply_now=True):
+    def gate(self, gate, apply_now=True, materialize=True):
         '''
         Apply given gate and return new gated sample (with assigned data).
 
         Parameters
         ----------
         gate : {_gate_available_classes}
+        materialize : bool
+            If True, the events that pass the gate are copied into the data of the new sample.
+            If False, the new sample is a view: it refers to the data of this sample
+            and holds the positions of the events that pass the gate.
+            The events are only copied when the data of the view is accessed;
+            counts and further gates (with materialize=False) only use the positions.
 
         Returns
         -------
@@ -392,19 +571,344 @@ class FCMeasurement(Measurement):
         FCMeasurement
             Sample with data that passes gates
         '''
-        data = self.get_data()
-        newdata = gate(data)
-        newsample = self.copy()
-        newsample.data = newdata
+        if materialize:
+            data = self.get_data()
+            newdata = gate(data)
+            newsample = self._copy_sharing_data()
+            newsample.data = newdata
+            return newsample
+        data, rows = self._get_data_and_rows()
+        columns = collections.OrderedDict((c, data[c].values) for c in data.columns)
+        newsample = self._copy_sharing_data()
+        newsample._data = data
+        newsample._rows = self._gate_columns(columns, rows, gate)
         return newsample
 
+    def _get_data_and_rows(self):
+        '''
+        Returns the data and the positions of the events in the data that belong
+        to the measurement (None for all events), without copying the events of views.
+        '''
+        if self._data is not None and not self.queue:
+            return self._data, self._rows
+        return self.get_data(), None
+
+    _fusable_actions = ('transform', 'gate')
+
+    def _apply_fused(self, actions):
+        '''
+        Applies a sequence of queued transforms and gates in a single pass over the data.
+
+        The columns of the data are held as arrays, and the events that pass the gates
+        so far are tracked by their positions. Gates are evaluated (and transforms computed)
+        only on these events, and the resulting DataFrame is assembled once at the end.
+
+        The result is the same as applying the actions one after the other, except that
+        transformed channels always hold float64 values (the dtype of columns assigned
+        by transform depends on the pandas version).
+        '''
+        data, rows = self._get_data_and_rows()  # rows: positions of the events that pass the gates
+        columns = collections.OrderedDict((c, data[c].values) for c in data.columns)
+        ID = self.ID
+
+        for name, params in actions:
+            if name == 'transform':
+                columns = self._transform_columns(columns, rows, **params)
+                ID = params['ID'] if params['ID'] is not None else ID
+            else:
+                rows = self._gate_columns(columns, rows, **params)
+
+        new = self.copy(deep=False)
+        new.position = dict(self.position)
+        new.history = self.history + list(actions)
+        new.queue = []
+        new.ID = ID
+
+        transformed = any(name == 'transform' for name, params in actions)
+        if not transformed and not actions[-1][1].get('materialize', True):
+            new._data, new._rows = data, rows  # A view (see gate)
+            return new
+
+        index = data.index
+        if rows is not None:
+            columns = collections.OrderedDict((c, v[rows]) for c, v in columns.items())
+            index = index[rows]
+        new._data = DataFrame(columns, index=index, columns=list(columns.keys()))
+        new._rows = None
+        return new
+
+    def _transform_columns(self, columns, rows, transform, direction='forward',
+                           channels=None, return_all=True, auto_range=True,
+                           use_spln=True, get_transformer=False, ID=None,
+                           apply_now=True, use_lut=True,
+                           args=(), **kwargs):
+        ''' The transform step of _apply_fused (see transform for the parameters). '''
+        channels = to_list(channels)
+        if channels is None:
+            channels = list(columns.keys())
+        transformer = self._get_transformer(transform, direction, channels, auto_range,
+                                            args, dict(kwargs))
+        lut_range = self._get_lut_range(columns, channels) if use_lut else None
+        if rows is None:
+            x = np.column_stack([columns[c] for c in channels])
+        else:
+            x = np.column_stack([columns[c][rows] for c in channels])
+        transformed = np.asarray(transformer(x, use_spln, lut_range=lut_range))
+
+        if not return_all:
+            columns = collections.OrderedDict((c, columns[c]) for c in channels)
+        else:
+            columns = columns.copy()
+        for j, c in enumerate(channels):
+            if rows is None:
+                columns[c] = transformed[:, j]
+            else:
+                # Events that did not pass the gates are not transformed, since they are dropped.
+                values = np.zeros(len(columns[c]), dtype=transformed.dtype)
+                values[rows] = transformed[:, j]
+                columns[c] = values
+        return columns
+
+    def _gate_columns(self, columns, rows, gate, apply_now=True, materialize=True):
+        ''' The gate step of _apply_fused. Returns the positions of the events that pass the gate. '''
+        channels = _get_gate_channels(gate)
+        if channels is None:
+            channels = list(columns.keys())
+        for c in channels:
+            if c not in columns:
+                raise ValueError('Trying to filter based on channel {channel}, '
+                                 'which is not present in the data.'.format(channel=c))
+        if rows is None:
+            frame = DataFrame(collections.OrderedDict((c, columns[c]) for c in channels),
+                              columns=channels)
+        else:
+            frame = DataFrame(collections.OrderedDict((c, columns[c][rows]) for c in channels),
+                              columns=channels)
+        passed = np.asarray(gate._identify(frame), dtype=bool)
+        if rows is None:
+            return np.flatnonzero(passed)
+        return rows[passed]
+
+    def channel_ranges(self, channels=None, use_meta=False):
+        """
+        Returns the range of values of the specified channels.
+
+        Parameters
+        ----------
+        channels : str | list of str | None
+            Names of channels.
+            If None is given, all channels are used.
+        use_meta : bool
+            If True, the ranges are [0, $PnR] (taken from the meta data), and the data is not read.
+            Otherwise, the ranges are computed from the data in a single pass over the events
+            (block by block, if the data is not held in memory).
+
+        Returns
+        -------
+        DataFrame indexed by channel names with columns 'min' and 'max'.
+        """
+        channels = to_list(channels)
+        if channels is None:
+            channels = list(self.channel_names)
+
+        if use_meta:
+            # the -1 below because the channel numbers begin from 1 instead of 0
+            pnr = dict((self.channel_names[i - 1], float(r['$PnR']))
+                       for i, r in self.channels.iterrows())
+            mins = np.zeros(len(channels))
+            maxs = np.array([pnr[c] for c in channels])
+        elif (self._data is None and self.datafile is not None and not data_cache.enabled and
+              self._streams_exactly()):
+            mins = np.full(len(channels), np.nan)
+            maxs = np.full(len(channels), np.nan)
+            for block in self.iter_data(channels=channels):
+                if len(block):
+                    mins = np.fmin(mins, block.min().values)
+                    maxs = np.fmax(maxs, block.max().values)
+        else:
+            data = self.get_data()[channels]
+            mins, maxs = data.min().values, data.max().values
+        return DataFrame({'min': mins, 'max': maxs}, index=channels, columns=['min', 'max'])
+
+    def histogram(self, channel_names, bins=200, range=None):
+        """
+        Returns the histogram of the events in the specified channels.
+
+        The histogram is computed in a single pass over the events (block by block,
+        if the data is not held in memory), and is cached, so that plotting
+        the measurement again with the same bins does not bin the events again.
+
+        Parameters
+        ----------
+        channel_names : str | list of str
+            Names of 1 or 2 channels.
+        bins : int | ndarray | [int | ndarray]
+            Number of bins or edges of the bins (for each channel).
+            When the number of bins is given, the bins span the range of the data
+            (see channel_ranges), unless range is given.
+        range : None | (min, max) | [(min, max), (min, max)]
+            Range of the bins along each channel (when the number of bins is given).
+
+        Returns
+        -------
+        graph.Histogram
+            The histogram is shared with the cache, and should not be modified.
+        """
+        channel_names = to_list(channel_names)
+        edges = _get_histogram_edges(bins, channel_names, range,
+                                     lambda: self.channel_ranges(channel_names))
+        cache = self.__dict__.setdefault('_histograms', collections.OrderedDict())
+        key = _get_histogram_key(channel_names, edges)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == self._get_data_signature():
+            hist = entry[1]
+        else:
+            hist = graph.Histogram(channel_names, edges)
+            if (self._data is None and self.datafile is not None and not data_cache.enabled and
+                    self._streams_exactly()):
+                for block in self.iter_data(channels=channel_names):
+                    hist.add(block)
+            else:
+                hist.add(self.get_data())
+        self._cache_histogram(hist)
+        return hist
+
+    def _cache_histogram(self, hist):
+        """ Stores a histogram of the measurement in its cache (see histogram). """
+        cache = self.__dict__.setdefault('_histograms', collections.OrderedDict())
+        key = _get_histogram_key(hist.channels, hist.edges)
+        cache.pop(key, None)
+        cache[key] = (self._get_data_signature(), hist)  # Most recently used last
+        while len(cache) > _max_cached_histograms:
+            cache.popitem(last=False)
+
     @property
     def counts(self):
         """ Returns total number of events. """
+        if self._data is None and self.datafile is not None:
+            if not self.queue:
+                return self.get_meta()['$TOT']
+            if self._streams_exactly():
+                # Counting block by block, so the events are never all held in memory.
+                return sum(block.shape[0] for block in self.iter_data())
+        if self._rows is not None and not self.queue:
+            return len(self._rows)
         data = self.get_data()
         return data.shape[0]
 
 
+def _get_random_generator(seed=None):
+    """
+    Returns a numpy random generator (numpy.random.Generator, or a RandomState
+    for versions of numpy that do not have generators) seeded with the seed.
+    """
+    if isinstance(seed, np.random.RandomState) or (
+            hasattr(np.random, 'Generator') and isinstance(seed, np.random.Generator)):
+        return seed
+    if hasattr(np.random, 'default_rng'):
+        return np.random.default_rng(seed)
+    return np.random.RandomState(seed)
+
+
+def _reservoir_sample(blocks, n, seed=None, sort=False):
+    """
+    Samples n events (uniformly, without replacement) from blocks of events,
+    holding only the sample and one block in memory (reservoir sampling).
+
+    Parameters
+    ----------
+    blocks : iterable of DataFrame
+        Blocks of events (e.g., from FCMeasurement.iter_data).
+    n : int
+        Number of events to sample.
+    seed : int | None
+    sort : bool
+        If True, the sampled events are in the same order as in the blocks.
+        Otherwise, they are in random order.
+
+    Returns
+    -------
+    DataFrame
+    """
+    rng = _get_random_generator(seed)
+    random = rng.random if hasattr(rng, 'integers') else rng.random_sample
+    columns, labels, positions = None, None, None
+    seen = 0
+    for block in blocks:
+        if columns is None:
+            columns = collections.OrderedDict((c, np.empty(n, dtype=block[c].dtype)) for c in block.columns)
+            labels = np.empty(n, dtype=block.index.dtype)
+            positions = np.empty(n, dtype=np.int64)
+        # Each event i (counting from 0) replaces a random slot of the sample with probability n / (i + 1)
+        # (the first n events fill the sample).
+        block_positions = np.arange(seen, seen + len(block))
+        slots = np.floor(random(len(block)) * (block_positions + 1)).astype(np.int64)
+        filling = block_positions < n
+        slots[filling] = block_positions[filling]
+        rows = np.flatnonzero(slots < n)
+        # When several events of the block replace the same slot, the last one is kept.
+        slots = slots[rows]
+        _, last = np.unique(slots[::-1], return_index=True)
+        rows, slots = rows[len(rows) - 1 - last], slots[len(slots) - 1 - last]
+        for c, values in columns.items():
+            values[slots] = block[c].values[rows]
+        labels[slots] = block.index.values[rows]
+        positions[slots] = block_positions[rows]
+        seen += len(block)
+
+    if seen < n:
+        raise ValueError('Cannot sample {0} events from {1} events.'.format(n, seen))
+    if columns is None:
+        return DataFrame()
+    order = np.argsort(positions) if sort else rng.permutation(n)
+    return DataFrame(collections.OrderedDict((c, values[order]) for c, values in columns.items()),
+                     index=labels[order])
+
+
+class _Subsampler(object):
+    """
+    Subsamples measurements (see FCMeasurement.subsample), each with a seed derived
+    from the given seed and from the ID of the measurement. Can be pickled.
+    """
+
+    def __init__(self, seed, **kwargs):
+        self.seed = seed
+        self.kwargs = kwargs
+
+    def __call__(self, measurement):
+        seed = self.seed
+        if seed is not None:
+            digest = hashlib.md5(repr((seed, measurement.ID)).encode('utf-8')).hexdigest()
+            seed = int(digest[:8], 16)
+        return measurement.subsample(seed=seed, **self.kwargs)
+
+
+def _get_histogram_edges(bins, channel_names, range, get_ranges):
+    """
+    Returns the edges of the bins of a histogram (see graph.get_bin_edges).
+    get_ranges is called (once) to get the ranges of the channels (as returned by channel_ranges)
+    only if the number of bins is given without a range.
+    """
+    ranges = []
+
+    def get_range(channel):
+        if not ranges:
+            ranges.append(get_ranges())
+        lower, upper = ranges[0].loc[channel, ['min', 'max']]
+        return (lower, upper) if np.isfinite([lower, upper]).all() else (0., 1.)  # No events
+
+    return graph.get_bin_edges(bins, channel_names, range=range, get_range=get_range)
+
+
+def _get_histogram_key(channel_names, edges):
+    return tuple(channel_names), tuple(e.tostring() for e in edges)
+
+
+def _get_counts(measurement):
+    """ Returns the counts of the measurement (picklable, unlike a lambda). """
+    return measurement.counts
+
+
 class FCCollection(MeasurementCollection):
     '''
     A dict-like class for holding flow cytometry samples.
@@ -415,7 +919,7 @@ class FCCollection(MeasurementCollection):
     def transform(self, transform, direction='forward', share_transform=True,
                   channels=None, return_all=True, auto_range=True,
                   use_spln=True, get_transformer=False, ID=None,
-                  apply_now=True,
+                  apply_now=True, use_lut=True, executor='serial', n_jobs=None,
                   args=(), **kwargs):
         '''
         Apply transform to each Measurement in the Collection.
@@ -429,6 +933,7 @@ class FCCollection(MeasurementCollection):
         {FCMeasurement_transform_pars}
         ID : hashable | None
             ID for the resulting collection. If None is passed, the original ID is used.
+        {_bases_executor}
 
         Returns
         -------
@@ -442,7 +947,6 @@ class FCCollection(MeasurementCollection):
         --------
         {FCMeasurement_transform_examples}
         '''
-        new = self.copy()
         if share_transform:
             channel_meta = self.values()[0].channels
             channel_names = self.values()[0].channel_names
@@ -470,29 +974,29 @@ class FCCollection(MeasurementCollection):
                                             'transformed together.')
                         kwargs['d'] = np.log10(ranges[0])
                 transformer = Transformation(transform, direction, args, **kwargs)
-                if use_spln:
-                    xmax = self.apply(lambda x: x[channels].max().max(), applyto='data').max().max()
-                    xmin = self.apply(lambda x: x[channels].min().min(), applyto='data').min().min()
-                    transformer.set_spline(xmin, xmax)
+                # The spline is not needed when all the measurements are transformed
+                # through a lookup table (integer data)
+                if use_spln and not (use_lut and all(m._lut_applies(channels) for m in self.values())):
+                    ranges = self.channel_ranges(channels, executor=executor, n_jobs=n_jobs)
+                    transformer.set_spline(ranges['min'].min(), ranges['max'].max())
             ## transform all measurements     
-            for k, v in new.iteritems():
-                new[k] = v.transform(transformer, channels=channels, return_all=return_all,
-                                     use_spln=use_spln, apply_now=apply_now)
+            func = _MethodCaller('transform', transformer, channels=channels, return_all=return_all,
+                                 use_spln=use_spln, apply_now=apply_now, use_lut=use_lut)
         else:
-            for k, v in new.iteritems():
-                new[k] = v.transform(transform, direction=direction, channels=channels,
-                                     return_all=return_all, auto_range=auto_range,
-                                     get_transformer=False,
-                                     use_spln=use_spln, apply_now=apply_now, args=args, **kwargs)
-        if ID is not None:
-            new.ID = ID
+            func = _MethodCaller('transform', transform, direction=direction, channels=channels,
+                                 return_all=return_all, auto_range=auto_range,
+                                 get_transformer=False,
+                                 use_spln=use_spln, apply_now=apply_now, use_lut=use_lut,
+                                 args=args, **kwargs)
+        new = self.apply(func, output_format='collection', ID=ID,
+                         executor=executor, n_jobs=n_jobs)
         if share_transform and get_transformer:
             return new, transformer
         else:
             return new
 
     @doc_replacer
-    def gate(self, gate, ID=None, apply_now=True):
+    def gate(self, gate, ID=None, apply_now=True, materialize=True, executor='serial', n_jobs=None):
         '''
         Applies the gate to each Measurement in the Collection, returning a new Collection with gated data.
 
@@ -504,15 +1008,18 @@ class FCCollection(MeasurementCollection):
 
         ID : [ str, numeric, None]
             New ID to be given to the output. If None, the ID of the current collection will be used.
+        materialize : bool
+            If False, the measurements of the new collection are views
+            of the gated data (see FCMeasurement.gate).
+        {_bases_executor}
         '''
-
-        def func(well):
-            return well.gate(gate, apply_now=apply_now)
-
-        return self.apply(func, output_format='collection', ID=ID)
+        func = _MethodCaller('gate', gate, apply_now=apply_now, materialize=materialize)
+        return self.apply(func, output_format='collection', ID=ID,
+                          executor=executor, n_jobs=n_jobs)
 
     @doc_replacer
-    def subsample(self, key, order='random', auto_resize=False, ID=None):
+    def subsample(self, key, order='random', auto_resize=False, seed=None, sort=False, stream=False,
+                  ID=None, executor='serial', n_jobs=None):
         """
         Allows arbitrary slicing (subsampling) of the data.
 
@@ -520,23 +1027,27 @@ class FCCollection(MeasurementCollection):
 
             When using order='random', the sampling is random
             for each of the measurements in the collection.
+            If a seed is given, each measurement is sampled with a seed
+            derived from it and from the ID of the measurement.
 
         Parameters
         ----------
         {FCMeasurement_subsample_parameters}
+        {_bases_executor}
 
         Returns
         -------
         FCCollection or a subclass
             new collection of subsampled event data.
         """
+        func = _Subsampler(seed, key=key, order=order, auto_resize=auto_resize,
+                           sort=sort, stream=stream)
+        return self.apply(func, output_format='collection', ID=ID,
+                          executor=executor, n_jobs=n_jobs)
 
-        def func(well):
-            return well.subsample(key=key, order=order, auto_resize=auto_resize)
-
-        return self.apply(func, output_format='collection', ID=ID)
-
-    def counts(self, ids=None, setdata=False, output_format='DataFrame'):
+    @doc_replacer
+    def counts(self, ids=None, setdata=False, output_format='DataFrame',
+               executor='serial', n_jobs=None):
         """
         Return the counts in each of the specified measurements.
 
@@ -550,13 +1061,93 @@ class FCCollection(MeasurementCollection):
             Used only if data is not already set.
         output_format : DataFrame | dict
             Specifies the output format for that data.
+        {_bases_executor}
 
         Returns
         -------
         [DataFrame | Dictionary]
             Dictionary keys correspond to measurement keys.
         """
-        return self.apply(lambda x: x.counts, ids=ids, setdata=setdata, output_format=output_format)
+        return self.apply(_get_counts, ids=ids, setdata=setdata, output_format=output_format,
+                          executor=executor, n_jobs=n_jobs)
+
+    @doc_replacer
+    def channel_ranges(self, channels=None, use_meta=False, executor='serial', n_jobs=None):
+        """
+        Returns the range of values of the specified channels over all the measurements.
+
+        The data of each measurement is read (at most) once.
+        The result is cached on the collection, so that it is computed only once
+        for subsequent calls (e.g., by transform and plot).
+
+        Parameters
+        ----------
+        channels : str | list of str | None
+            Names of channels.
+            If None is given, all channels are used.
+        use_meta : bool
+            If True, the ranges are [0, $PnR] (taken from the meta data), and the data is not read.
+        {_bases_executor}
+
+        Returns
+        -------
+        DataFrame indexed by channel names with columns 'min' and 'max'.
+        """
+        channels = to_list(channels)
+        if channels is None:
+            channels = list(self.values()[0].channel_names)
+        # The signatures of the data of the measurements are part of the key, so that
+        # replacing a measurement or its data invalidates the cached ranges.
+        key = (tuple(channels), use_meta,
+               tuple(sorted((k, m._get_data_signature()) for k, m in self.items())))
+        cache = self.__dict__.setdefault('_channel_ranges', {})
+        if key not in cache:
+            func = _MethodCaller('channel_ranges', channels, use_meta=use_meta)
+            ranges = self.apply(func, output_format='dict', executor=executor, n_jobs=n_jobs)
+            mins = DataFrame(dict((k, r['min']) for k, r in ranges.items()))
+            maxs = DataFrame(dict((k, r['max']) for k, r in ranges.items()))
+            cache.clear()
+            cache[key] = DataFrame({'min': mins.min(axis=1), 'max': maxs.max(axis=1)},
+                                   index=channels, columns=['min', 'max'])
+        return cache[key].copy()
+
+    def histograms(self, channel_names, bins=200, range=None, ids=None,
+                   executor='serial', n_jobs=None):
+        """
+        Returns the histograms of the measurements in the specified channels (with the same bins).
+
+        Each histogram is computed where its measurement is processed (see executor),
+        so only the counts are sent back from the workers. The histograms are cached
+        by the measurements (see FCMeasurement.histogram), so that plotting the
+        measurements with the same bins does not bin the events again.
+
+        Parameters
+        ----------
+        channel_names : str | list of str
+            Names of 1 or 2 channels.
+        bins : int | ndarray | [int | ndarray]
+            Number of bins or edges of the bins (for each channel).
+            When the number of bins is given, the bins span the range of the data
+            of all the measurements (see channel_ranges), unless range is given.
+        range : None | (min, max) | [(min, max), (min, max)]
+            Range of the bins along each channel (when the number of bins is given).
+        ids : hashable | iterable of hashables | None
+            Keys of the measurements. If None is given, all measurements are used.
+        {_bases_executor}
+
+        Returns
+        -------
+        Dictionary keyed by measurement keys containing graph.Histogram objects.
+        """
+        channel_names = to_list(channel_names)
+        edges = _get_histogram_edges(
+            bins, channel_names, range,
+            lambda: self.channel_ranges(channel_names, executor=executor, n_jobs=n_jobs))
+        func = _MethodCaller('histogram', channel_names, bins=edges)
+        histograms = self.apply(func, ids=ids, output_format='dict', executor=executor, n_jobs=n_jobs)
+        for key, hist in histograms.items():
+            self[key]._cache_histogram(hist)  # Histograms computed by worker processes are copies
+        return histograms
 
 
 class FCOrderedCollection(OrderedCollection, FCCollection):
@@ -570,19 +1161,34 @@ class FCOrderedCollection(OrderedCollection, FCCollection):
              ids=None, row_labels=None, col_labels=None,
              xlim='auto', ylim='auto',
              autolabel=True,
+             executor='serial', n_jobs=None,
+             filename=None, figsize=None, dpi=None,
              **kwargs):
         """
         Produces a grid plot with each subplot corresponding to the data at the given position.
 
+        For histograms, the ranges of the channels (see channel_ranges) and then the counts
+        of the measurements are computed first, both by the workers of the executor
+        (see histograms), and the figure is then drawn from the counts.
+
         Parameters
         ---------------
         {FCMeasurement_plot_pars}
         {graph_plotFCM_pars}
         {_graph_grid_layout}
+        {_bases_executor}
+        filename : str | None
+            If given, the figure is drawn off-screen (without using pyplot) and saved to the file.
+            The format is given by the extension (e.g., png, svg, pdf).
+        figsize : (float, float) | None
+            Size of the figure in inches (only used with filename).
+        dpi : float | None
+            Resolution of the figure (only used with filename).
 
         Returns
         -------
         {_graph_grid_layout_returns}
+        If filename is given, the (off-screen) figure is returned instead.
 
         Examples
         --------
@@ -634,21 +1240,9 @@ class FCOrderedCollection(OrderedCollection, FCCollection):
             nbins = kwargs.get('bins', 200)
 
             if isinstance(nbins, int):
-                min_list = []
-                max_list = []
-                for sample in self:
-                    min_list.append(self[sample].data[channel_names].min().values)
-                    max_list.append(self[sample].data[channel_names].max().values)
-
-                min_list = zip(*min_list)
-                max_list = zip(*max_list)
-
-                bins = []
-
-                for i, c in enumerate(channel_names):
-                    min_v = min(min_list[i])
-                    max_v = max(max_list[i])
-                    bins.append(np.linspace(min_v, max_v, nbins))
+                ranges = self.channel_ranges(channel_names, executor=executor, n_jobs=n_jobs)
+                bins = [np.linspace(ranges['min'][c], ranges['max'][c], nbins)
+                        for c in channel_names]
 
                 # Check if 1d 
                 if len(channel_names) == 1:
@@ -656,6 +1250,12 @@ class FCOrderedCollection(OrderedCollection, FCCollection):
 
                 kwargs['bins'] = bins
 
+        if ((kind == 'histogram' or len(channel_names) == 1) and 'weights' not in kwargs and
+                (executor != 'serial' or filename is not None)):
+            # Computes all the counts (in parallel), so that drawing only uses the cached counts.
+            self.histograms(channel_names, bins=kwargs.get('bins', 200), range=kwargs.get('range'),
+                            ids=ids, executor=executor, n_jobs=n_jobs)
+
         ##########
         # Defining the plotting function that will be used.
         # At the moment grid_plot handles the labeling 
@@ -676,9 +1276,52 @@ class FCOrderedCollection(OrderedCollection, FCCollection):
             if len(cnames) == 2:
                 ylabel = cnames[1]
 
+        if filename is not None:
+            return self._plot_to_file(filename, plot_sample, xlim=xlim, ylim=ylim,
+                                      xlabel=xlabel, ylabel=ylabel,
+                                      figsize=figsize, dpi=dpi, **grid_plot_kwargs)
+
         return self.grid_plot(plot_sample, xlim=xlim, ylim=ylim,
                               xlabel=xlabel, ylabel=ylabel,
                               **grid_plot_kwargs)
 
+    def _plot_to_file(self, filename, func, ids=None, row_labels=None, col_labels=None,
+                      xlim='auto', ylim='auto', xlabel=None, ylabel=None, **kwargs):
+        """
+        Same as grid_plot, but the figure is drawn off-screen (see graph.create_grid_figure)
+        and saved to the file.
+
+        Returns
+        -------
+        The figure.
+        """
+        layout_args = inspect.getargspec(graph.create_grid_figure).args
+        layout_kwargs = dict((k, v) for k, v in kwargs.items() if k in layout_args)
+        if row_labels is None:
+            row_labels = self.row_labels
+        if col_labels is None:
+            col_labels = self.col_labels
+        fig, ax_main, ax_subplots = graph.create_grid_figure(
+            len(self.row_labels), len(self.col_labels), row_labels=row_labels, col_labels=col_labels,
+            xlabel=xlabel, ylabel=ylabel, **layout_kwargs)
+        subplots_ax = DataFrame(ax_subplots, index=self.row_labels, columns=self.col_labels)
+
+        ids = self.keys() if ids is None else to_list(ids)
+        for ID in ids:
+            row, col = self._positions[ID]
+            func(self[ID], subplots_ax[col][row])
+
+        scale_subplots(ax_subplots, xlim=xlim, ylim=ylim)
+        ax_label = ax_subplots[0, -1]
+        if xlabel:
+            ax_label.set_xticks(ax_label.get_xlim())
+            for label in ax_label.get_xticklabels():
+                label.set_rotation(90)
+        if ylabel:
+            ax_label.set_yticks(ax_label.get_ylim())
+
+        fig.savefig(filename)
+        return fig
+
 
 FCPlate = FCOrderedCollection
@@ -11,11 +11,19 @@ Gates:
     IntervalGate
     QuadGate
     PolyGate
+    EllipseGate
+    RectangleGate
+    GateSet -- evaluates many gates against the same data.
 """
+import collections
+import pickle
+from functools import reduce
+
 from GoreUtilities.util import to_list
-from matplotlib.path import Path
 import numpy
 import pylab as pl
+from matplotlib.patches import Ellipse
+from pandas import Series
 
 from FlowCytometryTools.core.common_doc import doc_replacer
 
@@ -68,6 +76,9 @@ class _ComposableMixin(object):
 class Gate(_ComposableMixin):
     """ Defines common interface for specific implementations of the gate classes. """
     unnamed_gate_num = 1
+    # Attributes that hold data derived from the parameters of the gate (e.g., caches).
+    # They are not pickled, and do not take part in comparing gates.
+    _derived_attributes = ()
 
     def __init__(self, vert, channels, region, name=None):
         self.vert = vert
@@ -98,6 +109,9 @@ class Gate(_ComposableMixin):
     def __str__(self):
         return self.__repr__()
 
+    def __getstate__(self):
+        return dict((k, v) for k, v in self.__dict__.items() if k not in self._derived_attributes)
+
     def __call__(self, dataframe, region=None):
         """
         Filters the dataframe, keeping only events that pass the gate.
@@ -338,8 +352,10 @@ class QuadGate(Gate):
 
 
 class PolyGate(Gate):
+    _derived_attributes = ('_polygon',)
+
     @doc_replacer
-    def __init__(self, vert, channels, region='in', name=None):
+    def __init__(self, vert, channels, region='in', name=None, resolution=None):
         """
         Passes all events that are either inside or outside the polygon.
 
@@ -352,10 +368,29 @@ class PolyGate(Gate):
         region : ['in', 'out']
             If 'in', the gate only passes through data that lies inside the interval.
         {_gate_pars_name}
+        resolution : int | None
+            If given, the bounding box of the polygon is divided into resolution x resolution bins,
+            and events that fall into bins that lie entirely inside (or outside) the polygon
+            are identified by looking up their bin. Only events in bins crossed by the edges
+            of the polygon are tested against the polygon, which speeds up
+            gating of large numbers of events with polygons of many vertices.
+            The result is the same as without the lookup.
         """
         self._region_options = ('in', 'out')
+        self.resolution = resolution
         super(PolyGate, self).__init__(vert, channels, region, name)
 
+    def _get_polygon(self):
+        """ Returns the polygon prepared for testing events (rebuilt if the vertices were modified). """
+        vert = numpy.asarray(self.vert, dtype=float)
+        resolution = getattr(self, 'resolution', None)
+        polygon = self.__dict__.get('_polygon')
+        if (polygon is None or polygon.resolution != resolution or
+                not numpy.array_equal(polygon.vert, vert)):
+            polygon = _Polygon(vert, resolution)
+            self._polygon = polygon
+        return polygon
+
     def _identify(self, dataframe):
         """
         Returns a list of indexes containing only the points that pass the filter.
@@ -364,8 +399,8 @@ class PolyGate(Gate):
         ----------
         dataframe : DataFrame
         """
-        path = Path(self.vert)
-        idx = path.contains_points(dataframe.filter(self.channels))
+        x, y = [numpy.asarray(dataframe[c], dtype=float) for c in self.channels]
+        idx = self._get_polygon().contains(x, y)
 
         if self.region == 'out':
             idx = ~idx
@@ -392,6 +427,186 @@ class PolyGate(Gate):
         return ax.add_artist(poly)
 
 
+class EllipseGate(Gate):
+    @doc_replacer
+    def __init__(self, center, radii, channels, region='in', name=None, angle=0):
+        """
+        Passes all events that are either inside or outside the ellipse.
+
+        Parameters
+        ----------
+        center : 2-tuple
+            (x, y) location of the center of the ellipse.
+        radii : 2-tuple
+            Lengths of the semi-axes of the ellipse (before rotation, the first one lies along x).
+        {_gate_pars_2_channels}
+        region : ['in', 'out']
+            If 'in', the gate only passes through data that lies inside the ellipse.
+        {_gate_pars_name}
+        angle : float
+            Rotation of the ellipse in degrees (counterclockwise).
+        """
+        self._region_options = ('in', 'out')
+        self.radii = tuple(radii)
+        self.angle = angle
+        super(EllipseGate, self).__init__(tuple(center), channels, region, name)
+
+    def validate_input(self):
+        if len(self.channels) != 2 or len(self.vert) != 2 or len(self.radii) != 2:
+            raise ValueError('EllipseGate requires 2 channels, a 2d center and 2 radii.')
+        if min(self.radii) <= 0:
+            raise ValueError('The radii of the ellipse must be positive.')
+
+    def _identify(self, dataframe):
+        """
+        Identifies which data points in the dataframe pass the gate,
+        by evaluating the quadratic form of the ellipse at each point.
+        """
+        x, y = [numpy.asarray(dataframe[c], dtype=float) - v
+                for c, v in zip(self.channels, self.vert)]
+        a, b = self.radii
+        theta = numpy.deg2rad(self.angle)
+        cos, sin = numpy.cos(theta), numpy.sin(theta)
+        u = (cos * x + sin * y) / a  # Coordinates along the axes of the ellipse
+        v = (cos * y - sin * x) / b
+        idx = u * u + v * v <= 1
+
+        if self.region == 'out':
+            idx = ~idx
+
+        return idx
+
+    @doc_replacer
+    def plot(self, flip=False, ax_channels=None, ax=None, *args, **kwargs):
+        """
+        {_gate_plot_doc}
+        """
+        if ax == None:
+            ax = pl.gca()
+
+        if ax_channels is not None:
+            flip = self._find_orientation(ax_channels)
+        if flip:  # Mirrors the ellipse across the diagonal
+            center, angle = self.vert[::-1], 90 - self.angle
+        else:
+            center, angle = self.vert, self.angle
+        kwargs.setdefault('fill', False)
+        kwargs.setdefault('color', 'black')
+        ellipse = Ellipse(center, 2 * self.radii[0], 2 * self.radii[1], angle, *args, **kwargs)
+        return ax.add_artist(ellipse)
+
+
+class RectangleGate(Gate):
+    @doc_replacer
+    def __init__(self, vert, channels, region='in', name=None, angle=0):
+        """
+        Passes all events that are either inside or outside a box (in any number of channels).
+
+        Parameters
+        ----------
+        vert : list of 2-tuples
+            [(xmin, xmax), (ymin, ymax), ...]
+            The bounds of the box along each of the channels.
+        channels : list of channel names
+            Defines the names of the channels (one for each tuple in vert).
+        region : ['in', 'out']
+            If 'in', the gate only passes through data that lies inside the box.
+        {_gate_pars_name}
+        angle : float
+            Rotation of the box in degrees (counterclockwise) about its center.
+            Only supported for boxes in 2 channels.
+        """
+        self._region_options = ('in', 'out')
+        self.angle = angle
+        super(RectangleGate, self).__init__([tuple(v) for v in vert], channels, region, name)
+
+    def validate_input(self):
+        if len(self.vert) != len(self.channels):
+            raise ValueError('RectangleGate requires one (min, max) tuple per channel.')
+        for vmin, vmax in self.vert:
+            if vmax <= vmin:
+                raise ValueError('The max of each interval must be larger than its min.')
+        if self.angle and len(self.channels) != 2:
+            raise ValueError('Rotated boxes are only supported in 2 channels.')
+
+    @property
+    def center(self):
+        return tuple((vmin + vmax) / 2.0 for vmin, vmax in self.vert)
+
+    def _get_coordinates(self, values):
+        """ Returns the coordinates of the points along the axes of the box (undoing its rotation). """
+        if not self.angle:
+            return values
+        (cx, cy), (x, y) = self.center, values
+        theta = numpy.deg2rad(self.angle)
+        cos, sin = numpy.cos(theta), numpy.sin(theta)
+        return [cx + cos * (x - cx) + sin * (y - cy), cy + cos * (y - cy) - sin * (x - cx)]
+
+    def _identify(self, dataframe):
+        """ Identifies which data points in the dataframe pass the gate, checking the bounds along each axis. """
+        values = [numpy.asarray(dataframe[c], dtype=float) for c in self.channels]
+        idx = None
+        for x, (vmin, vmax) in zip(self._get_coordinates(values), self.vert):
+            inside = (x >= vmin) & (x <= vmax)
+            if idx is None:
+                idx = inside
+            else:
+                idx &= inside
+
+        if self.region == 'out':
+            idx = ~idx
+
+        return idx
+
+    def _get_corners(self, dims):
+        """ Returns the corners of the box in the two given channels (given by their positions). """
+        (xmin, xmax), (ymin, ymax) = [self.vert[d] for d in dims]
+        corners = numpy.array([(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)], dtype=float)
+        if self.angle:  # Boxes in 2 channels only
+            center = numpy.array(self.center)
+            theta = numpy.deg2rad(self.angle)
+            rotation = numpy.array([[numpy.cos(theta), -numpy.sin(theta)],
+                                    [numpy.sin(theta), numpy.cos(theta)]])
+            corners = center + (corners - center).dot(rotation.T)
+        return corners
+
+    @doc_replacer
+    def plot(self, flip=False, ax_channels=None, ax=None, *args, **kwargs):
+        """
+        {_gate_plot_doc}
+
+        For boxes in more than 2 channels, the bounds along the channels of
+        the axes (ax_channels) are drawn (the first 2 channels if ax_channels is None).
+        """
+        if ax == None:
+            ax = pl.gca()
+
+        if ax_channels is not None:
+            dims = [self.channels.index(c) for c in to_list(ax_channels) if c in self.channels]
+            if not dims:
+                raise Exception('Trying to plot gate that is defined on channels {0}, '
+                                'but figure axis correspond to channels {1}'.format(
+                                    self.channels, ax_channels))
+            if len(dims) == 1:
+                flip = to_list(ax_channels).index(self.channels[dims[0]]) == 1
+        else:
+            dims = [0, 1][:len(self.channels)]
+            if flip:
+                dims = dims[::-1]
+
+        kwargs.setdefault('color', 'black')
+        if len(dims) == 1:
+            plot_func = ax.axes.axhline if flip else ax.axes.axvline
+            return tuple(plot_func(v, *args, **kwargs) for v in self.vert[dims[0]])
+
+        corners = self._get_corners(sorted(dims))
+        if dims[0] > dims[1]:
+            corners = corners[:, ::-1]
+        kwargs.setdefault('fill', False)
+        poly = pl.Polygon(corners, *args, **kwargs)
+        return ax.add_artist(poly)
+
+
 class CompositeGate(_ComposableMixin):
     """
     Defines a composite gate that is generated by the logical addition of one or more gates.
@@ -464,8 +679,45 @@ class CompositeGate(_ComposableMixin):
     def __str__(self):
         return self.name
 
-    def _identify(self, dataframe):
-        idx = [gate._identify(dataframe) for gate in self.gates]
+    def _operands(self):
+        """
+        Returns the gates combined by this gate.
+        Nested composite gates that combine gates with the same associative operation
+        ('and' / 'or') are flattened, e.g., (g1 & g2) & g3 has the operands [g1, g2, g3].
+        """
+        if self.how not in ('and', 'or'):
+            return list(self.gates)
+        operands = []
+        for gate in self.gates:
+            if isinstance(gate, CompositeGate) and gate.how == self.how:
+                operands.extend(gate._operands())
+            else:
+                operands.append(gate)
+        return operands
+
+    def _identify(self, dataframe, memo=None):
+        """
+        Identifies the events that pass the gate.
+
+        Each distinct gate of the expression is evaluated once: results are memoized
+        (in memo) by gate parameters, so gates (and sub-expressions) that appear several
+        times in the expression, e.g., g1 in (g1 & g2) | (g1 & ~g3), are evaluated only once.
+        """
+        if memo is None:
+            memo = {}
+        key = _get_gate_key(self)
+        if key in memo:
+            return memo[key]
+
+        idx = []
+        for gate in self._operands():
+            if isinstance(gate, CompositeGate):
+                idx.append(gate._identify(dataframe, memo))
+            else:
+                gate_key = _get_gate_key(gate)
+                if gate_key not in memo:
+                    memo[gate_key] = gate._identify(dataframe)
+                idx.append(memo[gate_key])
 
         if self.how == 'and':
             function = numpy.logical_and
@@ -480,7 +732,12 @@ class CompositeGate(_ComposableMixin):
             raise ValueError(
                 "Unsupported value for how. how must be in ({0})".format(supported_values))
 
-        return function(*idx)
+        if len(idx) > 2:
+            result = reduce(function, idx)
+        else:
+            result = function(*idx)
+        memo[key] = result
+        return result
 
     def __call__(self, dataframe):
         idx = self._identify(dataframe)
@@ -493,3 +750,336 @@ class CompositeGate(_ComposableMixin):
         """
         for gate in self.gates:
             gate.plot(flip=flip, ax_channels=ax_channels, ax=ax, *args, **kwargs)
+
+
+def _get_gate_key(gate):
+    """
+    Returns a key identifying the gate by its type and parameters (excluding its name),
+    used to evaluate identical gates only once in composite gates.
+    """
+    if isinstance(gate, CompositeGate):
+        return ('composite', gate.how, tuple(_get_gate_key(g) for g in gate._operands()))
+    params = sorted((k, v) for k, v in gate.__getstate__().items() if k != 'name')
+    try:
+        return (type(gate), pickle.dumps(params, 2))
+    except Exception:
+        return (type(gate), id(gate))
+
+
+# Number of events compared at once against the gates of a GateSet (bounds the temporary memory).
+_gate_set_chunk_size = 2 ** 16
+
+
+class GateSet(object):
+    """
+    A set of gates evaluated together against the same data.
+
+    Evaluating the set extracts each channel from the data once. Threshold, interval and
+    quad gates are grouped by their channels and evaluated with broadcast comparisons
+    (all the thresholds of a channel at once). Other gates are evaluated one by one;
+    gates that appear several times (also within composite gates) are evaluated once.
+
+    Examples
+    --------
+    >>> gates = GateSet([ThresholdGate(t, 'Y2-A', 'above') for t in thresholds])
+    >>> membership, counts = gates.evaluate(sample.data)
+    """
+
+    def __init__(self, gates=None):
+        self.gates = list(gates) if gates is not None else []
+
+    def __repr__(self):
+        return '<GateSet {0}>'.format(self.names)
+
+    def __len__(self):
+        return len(self.gates)
+
+    def __iter__(self):
+        return iter(self.gates)
+
+    def __getitem__(self, i):
+        return self.gates[i]
+
+    @property
+    def names(self):
+        """ Names of the gates. """
+        return [gate.name for gate in self.gates]
+
+    def add(self, gate):
+        """ Adds a gate to the set. """
+        self.gates.append(gate)
+
+    def evaluate(self, data, packed=False):
+        """
+        Identifies the events that pass each of the gates.
+
+        Parameters
+        ----------
+        data : DataFrame | FCMeasurement
+        packed : bool
+            If True, the membership matrix is bit-packed along the events
+            (see numpy.packbits), to reduce its memory by 8.
+
+        Returns
+        -------
+        membership : array
+            Boolean array of shape (number of events, number of gates); element (i, j)
+            is True if event i passes gate j.
+            If packed, an array of uint8 of shape (ceil(number of events / 8), number of gates);
+            numpy.unpackbits(membership, axis=0)[:number of events] gives the boolean array.
+        counts : Series
+            Number of events that pass each gate (indexed by the names of the gates).
+        """
+        if hasattr(data, 'get_data'):  # Measurement
+            data = data.get_data()
+        for c in set(c for gate in self.gates for c in _get_gate_channels(gate) or []):
+            if c not in data:
+                raise ValueError(
+                    'Trying to filter based on channel {channel}, which is not present in the data.'.format(
+                        channel=c))
+
+        n = len(data)
+        membership = numpy.zeros((n, len(self.gates)), dtype=bool)
+        groups, others = self._group_gates()
+
+        columns = {}  # Each channel is extracted once
+        for key in groups:
+            for c in key[1:]:
+                if c not in columns:
+                    columns[c] = numpy.asarray(data[c], dtype=float)
+
+        for start in range(0, n, _gate_set_chunk_size):
+            stop = start + _gate_set_chunk_size
+            for key, (positions, params) in groups.items():
+                values = [columns[c][start:stop, numpy.newaxis] for c in key[1:]]
+                membership[start:stop, positions] = _evaluate_group(key[0], values, params)
+
+        memo = {}
+        for positions, _ in groups.values():
+            for j in positions:
+                memo.setdefault(_get_gate_key(self.gates[j]), membership[:, j])
+        for j in others:
+            gate = self.gates[j]
+            if isinstance(gate, CompositeGate):
+                idx = gate._identify(data, memo)
+            else:
+                key = _get_gate_key(gate)
+                if key not in memo:
+                    memo[key] = gate._identify(data)
+                idx = memo[key]
+            membership[:, j] = numpy.asarray(idx, dtype=bool)
+
+        counts = Series(membership.sum(axis=0), index=self.names)
+        if packed:
+            membership = numpy.packbits(membership, axis=0)
+        return membership, counts
+
+    def counts(self, data):
+        """ Returns the number of events in the data (DataFrame | FCMeasurement) that pass each gate. """
+        return self.evaluate(data)[1]
+
+    def _group_gates(self):
+        """
+        Groups the threshold, interval and quad gates by type and channels.
+
+        Returns
+        -------
+        groups : OrderedDict
+            (type, channel, ...) -> (positions of the gates in the set, parameters of the gates)
+        others : list
+            Positions of the gates that are not grouped.
+        """
+        groups = collections.OrderedDict()
+        others = []
+        for j, gate in enumerate(self.gates):
+            if type(gate) is ThresholdGate:
+                key = ('threshold', gate.channels[0])
+                params = (gate.vert, gate.region == 'below')
+            elif type(gate) is IntervalGate:
+                key = ('interval', gate.channels[0])
+                params = (gate.vert[0], gate.vert[1], gate.region == 'out')
+            elif type(gate) is QuadGate:
+                key = ('quad',) + tuple(gate.channels)
+                params = (gate.vert[0], gate.vert[1], 'left' in gate.region, 'bottom' in gate.region)
+            else:
+                others.append(j)
+                continue
+            positions, group_params = groups.setdefault(key, ([], []))
+            positions.append(j)
+            group_params.append(params)
+        return groups, others
+
+
+def _evaluate_group(kind, values, params):
+    """
+    Evaluates gates of the same kind and channels with broadcast comparisons.
+
+    Parameters
+    ----------
+    kind : ['threshold' | 'interval' | 'quad']
+    values : list of arrays
+        Values of the channels, each of shape (number of events, 1).
+    params : list of tuples
+        Parameters of each gate (see GateSet._group_gates).
+
+    Returns
+    -------
+    Boolean array of shape (number of events, number of gates).
+    """
+    params = [numpy.array(p) for p in zip(*params)]
+    with numpy.errstate(invalid='ignore'):  # Comparisons with NaN are False, as in the gates
+        if kind == 'threshold':
+            threshold, below = params
+            return (values[0] >= threshold) ^ below.astype(bool)
+        elif kind == 'interval':
+            lower, upper, out = params
+            return ((values[0] >= lower) & (values[0] <= upper)) ^ out.astype(bool)
+        else:
+            x, y, left, bottom = params
+            return ((values[0] >= x) ^ left.astype(bool)) & ((values[1] >= y) ^ bottom.astype(bool))
+
+
+def _get_gate_channels(gate):
+    """ Returns the names of the channels used by the gate, or None if they are not known. """
+    if hasattr(gate, 'gates'):  # CompositeGate
+        channels = []
+        for g in gate.gates:
+            gate_channels = _get_gate_channels(g)
+            if gate_channels is None:
+                return None
+            channels.extend(c for c in gate_channels if c not in channels)
+        return channels
+    channels = to_list(getattr(gate, 'channels', None))
+    return list(channels) if channels is not None else None
+
+
+# Number of events tested at once against the edges of a polygon (bounds the temporary memory).
+_polygon_chunk_size = 2 ** 16
+# Polygons with at least this many edges test the points sorted by y (see _Polygon._crossings).
+_polygon_sort_edges = 16
+
+
+class _Polygon(object):
+    """
+    A polygon prepared for testing which points it contains.
+
+    Points outside the bounding box of the polygon are rejected first. The remaining points
+    are tested with the crossing number (even-odd) rule, vectorized over the points and
+    processed in chunks. Optionally (resolution), points are first looked up in a raster of
+    the bounding box, so that only points in cells crossed by an edge need the full test.
+    """
+
+    def __init__(self, vert, resolution=None):
+        self.vert = numpy.array(vert, dtype=float)
+        self.resolution = resolution
+        self.x0, self.y0 = self.vert[:, 0], self.vert[:, 1]
+        self.x1, self.y1 = numpy.roll(self.x0, -1), numpy.roll(self.y0, -1)
+        self.xmin, self.ymin = self.vert.min(axis=0)
+        self.xmax, self.ymax = self.vert.max(axis=0)
+        self._raster = None
+
+    def contains(self, x, y, chunk_size=None):
+        """
+        Returns a boolean array indicating which of the points (x, y) lie inside the polygon.
+
+        Parameters
+        ----------
+        x, y : array
+            Coordinates of the points.
+        chunk_size : int | None
+            Number of points tested at once. If None, _polygon_chunk_size is used.
+        """
+        if chunk_size is None:
+            chunk_size = _polygon_chunk_size
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        inside = numpy.zeros(len(x), dtype=bool)
+        candidates = numpy.flatnonzero((x >= self.xmin) & (x <= self.xmax) &
+                                       (y >= self.ymin) & (y <= self.ymax))
+
+        raster = self._get_raster() if len(candidates) else None
+        if raster is not None:
+            cell_inside, cell_exact = raster
+            i, j = self._get_cells(x[candidates], y[candidates])
+            exact = cell_exact[i, j]
+            known = ~exact
+            inside[candidates[known]] = cell_inside[i[known], j[known]]
+            candidates = candidates[exact]
+
+        for start in range(0, len(candidates), chunk_size):
+            idx = candidates[start:start + chunk_size]
+            inside[idx] = self._crossings(x[idx], y[idx])
+        return inside
+
+    def _crossings(self, x, y):
+        """
+        Crossing number test: a point is inside if a horizontal ray cast from it crosses
+        an odd number of edges. For polygons with many edges, the points are sorted by y,
+        so that each edge is only tested against the points within the span of the edge.
+        """
+        if len(self.x0) < _polygon_sort_edges:
+            order = None
+        else:
+            order = numpy.argsort(y, kind='mergesort')
+            x, y = x[order], y[order]
+        crossings = numpy.zeros(len(x), dtype=bool)
+        for x0, y0, x1, y1 in zip(self.x0, self.y0, self.x1, self.y1):
+            if y0 == y1:
+                continue  # Horizontal edges are never crossed
+            if order is None:
+                straddles = (y0 > y) != (y1 > y)
+                x_cross = x0 + (y - y0) * ((x1 - x0) / (y1 - y0))
+                crossings ^= straddles & (x < x_cross)
+                continue
+            # The edge straddles the points with min(y0, y1) <= y < max(y0, y1)
+            start, stop = numpy.searchsorted(y, sorted((y0, y1)))
+            if start < stop:
+                x_cross = x0 + (y[start:stop] - y0) * ((x1 - x0) / (y1 - y0))
+                crossings[start:stop] ^= x[start:stop] < x_cross
+        if order is None:
+            return crossings
+        inside = numpy.empty(len(x), dtype=bool)
+        inside[order] = crossings
+        return inside
+
+    def _get_cells(self, x, y):
+        """ Returns the raster cells (row, column) of the points (which must lie in the bounding box). """
+        n = self.resolution
+        i = ((x - self.xmin) * (n / (self.xmax - self.xmin))).astype(int)
+        j = ((y - self.ymin) * (n / (self.ymax - self.ymin))).astype(int)
+        return numpy.minimum(i, n - 1), numpy.minimum(j, n - 1)
+
+    def _get_raster(self):
+        """
+        Returns (cell_inside, cell_exact), resolution x resolution boolean arrays over the
+        bounding box, or None if the polygon has no raster.
+        cell_exact marks the cells touched by an edge (and their neighbours), whose points are
+        tested exactly; every other cell lies entirely inside (or outside) the polygon,
+        as given by cell_inside.
+        """
+        n = self.resolution
+        if not n or self.xmax == self.xmin or self.ymax == self.ymin:
+            return None
+        if self._raster is None:
+            dx = (self.xmax - self.xmin) / n
+            dy = (self.ymax - self.ymin) / n
+            centers_x = self.xmin + dx * (numpy.arange(n) + 0.5)
+            centers_y = self.ymin + dy * (numpy.arange(n) + 0.5)
+            cx, cy = numpy.meshgrid(centers_x, centers_y, indexing='ij')
+            cell_inside = self._crossings(cx.ravel(), cy.ravel()).reshape(n, n)
+
+            # Sample the edges at steps shorter than a cell, and mark the cells of the samples
+            # and their neighbours, so that every cell crossed by an edge is marked.
+            cell_exact = numpy.zeros((n, n), dtype=bool)
+            for x0, y0, x1, y1 in zip(self.x0, self.y0, self.x1, self.y1):
+                steps = int(numpy.ceil(max(abs(x1 - x0) / dx, abs(y1 - y0) / dy))) + 1
+                t = numpy.linspace(0, 1, steps + 1)
+                i, j = self._get_cells(x0 + t * (x1 - x0), y0 + t * (y1 - y0))
+                cell_exact[i, j] = True
+            dilated = cell_exact.copy()
+            dilated[1:, :] |= cell_exact[:-1, :]
+            dilated[:-1, :] |= cell_exact[1:, :]
+            dilated[:, 1:] |= dilated[:, :-1].copy()
+            dilated[:, :-1] |= dilated[:, 1:].copy()
+            self._raster = cell_inside, dilated
+        return self._raster
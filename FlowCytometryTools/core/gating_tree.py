@@ -0,0 +1,278 @@
+"""
+Hierarchies of gated populations.
+
+A GatingTree holds named populations, each defined by a gate that is applied
+to the events of its parent population (e.g., singlets -> live -> CD3+ -> CD4+).
+The events of each population are identified once per measurement and cached,
+so populations that share parents do not re-evaluate the parent gates.
+"""
+from __future__ import absolute_import
+
+import collections
+import pickle
+import weakref
+
+from pandas import DataFrame, Series
+
+
+def _gate_signature(gate):
+    """ Returns a value that changes when the gate is modified (e.g., when its vertices are moved). """
+    try:
+        return pickle.dumps(gate, 2)
+    except Exception:
+        return id(gate)
+
+
+class GatingTree(object):
+    """
+    A tree of named populations.
+
+    Each population is defined by a gate and a parent population
+    (None for populations gated directly from all the events of a measurement).
+
+    The events that belong to each population are cached per measurement (as positions
+    of events in the data). Each gate is evaluated once per measurement,
+    on the events of its parent population only. Replacing a gate (set_gate),
+    or modifying it in place (e.g., changing its vertices), invalidates the
+    cached events of the population and of its descendants.
+
+    Examples
+    --------
+    >>> tree = GatingTree()
+    >>> tree.add('cells', PolyGate(vert, ['FSC-A', 'SSC-A']))
+    >>> tree.add('bright', ThresholdGate(1000, 'Y2-A', 'above'), parent='cells')
+    >>> tree.add('dim', ThresholdGate(1000, 'Y2-A', 'below'), parent='cells')
+    >>> tree.counts(plate)  # Counts of each population in each well
+    >>> bright = tree.get_population(sample, 'bright')
+    """
+
+    def __init__(self):
+        self._gates = collections.OrderedDict()
+        self._parents = {}
+        # measurement -> {population: (data signature, gate signature, rows)}
+        self._cache = weakref.WeakKeyDictionary()
+
+    def __repr__(self):
+        return '<GatingTree {0}>'.format(list(self._gates.keys()))
+
+    def __len__(self):
+        return len(self._gates)
+
+    def __contains__(self, name):
+        return name in self._gates
+
+    def __getitem__(self, name):
+        """ Returns the gate of the population. """
+        return self._gates[name]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = None  # Cached events are not pickled
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = weakref.WeakKeyDictionary()
+
+    @property
+    def populations(self):
+        """ Names of the populations (parents before their children). """
+        return list(self._gates.keys())
+
+    def add(self, name, gate, parent=None):
+        """
+        Adds a population.
+
+        Parameters
+        ----------
+        name : hashable
+            Name of the population.
+        gate : gate
+            The gate that defines the population (applied to the events of the parent).
+        parent : hashable | None
+            Name of the parent population.
+            If None, the gate is applied to all the events of the measurements.
+        """
+        if name in self._gates:
+            raise ValueError('Population "{0}" already exists. Use set_gate to replace its gate.'.format(name))
+        if parent is not None and parent not in self._gates:
+            raise ValueError('Unknown parent population "{0}".'.format(parent))
+        self._gates[name] = gate
+        self._parents[name] = parent
+
+    def set_gate(self, name, gate):
+        """ Replaces the gate of a population, invalidating the cached events of its subtree. """
+        self._check_population(name)
+        self._gates[name] = gate
+        self.invalidate(name)
+
+    def remove(self, name):
+        """ Removes a population and its descendants. """
+        self._check_population(name)
+        self.invalidate(name)
+        for population in [name] + self.descendants(name):
+            del self._gates[population]
+            del self._parents[population]
+
+    def parent(self, name):
+        self._check_population(name)
+        return self._parents[name]
+
+    def children(self, name):
+        """ Names of the populations whose parent is the given population (None for the roots). """
+        return [p for p in self._gates if self._parents[p] == name]
+
+    def descendants(self, name):
+        """ Names of all the populations below the given population. """
+        descendants = []
+        for child in self.children(name):
+            descendants.append(child)
+            descendants.extend(self.descendants(child))
+        return descendants
+
+    def path(self, name):
+        """ Names of the populations from the root down to the given population. """
+        self._check_population(name)
+        path = []
+        while name is not None:
+            path.insert(0, name)
+            name = self._parents[name]
+        return path
+
+    def invalidate(self, name=None):
+        """
+        Removes the cached events of the population and of its descendants
+        (of all populations if None is given).
+        """
+        if name is None:
+            self._cache.clear()
+            return
+        populations = [name] + self.descendants(name)
+        for cached in self._cache.values():
+            for population in populations:
+                cached.pop(population, None)
+
+    def evaluate(self, measurement, populations=None):
+        """
+        Identifies the events that belong to the populations.
+
+        Parameters
+        ----------
+        measurement : FCMeasurement
+        populations : hashable | list | None
+            Names of populations. If None is given, all populations are used.
+
+        Returns
+        -------
+        OrderedDict mapping each population to the positions of its events
+        in the data of the measurement (as an array of ints).
+        If the measurement is a view (see FCMeasurement.gate), the positions
+        refer to the data that the view refers to.
+        """
+        return self._evaluate(measurement, populations)[0]
+
+    def _evaluate(self, measurement, populations=None):
+        """
+        Same as evaluate, but also returns the data that the positions refer to,
+        if it was read to identify the events (None if all the positions were cached).
+        """
+        if populations is None:
+            populations = self.populations
+        elif not isinstance(populations, list):
+            populations = [populations]
+
+        cached = self._cache.setdefault(measurement, {})
+        data_signature = measurement._get_data_signature()
+        columns = []  # Filled with (data, rows, columns) of the data when the data is needed
+        evaluated = {}  # population -> (rows, whether the rows were recomputed)
+
+        def get_rows(name):
+            if name not in evaluated:
+                evaluated[name] = _get_rows(name)
+            return evaluated[name]
+
+        def _get_rows(name):
+            gate = self._gates[name]
+            parent = self._parents[name]
+            parent_rows, parent_changed = get_rows(parent) if parent is not None else (None, False)
+            signature = _gate_signature(gate)
+            entry = cached.get(name)
+            if (not parent_changed and entry is not None and
+                    entry[0] == data_signature and entry[1] == signature):
+                return entry[2], False
+            if not columns:
+                data, rows = measurement._get_data_and_rows()
+                columns.append((data, rows,
+                                collections.OrderedDict((c, data[c].values) for c in data.columns)))
+            if parent is None:
+                parent_rows = columns[0][1]
+            rows = measurement._gate_columns(columns[0][2], parent_rows, gate)
+            cached[name] = (data_signature, signature, rows)
+            return rows, True
+
+        result = collections.OrderedDict()
+        for name in populations:
+            self._check_population(name)
+            result[name] = get_rows(name)[0]
+        return result, (columns[0][0] if columns else None)
+
+    def get_population(self, measurement, name, materialize=False):
+        """
+        Returns a measurement holding the events of the population.
+
+        Parameters
+        ----------
+        measurement : FCMeasurement
+        name : hashable
+            Name of the population.
+        materialize : bool
+            If False, the returned measurement is a view (see FCMeasurement.gate).
+            Otherwise, the events of the population are copied into its data.
+        """
+        result, data = self._evaluate(measurement, name)
+        rows = result[name]
+        if data is None:  # The events were identified from the cache
+            data, _ = measurement._get_data_and_rows()
+        new = measurement._copy_sharing_data()
+        new._data = data
+        new._rows = rows
+        new.queue = []
+        new.history = measurement.history + measurement.queue + [
+            ('gate', {'gate': self._gates[p], 'apply_now': True, 'materialize': False})
+            for p in self.path(name)]
+        if materialize:
+            new.set_data(data=new.get_data())
+        return new
+
+    def counts(self, measurements, populations=None):
+        """
+        Returns the number of events in each population.
+
+        Parameters
+        ----------
+        measurements : FCMeasurement | FCCollection
+        populations : hashable | list | None
+            Names of populations. If None is given, all populations are used.
+
+        Returns
+        -------
+        Series (for a measurement) indexed by the populations, or
+        DataFrame (for a collection) indexed by the measurement keys with a column per population.
+        """
+        if populations is None:
+            populations = self.populations
+        elif not isinstance(populations, list):
+            populations = [populations]
+
+        if not isinstance(measurements, collections.Mapping):
+            rows = self.evaluate(measurements, populations)
+            return Series([len(r) for r in rows.values()], index=populations)
+
+        keys = sorted(measurements.keys())
+        counts = [[len(rows) for rows in self.evaluate(measurements[key], populations).values()]
+                  for key in keys]
+        return DataFrame(counts, index=keys, columns=populations)
+
+    def _check_population(self, name):
+        if name not in self._gates:
+            raise KeyError('Unknown population "{0}".'.format(name))
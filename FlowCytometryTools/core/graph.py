@@ -6,6 +6,8 @@ from GoreUtilities.util import to_list
 import numpy
 import pylab as pl
 import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.transforms import ScaledTranslation
 from FlowCytometryTools.core.common_doc import doc_replacer
 import warnings
 
@@ -13,7 +15,7 @@ import warnings
 @doc_replacer
 def plotFCM(data, channel_names, kind='histogram', ax=None,
             autolabel=True, xlabel_kwargs={}, ylabel_kwargs={},
-            colorbar=False, grid=False,
+            colorbar=False, grid=False, max_points=None, seed=0,
             **kwargs):
     """
     Plots the sample on the current axis.
@@ -22,7 +24,8 @@ def plotFCM(data, channel_names, kind='histogram', ax=None,
 
     Parameters
     ----------
-    data : DataFrame
+    data : DataFrame | Histogram
+        The events, or their histogram (see Histogram) for kind='histogram'.
     {graph_plotFCM_pars}
     {common_plot_ax}
 
@@ -43,27 +46,47 @@ def plotFCM(data, channel_names, kind='histogram', ax=None,
         kwargs.setdefault('histtype', 'stepfilled')
         kwargs.setdefault('bins', 200)  # Do not move above
 
-        x = data[channel_names[0]].values
-        if len(x) >= 1:
-            if (len(x) == 1) and isinstance(kwargs['bins'], int):
-                # Only needed for hist (not hist2d) due to hist function doing
-                # excessive input checking
-                warnings.warn("One of the data sets only has a single event. " \
-                              "This event won't be plotted unless the bin locations" \
-                              " are explicitely provided to the plotting function. ")
+        if isinstance(data, Histogram):
+            hist = data
+            if hist.events == 0:
                 return None
-            plot_output = ax.hist(x, **kwargs)
         else:
-            return None
+            x = data[channel_names[0]].values
+            if len(x) >= 1:
+                if (len(x) == 1) and isinstance(kwargs['bins'], int):
+                    # Only needed for hist (not hist2d) due to hist function doing
+                    # excessive input checking
+                    warnings.warn("One of the data sets only has a single event. " \
+                                  "This event won't be plotted unless the bin locations" \
+                                  " are explicitely provided to the plotting function. ")
+                    return None
+            else:
+                return None
+            hist = Histogram.from_data(data, channel_names, bins=kwargs['bins'],
+                                       range=kwargs.get('range'), weights=kwargs.get('weights'))
+        for key in ('bins', 'range', 'weights'):
+            kwargs.pop(key, None)
+        plot_output = hist.plot(ax=ax, **kwargs)
 
     elif len(channel_names) == 2:
-        x = data[channel_names[0]].values  # value of first channel
-        y = data[channel_names[1]].values  # value of second channel
-
-        if len(x) == 0:
+        if isinstance(data, Histogram):
+            if kind != 'histogram':
+                raise ValueError("Binned data can only be plotted with kind='histogram'")
+            if data.events == 0:
+                return None
+        elif len(data) == 0:
             # Don't draw a plot if there's no data
             return None
+
         if kind == 'scatter':
+            x = data[channel_names[0]].values  # value of first channel
+            y = data[channel_names[1]].values  # value of second channel
+            if max_points is not None and len(x) > max_points:
+                keep = stratified_sample(x, y, max_points, seed=seed)
+                x, y = x[keep], y[keep]
+                for key in ('c', 's'):  # Per-event colors and sizes
+                    if numpy.ndim(kwargs.get(key)) == 1 and len(kwargs[key]) == len(data):
+                        kwargs[key] = numpy.asarray(kwargs[key])[keep]
             kwargs.setdefault('edgecolor', 'none')
             plot_output = ax.scatter(x, y, **kwargs)
         elif kind == 'histogram':
@@ -71,7 +94,14 @@ def plotFCM(data, channel_names, kind='histogram', ax=None,
             kwargs.setdefault('cmin', 1)
             kwargs.setdefault('cmap', pl.cm.copper)
             kwargs.setdefault('norm', matplotlib.colors.LogNorm())
-            plot_output = ax.hist2d(x, y, **kwargs)
+            if isinstance(data, Histogram):
+                hist = data
+            else:
+                hist = Histogram.from_data(data, channel_names, bins=kwargs['bins'],
+                                           range=kwargs.get('range'), weights=kwargs.get('weights'))
+            for key in ('bins', 'range', 'weights'):
+                kwargs.pop(key, None)
+            plot_output = hist.plot(ax=ax, **kwargs)
             mappable = plot_output[-1]
 
             if colorbar:
@@ -79,7 +109,7 @@ def plotFCM(data, channel_names, kind='histogram', ax=None,
         else:
             raise ValueError("Not a valid plot type. Must be 'scatter', 'histogram'")
 
-    pl.grid(grid)
+    ax.grid(grid)
 
     if autolabel:
         y_label_text = 'Counts' if len(channel_names) == 1 else channel_names[1]
@@ -87,3 +117,374 @@ def plotFCM(data, channel_names, kind='histogram', ax=None,
         ax.set_ylabel(y_label_text, **ylabel_kwargs)
 
     return plot_output
+
+
+def stratified_sample(x, y, max_points, seed=0, bins=64):
+    """
+    Returns the positions of at most max_points events, sampled so that the density
+    of the events is preserved.
+
+    The plane is divided into bins x bins cells (spanning the range of the events).
+    Each occupied cell keeps one event, and the remaining points are shared among
+    the cells in proportion to their number of events. So dense regions are
+    sampled uniformly, while sparse regions (e.g., outliers) remain visible.
+
+    Parameters
+    ----------
+    x, y : array
+        Values of the events.
+    max_points : int
+        Maximal number of events sampled.
+    seed : int | None
+        Seed of the random number generator (None for a different sample each time).
+    bins : int
+        Number of cells along each axis.
+
+    Returns
+    -------
+    Sorted array of positions of the sampled events.
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    n = len(x)
+    if n <= max_points:
+        return numpy.arange(n)
+    random_state = numpy.random.RandomState(seed)
+
+    finite = numpy.flatnonzero(numpy.isfinite(x) & numpy.isfinite(y))  # Events that can be drawn
+    if len(finite) <= max_points:
+        return finite
+    x, y = x[finite], y[finite]
+    edges = get_bin_edges(bins, ['x', 'y'], range=[(x.min(), x.max()), (y.min(), y.max())])
+    cells = _bin_indices(x, edges[0])[0] * bins + _bin_indices(y, edges[1])[0]
+    counts = numpy.bincount(cells, minlength=bins * bins)
+    occupied = numpy.count_nonzero(counts)
+    if occupied >= max_points:
+        return numpy.sort(random_state.choice(finite, max_points, replace=False))
+
+    quota = numpy.where(counts > 0, 1 + counts * (max_points - occupied) // len(finite), 0)
+    # Events in random order, grouped by cell: each cell keeps its first quota events.
+    order = random_state.permutation(len(finite))
+    order = order[numpy.argsort(cells[order], kind='mergesort')]
+    sorted_cells = cells[order]
+    rank = numpy.arange(len(order)) - numpy.searchsorted(sorted_cells, sorted_cells)
+    return numpy.sort(finite[order[rank < quota[sorted_cells]]])
+
+
+class Histogram(object):
+    """
+    Counts of events in bins along one or two channels.
+
+    The counts are accumulated block by block (add), so histograms can be computed
+    from data that is streamed from the file (see FCMeasurement.iter_data), and
+    plotted (again and again) without binning the events again.
+
+    The events of each block are assigned integer bin indices (computed arithmetically
+    for evenly spaced bins), which are counted with numpy.bincount.
+    As in numpy.histogram, each bin includes its left edge, the last bin includes
+    its right edge, and events outside the edges (or NaN) are not counted.
+
+    Parameters
+    ----------
+    channels : str | list of str
+        Names of the channels (1 or 2).
+    edges : ndarray | list of ndarray
+        Edges of the bins along each channel.
+
+    Examples
+    --------
+    >>> hist = Histogram(['FSC-A', 'SSC-A'], [linspace(0, 10000, 201), linspace(0, 10000, 201)])
+    >>> for block in sample.iter_data(channels=['FSC-A', 'SSC-A']):
+    ...     hist.add(block)
+    >>> hist.plot()
+    """
+
+    def __init__(self, channels, edges):
+        self.channels = to_list(channels)
+        if len(self.channels) == 1 and numpy.ndim(edges[0]) == 0:
+            edges = [edges]
+        if len(edges) != len(self.channels):
+            raise ValueError('The edges of the bins must be given for each channel.')
+        self.edges = [numpy.asarray(e, dtype=float) for e in edges]
+        for e in self.edges:
+            if e.ndim != 1 or len(e) < 2 or numpy.any(numpy.diff(e) <= 0):
+                raise ValueError('The edges of the bins must be increasing, with at least 2 edges.')
+        self.counts = numpy.zeros([len(e) - 1 for e in self.edges], dtype=numpy.int64)
+        #: Number of events added (including events outside the bins)
+        self.events = 0
+
+    def __repr__(self):
+        return '<Histogram {0} {1}>'.format(self.channels, self.counts.shape)
+
+    @property
+    def ndim(self):
+        return len(self.channels)
+
+    @classmethod
+    def from_data(cls, data, channel_names, bins=200, range=None, weights=None):
+        """
+        Returns the histogram of the data.
+
+        Parameters
+        ----------
+        data : DataFrame
+        channel_names : str | list of str
+        bins : int | ndarray | [int | ndarray]
+            Number of bins or edges of the bins (for each channel).
+        range : None | (min, max) | [(min, max), (min, max)]
+            Range of the bins along each channel (when the number of bins is given).
+            If None, the range of the data is used.
+        weights : None | array
+            Weight of each event.
+        """
+        channel_names = to_list(channel_names)
+
+        def get_range(channel):
+            values = numpy.asarray(data[channel], dtype=float)
+            values = values[numpy.isfinite(values)]
+            return (values.min(), values.max()) if len(values) else (0., 1.)
+
+        edges = get_bin_edges(bins, channel_names, range=range, get_range=get_range)
+        return cls(channel_names, edges).add(data, weights=weights)
+
+    def add(self, data, weights=None):
+        """
+        Adds the events of a block of data to the counts.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Must contain the channels of the histogram.
+        weights : None | array
+            Weight of each event (the counts become floats).
+
+        Returns
+        -------
+        The histogram (self).
+        """
+        index, valid = None, None
+        for c, e in zip(self.channels, self.edges):
+            i, inside = _bin_indices(numpy.asarray(data[c], dtype=float), e)
+            if index is None:
+                index, valid = i, inside
+            else:
+                index = index * (len(e) - 1) + i
+                valid &= inside
+        self.events += len(index)
+        if weights is not None:
+            weights = numpy.asarray(weights, dtype=float)[valid]
+            if self.counts.dtype != float:
+                self.counts = self.counts.astype(float)
+        counts = numpy.bincount(index[valid], weights=weights, minlength=self.counts.size)
+        self.counts += counts.reshape(self.counts.shape).astype(self.counts.dtype)
+        return self
+
+    def plot(self, ax=None, **kwargs):
+        """
+        Plots the counts on the axes: as a histogram (ax.hist, with the counts as weights)
+        for 1 channel, or as an image (ax.pcolormesh) for 2 channels.
+
+        Parameters
+        ----------
+        ax : axes | None
+        kwargs :
+            Passed to ax.hist (1d) or ax.pcolormesh (2d).
+            In 2d, bins whose counts are below cmin (or above cmax) are not drawn,
+            and the counts are normalized to a density if normed is True (as in ax.hist2d).
+
+        Returns
+        -------
+        Output of ax.hist (1d), or the same output as ax.hist2d (2d):
+        (counts, x edges, y edges, mesh).
+        """
+        if ax is None:
+            ax = pl.gca()
+
+        if self.ndim == 1:
+            edges = self.edges[0]
+            return ax.hist(edges[:-1], bins=edges, weights=self.counts, **kwargs)
+
+        cmin = kwargs.pop('cmin', None)
+        cmax = kwargs.pop('cmax', None)
+        normed = kwargs.pop('normed', False)
+        xedges, yedges = self.edges
+        h = self.counts.astype(float)
+        if normed:
+            h /= h.sum() * numpy.outer(numpy.diff(xedges), numpy.diff(yedges))
+        if cmin is not None:
+            h[h < cmin] = numpy.nan
+        if cmax is not None:
+            h[h > cmax] = numpy.nan
+        mesh = ax.pcolormesh(xedges, yedges, numpy.ma.masked_invalid(h.T), **kwargs)
+        ax.set_xlim(xedges[0], xedges[-1])
+        ax.set_ylim(yedges[0], yedges[-1])
+        return h, xedges, yedges, mesh
+
+
+def get_bin_edges(bins, channel_names, range=None, get_range=None):
+    """
+    Returns the edges of the bins along each channel.
+
+    Parameters
+    ----------
+    bins : int | ndarray | [int | ndarray]
+        Number of bins or edges of the bins (for each channel).
+        For a single channel, a list holding its number of bins or edges may be given.
+    channel_names : list of str
+    range : None | (min, max) | [(min, max)] | [(min, max), (min, max)]
+        Range of the bins along each channel (when the number of bins is given).
+    get_range : callable
+        Called with a channel name to get its range, if range is None.
+
+    Returns
+    -------
+    list of ndarray
+    """
+    ndim = len(channel_names)
+    # Edges hold at least 2 values, so a list of length 1 holds the bins of the (only) channel
+    if numpy.ndim(bins) == 0:
+        bins = [bins] * ndim
+    elif ndim == 1 and len(bins) != 1:
+        bins = [bins]
+    if range is not None and ndim == 1 and len(range) != 1:
+        range = [range]
+
+    edges = []
+    for i, (c, b) in enumerate(zip(channel_names, bins)):
+        if numpy.ndim(b) != 0:
+            edges.append(numpy.asarray(b, dtype=float))
+            continue
+        lower, upper = range[i] if range is not None else get_range(c)
+        if lower == upper:
+            lower, upper = lower - 0.5, upper + 0.5
+        edges.append(numpy.linspace(lower, upper, int(b) + 1))
+    return edges
+
+
+def _bin_indices(x, edges):
+    """
+    Returns the indices of the bins of the values (x), and a mask of the values that lie within the edges.
+    """
+    n = len(edges) - 1
+    with numpy.errstate(invalid='ignore'):
+        inside = (x >= edges[0]) & (x <= edges[-1])
+    index = numpy.zeros(len(x), dtype=numpy.intp)
+    values = x[inside]
+    widths = numpy.diff(edges)
+    if numpy.allclose(widths, widths[0], rtol=1e-9, atol=0):
+        # Evenly spaced bins: the bin is computed arithmetically, then corrected
+        # for rounding errors of values on the edges.
+        i = ((values - edges[0]) * (n / (edges[-1] - edges[0]))).astype(numpy.intp)
+        numpy.clip(i, 0, n - 1, out=i)
+        i -= values < edges[i]
+        i += (values >= edges[i + 1]) & (i != n - 1)
+    else:
+        i = numpy.searchsorted(edges, values, side='right') - 1
+        i[i == n] = n - 1  # The last bin includes its right edge
+    index[inside] = i
+    return index, inside
+
+
+def create_grid_figure(row_num, col_num, row_labels=None, col_labels=None,
+                       xlabel=None, ylabel=None,
+                       row_label_xoffset=None, col_label_yoffset=None,
+                       hide_tick_labels=True, hide_tick_lines=True,
+                       hspace=0, wspace=0,
+                       row_labels_kwargs={}, col_labels_kwargs={},
+                       figsize=None, dpi=None):
+    """
+    Creates a figure with a 2d matrix of subplots, laid out as in
+    GoreUtilities.graph.create_grid_layout (used by grid plots).
+
+    Unlike create_grid_layout, the figure is created off-screen, without pyplot:
+    it is not registered as a pyplot figure, and the current pyplot figure and axes
+    are not modified. It can be saved with figure.savefig (e.g., to PNG, SVG or PDF).
+
+    Parameters
+    ----------
+    row_num, col_num : int
+        Number of rows and columns of subplots.
+    row_labels, col_labels : list of str | None
+        Labels of the rows and columns.
+    xlabel, ylabel : str | None
+        Labels of the axes (drawn on the top right subplot).
+    row_label_xoffset, col_label_yoffset : float | None
+        Additional offsets (in inches) of the row and column labels.
+    hide_tick_labels, hide_tick_lines : bool
+        Whether to hide the ticks of the subplots (except the top right one).
+    hspace, wspace : float
+        Space between the subplots.
+    row_labels_kwargs, col_labels_kwargs : dict
+        Passed to the text commands that draw the row and column labels.
+    figsize : (float, float) | None
+        Size of the figure in inches.
+    dpi : float | None
+
+    Returns
+    -------
+    figure, main axes (invisible, can be used to label the figure), 2d array of subplots
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(right=0.85, top=0.85, wspace=wspace, hspace=hspace)
+
+    ax_main = fig.add_subplot(111)
+    for spine in ax_main.spines.values():
+        spine.set_visible(False)
+    ax_main.patch.set_alpha(0)
+    for axis in ('x', 'y'):
+        _set_ticks(ax_main, axis, lines=False, labels=False)
+
+    offset_row_labels = ScaledTranslation(-0.10 - (row_label_xoffset or 0), 0, fig.dpi_scale_trans)
+    offset_col_labels = ScaledTranslation(0, -0.10 - (col_label_yoffset or 0), fig.dpi_scale_trans)
+    row_labels_kwargs = dict(row_labels_kwargs)
+    row_labels_kwargs.setdefault('horizontalalignment', 'right')
+    row_labels_kwargs.setdefault('verticalalignment', 'center')
+    row_labels_kwargs.setdefault('size', 'x-large')
+    col_labels_kwargs = dict(col_labels_kwargs)
+    col_labels_kwargs.setdefault('horizontalalignment', 'center')
+    col_labels_kwargs.setdefault('verticalalignment', 'top')
+    col_labels_kwargs.setdefault('size', 'x-large')
+
+    ax_subplots = numpy.empty((row_num, col_num), dtype=object)
+    for row in range(row_num):
+        for col in range(col_num):
+            ax = fig.add_subplot(row_num, col_num, row * col_num + col + 1)
+            ax_subplots[row, col] = ax
+            if row_labels is not None and col == 0:
+                ax.text(0, 0.5, '{0}'.format(row_labels[row]), transform=ax.transAxes + offset_row_labels,
+                        **row_labels_kwargs)
+            if col_labels is not None and row == row_num - 1:
+                ax.text(0.5, 0, '{0}'.format(col_labels[col]), transform=ax.transAxes + offset_col_labels,
+                        **col_labels_kwargs)
+            if row == 0 and col == col_num - 1:
+                # Ticks and labels of the axes are drawn on the top right subplot
+                _set_ticks(ax, 'x', lines=bool(xlabel), labels=bool(xlabel), position='top')
+                _set_ticks(ax, 'y', lines=bool(ylabel), labels=bool(ylabel), position='right')
+                if xlabel:
+                    ax.xaxis.set_label_position('top')
+                    ax.set_xlabel(xlabel, fontsize='large', labelpad=5)
+                if ylabel:
+                    ax.yaxis.set_label_position('right')
+                    ax.set_ylabel(ylabel, fontsize='large', labelpad=5)
+            else:
+                for axis in ('x', 'y'):
+                    _set_ticks(ax, axis, lines=not hide_tick_lines, labels=not hide_tick_labels)
+    return fig, ax_main, ax_subplots
+
+
+def _set_ticks(ax, axis, lines, labels, position=None):
+    """
+    Shows or hides the tick lines and labels of an axis (position: None for the default side,
+    'top' or 'right' to draw them on the other side).
+    Unlike setting the visibility of the ticks, this also applies to ticks created later.
+    """
+    sides = {'x': ('bottom', 'top'), 'y': ('left', 'right')}[axis]
+    other = position in ('top', 'right')
+    params = {}
+    for i, side in enumerate(sides):
+        params[side] = lines and (i == 1) == other
+        params['label' + side] = labels and (i == 1) == other
+    ax.tick_params(axis=axis, which='both', **params)
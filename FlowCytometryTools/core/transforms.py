@@ -16,12 +16,15 @@ TODO:
 '''
 from __future__ import division
 
+import pickle
+import threading
 import warnings
+from collections import OrderedDict
 
-from numpy import (log, log10, exp, where, sign, vectorize, apply_along_axis,
-                   min, max, linspace, logspace, r_, abs, asarray)
+from numpy import (log, log10, exp, where, sign, apply_along_axis,
+                   min, max, linspace, logspace, r_, abs, asarray, minimum, interp,
+                   isfinite, flatnonzero, errstate, finfo, arange)
 from numpy.lib.shape_base import apply_along_axis
-from scipy.optimize import brentq
 from scipy.interpolate import InterpolatedUnivariateSpline
 
 from GoreUtilities import BaseObject
@@ -30,6 +33,10 @@ from GoreUtilities.util import to_list
 _machine_max = 2 ** 18
 _l_mmax = log10(_machine_max)
 _display_max = 10 ** 4
+_max_lut_size = 2 ** 22  # Largest range of integer values transformed through a lookup table
+_max_cached_luts = 32
+_luts = OrderedDict()
+_luts_lock = threading.RLock()
 
 
 def linear(x, old_range, new_range):
@@ -186,13 +193,62 @@ def _x_for_spln(x, nx, log_spacing):
     return x_spln
 
 
+_hlog_xtol = 2e-12  # Same tolerances as the scipy.optimize.brentq defaults
+_hlog_rtol = 4 * finfo(float).eps
+_hlog_maxiter = 100
+_hlog_lut_size = 1025
+_hlog_luts = {}
+
+
+def _get_hlog_lut(b, r, d):
+    '''
+    Return a lookup table (x, y) of the hlog transformation on the range [0, r] of transformed values.
+    Used to seed the numerical solver.
+    '''
+    key = (b, r, d)
+    if key not in _hlog_luts:
+        y = linspace(0, r, _hlog_lut_size)
+        _hlog_luts[key] = (hlog_inv(y, b, r, d), y)
+    return _hlog_luts[key]
+
+
+def _solve_hlog(x, b, r, d):
+    '''
+    Numerically solve hlog_inv(y, b, r, d) = x for y, for a 1d array of non-negative values x.
+
+    For y >= 0, hlog_inv(y) - x = 10**(a*y) + a*b*y - 1 - x (with a = d/r) is increasing and convex,
+    so Newton iterations converge monotonically (from the first iteration on) regardless of the seed.
+    The seed is interpolated from a lookup table, or for values beyond the table,
+    is the upper bound min(log10(1+x)/a, x/(a*b)) of the solution.
+    '''
+    a = 1. * d / r
+    lut_x, lut_y = _get_hlog_lut(b, r, d)
+    y = x.copy()  # Non finite values are returned as is
+    active = flatnonzero(isfinite(x))
+    xa = x[active]
+    with errstate(divide='ignore'):
+        upper = minimum(log10(1 + xa) / a, xa / (a * b))
+    y[active] = where(xa <= lut_x[-1], interp(xa, lut_x, lut_y), upper)
+
+    for _ in range(_hlog_maxiter):
+        if not active.size:
+            break
+        ya = y[active]
+        e = 10 ** (a * ya)
+        step = (e + a * b * ya - 1 - x[active]) / (a * (log(10) * e + b))
+        y[active] = ya - step
+        active = active[abs(step) > _hlog_xtol + _hlog_rtol * abs(ya)]
+    return y
+
+
 def _make_hlog_numeric(b, r, d):
     '''
     Return a function that numerically computes the hlog transformation for given parameter values.
     '''
-    hlog_obj = lambda y, x, b, r, d: hlog_inv(y, b, r, d) - x
-    find_inv = vectorize(lambda x: brentq(hlog_obj, -2 * r, 2 * r,
-                                          args=(x, b, r, d)))
+    def find_inv(x):
+        x = asarray(x, dtype=float)
+        s = sign(x)
+        return s * _solve_hlog((s * x).ravel(), b, r, d).reshape(x.shape)
     return find_inv
 
 
@@ -299,6 +355,65 @@ def transform_frame(frame, transform, columns=None, direction='forward',
     return transformed
 
 
+class SplineRegistry(object):
+    '''
+    Memoizes the splines used to approximate named transformations.
+
+    Splines are keyed by (transform name, direction, args, kwargs, xmin, xmax, nx, log_spacing, spline kwargs),
+    so that transforming several measurements (or plates) with the same parameters
+    constructs the spline only once. The registry can be saved to disk and loaded
+    in later sessions.
+    '''
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._splines = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._splines)
+
+    def __contains__(self, key):
+        return key in self._splines
+
+    def get(self, key):
+        ''' Returns the spline stored under key or None. '''
+        with self._lock:
+            spln = self._splines.pop(key, None)
+            if spln is not None:
+                self._splines[key] = spln
+            return spln
+
+    def put(self, key, spln):
+        with self._lock:
+            self._splines.pop(key, None)
+            self._splines[key] = spln
+            while len(self._splines) > self.max_size:
+                self._splines.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._splines.clear()
+
+    def save(self, path):
+        ''' Saves the splines to a file. '''
+        with self._lock:
+            splines = list(self._splines.items())
+        with open(path, 'wb') as f:
+            pickle.dump(splines, f, 2)
+
+    def load(self, path):
+        ''' Adds the splines saved in a file (see save) to the registry. '''
+        with open(path, 'rb') as f:
+            splines = pickle.load(f)
+        for key, spln in splines:
+            self.put(key, spln)
+
+
+#: Registry shared by all the transformations in the process.
+spline_registry = SplineRegistry()
+
+
 class Transformation(BaseObject):
     '''
     A transformation for flow cytometry data.
@@ -329,7 +444,7 @@ class Transformation(BaseObject):
     def __repr__(self):
         return repr(self.name)
 
-    def transform(self, x, use_spln=False, **kwargs):
+    def transform(self, x, use_spln=False, lut_range=None, **kwargs):
         '''
         Apply transform to x
 
@@ -342,6 +457,10 @@ class Transformation(BaseObject):
             True - transform using the spline specified in self.slpn.
                     If self.spln is None, set the spline.
             False - transform using self.tfun
+        lut_range: int | None
+            If x holds integers in the range [0, lut_range), transform
+            using a lookup table of the (exact) transformed values of all the integers in the range
+            (see get_lut). Otherwise, this argument is ignored.
         kwargs:
             Keyword arguments to be passed to self.set_spline.
             Only used if use_spln=True & self.spln=None.
@@ -350,6 +469,10 @@ class Transformation(BaseObject):
         -------
         Array of transformed values.
         '''
+        if lut_range is not None and lut_range <= _max_lut_size:
+            x = asarray(x)
+            if x.dtype.kind in 'ui' and x.size and x.min() >= 0 and x.max() < lut_range:
+                return self.get_lut(lut_range).take(x)
         x = asarray(x, dtype=float)
         n = x.shape[0]
         if use_spln:
@@ -361,6 +484,32 @@ class Transformation(BaseObject):
 
     __call__ = transform
 
+    def get_lut(self, n):
+        '''
+        Return the lookup table of the transformed values of the integers 0, ..., n-1.
+
+        Tables are cached per transformation function, parameters and n.
+        '''
+        try:
+            key = (self.tfun, self.args, tuple(sorted(self.kwargs.items())), n)
+            hash(key)
+        except TypeError:  # Unhashable parameters
+            return asarray(self.tfun(arange(n, dtype=float), *self.args, **self.kwargs), dtype=float)
+        with _luts_lock:
+            lut = _luts.pop(key, None)
+            if lut is not None:
+                _luts[key] = lut  # Most recently used last
+                return lut
+        # Computed outside of the lock, so that other tables can be looked up meanwhile
+        lut = asarray(self.tfun(arange(n, dtype=float), *self.args, **self.kwargs), dtype=float)
+        lut.flags.writeable = False
+        with _luts_lock:
+            lut = _luts.pop(key, lut)  # Computed by another thread meanwhile
+            while len(_luts) >= _max_cached_luts:
+                _luts.popitem(last=False)
+            _luts[key] = lut
+        return lut
+
     @property
     def inverse(self):
         if self.tname is None:
@@ -380,7 +529,27 @@ class Transformation(BaseObject):
                 log_spacing = True
             else:
                 log_spacing = False
-        x_spln = _x_for_spln([xmin, xmax], nx, log_spacing)
-        y_spln = self(x_spln)
-        spln = InterpolatedUnivariateSpline(x_spln, y_spln, **kwargs)
+        key = self._get_spline_key(xmin, xmax, nx, log_spacing, kwargs)
+        spln = spline_registry.get(key) if key is not None else None
+        if spln is None:
+            x_spln = _x_for_spln([xmin, xmax], nx, log_spacing)
+            y_spln = self(x_spln)
+            spln = InterpolatedUnivariateSpline(x_spln, y_spln, **kwargs)
+            if key is not None:
+                spline_registry.put(key, spln)
         self.spln = spln
+
+    def _get_spline_key(self, xmin, xmax, nx, log_spacing, spline_kwargs):
+        '''
+        Returns the key of the spline in the spline registry,
+        or None if the spline should not be registered (unnamed transformation or unhashable parameters).
+        '''
+        if self.tname is None:
+            return None
+        key = (self.tname, self.direction, self.args, tuple(sorted(self.kwargs.items())),
+               float(xmin), float(xmax), nx, bool(log_spacing), tuple(sorted(spline_kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
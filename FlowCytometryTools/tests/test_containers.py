@@ -0,0 +1,385 @@
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import pandas
+
+from FlowCytometryTools import (FCMeasurement, FCCollection, FCPlate, ThresholdGate, PolyGate,
+                                test_data_dir, test_data_file)
+from FlowCytometryTools.core.bases import DataCache, Measurement, data_cache, _uses_processes
+from FlowCytometryTools.core.containers import _reservoir_sample
+from FlowCytometryTools.IO.cache import disk_cache
+
+base_path = os.path.dirname(os.path.realpath(__file__))
+corrupted_file = os.path.join(base_path, 'data', 'FlowCytometers', 'corrupted', 'corrupted.fcs')
+
+
+class TestFCMeasurement(unittest.TestCase):
+    def setUp(self):
+        self.sample = FCMeasurement(ID='test', datafile=test_data_file)
+        self.gate = ThresholdGate(1000, 'FSC-A', 'above')
+
+    def test_iter_data(self):
+        """ Blocks returned by iter_data reassemble to the full data """
+        blocks = list(self.sample.iter_data(chunk_events=3000))
+        self.assertEqual([len(block) for block in blocks], [3000, 3000, 3000, 1000])
+        self.assertTrue(pandas.concat(blocks).equals(self.sample.data))
+
+        blocks = list(self.sample.iter_data(chunk_events=3000, channels=['FSC-A', 'SSC-A']))
+        self.assertEqual(list(blocks[0].columns), ['FSC-A', 'SSC-A'])
+
+    def test_iter_data_applies_queue(self):
+        """ Queued gates are applied to each block """
+        queued = self.sample.gate(self.gate, apply_now=False)
+        expected = self.sample.gate(self.gate).data
+        self.assertTrue(pandas.concat(queued.iter_data(chunk_events=3000)).equals(expected))
+
+    def test_iter_data_does_not_depend_on_chunks(self):
+        """ Queued transforms give the same events for any block size """
+        queued = (self.sample.transform('hlog', channels=['FSC-A', 'SSC-A'], b=100, apply_now=False)
+                  .transform('tlog', channels=['B1-A'], th=10, apply_now=False))
+        expected = self.sample.transform('hlog', channels=['FSC-A', 'SSC-A'], b=100, use_spln=False)
+        expected = expected.transform('tlog', channels=['B1-A'], th=10, use_spln=False).data
+        blocks = [pandas.concat(queued.iter_data(chunk_events=n)) for n in (700, 3000, 10000)]
+        for data in blocks[1:]:
+            self.assertTrue(data.equals(blocks[0]))
+        # The fused transforms hold float64 values (see FCMeasurement._apply_fused)
+        numpy.testing.assert_allclose(blocks[0].values, expected.values, rtol=1e-6)
+
+    def test_fused_queue(self):
+        """ Queued transforms and gates applied in one pass give the same data """
+        gate2 = PolyGate([(0, 0), (10 ** 5, 0), (10 ** 5, 10 ** 5), (0, 10 ** 5)], ['FSC-A', 'SSC-A'])
+        expected = (self.sample.transform('hlog', channels=['B1-A'], b=10)
+                    .gate(self.gate).gate(self.gate | gate2)
+                    .transform('hlog', channels=['FSC-A', 'SSC-A'], return_all=False))
+        queued = (self.sample.transform('hlog', channels=['B1-A'], b=10, apply_now=False)
+                  .gate(self.gate, apply_now=False).gate(self.gate | gate2, apply_now=False)
+                  .transform('hlog', channels=['FSC-A', 'SSC-A'], return_all=False, apply_now=False))
+        result = queued.apply_queued()
+        self.assertEqual(len(result.history), 4)
+        self.assertEqual(result.queue, [])
+        self.assertTrue(result.data.index.equals(expected.data.index))
+        self.assertEqual(list(result.data.columns), ['FSC-A', 'SSC-A'])
+        numpy.testing.assert_allclose(result.data.values, expected.data.values, rtol=1e-6)
+
+    def test_apply_fused_default(self):
+        """ Without an override of _apply_fused, fusable actions are applied one at a time """
+        class Sample(FCMeasurement):
+            _apply_fused = Measurement._apply_fused
+
+        sample = Sample(ID='test', datafile=test_data_file)
+        queued = sample.gate(self.gate, apply_now=False).transform('hlog', channels=['FSC-A'],
+                                                                   use_spln=False, apply_now=False)
+        expected = self.sample.gate(self.gate).transform('hlog', channels=['FSC-A'], use_spln=False)
+        result = queued.apply_queued()
+        self.assertEqual([a for a, _ in result.history], ['gate', 'transform'])
+        self.assertTrue(result.data.equals(expected.data))
+
+    def test_copy_shares_data(self):
+        """ Derived measurements share the data, while copies do not """
+        sample = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        raw = sample.data.copy()
+        copy = sample.copy()
+        self.assertFalse(copy.data is sample.data)
+        copy.data['FSC-A'] = 0
+        self.assertTrue(sample.data.equals(raw))
+
+        transformed = sample.transform('hlog', channels=['FSC-A'], use_spln=False)
+        self.assertTrue(sample.data.equals(raw))
+        self.assertFalse(transformed.data['FSC-A'].equals(raw['FSC-A']))
+
+        queued = sample.gate(self.gate, apply_now=False)
+        self.assertTrue(queued._data is sample._data)
+        self.assertFalse(queued.meta is sample.meta)
+
+    def test_gated_view(self):
+        """ Gating with materialize=False gives a view of the data """
+        sample = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        gate2 = ThresholdGate(2000, 'SSC-A', 'above')
+        expected = sample.gate(self.gate).gate(gate2)
+        view = sample.gate(self.gate, materialize=False).gate(gate2, materialize=False)
+        self.assertTrue(view._data is sample.data)
+        self.assertEqual(view.counts, expected.counts)
+        self.assertTrue(view.data.equals(expected.data))
+        self.assertTrue(pandas.concat(view.iter_data(chunk_events=300)).equals(expected.data))
+
+        queued = sample.gate(self.gate, apply_now=False, materialize=False)
+        queued = queued.gate(gate2, apply_now=False, materialize=False).apply_queued()
+        self.assertTrue(queued._rows is not None)
+        self.assertTrue(queued.data.equals(expected.data))
+
+        transformed = view.transform('hlog', channels=['FSC-A'], use_spln=False)
+        self.assertTrue(transformed._rows is None)
+        self.assertEqual(transformed.counts, expected.counts)
+
+    def test_counts(self):
+        """ counts does not require the data to be held in memory """
+        self.assertEqual(self.sample.counts, 10000)
+        self.assertTrue(self.sample._data is None)
+
+        queued = self.sample.gate(self.gate, apply_now=False)
+        self.assertEqual(queued.counts, self.sample.gate(self.gate).counts)
+
+    def test_counts_match_data_with_spline(self):
+        """ Values computed from the data agree with it when queued transforms use a spline """
+        gate = ThresholdGate(-4182.96854, 'FSC-A', 'above')  # Between the spline and the exact value
+        queued = (self.sample.transform('hlog', channels=['FSC-A'], b=100, apply_now=False)
+                  .gate(gate, apply_now=False))
+        streamed = sum(block.shape[0] for block in queued.iter_data())
+        self.assertEqual(queued.counts, len(queued.data))
+        self.assertNotEqual(queued.counts, streamed)
+        self.assertEqual(queued.histogram('FSC-A', bins=10).counts.sum(), len(queued.data))
+
+    def test_subsample_seed(self):
+        """ Random subsamples are reproducible with a seed and are taken by position """
+        sample = self.sample.subsample(500, seed=3)
+        self.assertEqual(sample.counts, 500)
+        self.assertTrue(sample.data.equals(self.sample.subsample(500, seed=3).data))
+        self.assertFalse(sample.data.index.equals(self.sample.subsample(500, seed=4).data.index))
+
+        positions = numpy.random.RandomState(3).choice(10000, 500, replace=False)
+        self.assertTrue(sample.data.equals(self.sample.data.take(positions)))
+
+        ordered = self.sample.subsample(500, seed=3, sort=True)
+        self.assertTrue(ordered.data.index.is_monotonic_increasing)
+        self.assertTrue(ordered.data.equals(self.sample.data.take(numpy.sort(positions))))
+
+    def test_subsample_stream(self):
+        """ Reservoir sampling from the file gives events of the data """
+        data = self.sample.data
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        subsample = sample.subsample(700, seed=1, sort=True, stream=True)
+        self.assertTrue(sample._data is None)
+        self.assertEqual(subsample.counts, 700)
+        self.assertEqual(len(set(subsample.data.index)), 700)
+        self.assertTrue(subsample.data.equals(data.loc[subsample.data.index]))
+        self.assertTrue(subsample.data.index.is_monotonic_increasing)
+        self.assertTrue(subsample.data.equals(sample.subsample(700, seed=1, sort=True, stream=True).data))
+
+        self.assertEqual(sample.subsample(0.25, stream=True).counts, 2500)
+        self.assertEqual(sample.subsample(20000, stream=True, auto_resize=True).counts, 10000)
+        with self.assertRaises(ValueError):
+            sample.subsample(20000, stream=True)
+
+        gated = sample.gate(self.gate, apply_now=False).subsample(100, stream=True)
+        self.assertTrue((gated.data['FSC-A'] > 1000).all())
+
+    def test_reservoir_is_uniform(self):
+        """ Each event is in the reservoir sample with the same probability """
+        blocks = [pandas.DataFrame({'x': numpy.arange(i, i + 10)}, index=numpy.arange(i, i + 10))
+                  for i in range(0, 40, 10)]
+        hits = numpy.zeros(40)
+        for seed in range(2000):
+            hits[_reservoir_sample(blocks, 8, seed=seed)['x'].values] += 1
+        numpy.testing.assert_allclose(hits / 2000., 0.2, atol=0.04)
+
+
+class TestFCPlate(unittest.TestCase):
+    def test_from_dir_parallel(self):
+        """ Reading the files concurrently gives the same collection """
+        expected = FCPlate.from_dir('plate', test_data_dir)
+        for executor in ('threads', 'processes'):
+            plate = FCPlate.from_dir('plate', test_data_dir, n_jobs=2, executor=executor, readdata=True)
+            self.assertEqual(sorted(plate.keys()), sorted(expected.keys()))
+            self.assertEqual(plate.get_positions(), expected.get_positions())
+            for key in plate:
+                self.assertTrue(plate[key]._data is not None)
+                self.assertTrue(plate[key].data.equals(expected[key].data))
+
+    def test_executors(self):
+        """ Gating and counting give the same result with each of the executors """
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        gate = ThresholdGate(1000, 'FSC-A', 'above')
+        expected = plate.gate(gate).counts()
+        for executor in ('threads', 'processes'):
+            gated = plate.gate(gate, apply_now=False, executor=executor, n_jobs=2)
+            self.assertTrue(gated.counts(executor=executor, n_jobs=2).equals(expected))
+
+    def test_worker_payload(self):
+        """ Data that can be rebuilt from the datafile is not sent to worker processes """
+        gate = ThresholdGate(1000, 'FSC-A', 'above')
+        sample = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        derived = [sample, sample.gate(gate, materialize=False),
+                   sample.transform('hlog', channels=['FSC-A'], b=100).gate(gate),
+                   sample.gate(gate, apply_now=False).apply_queued()]
+        for measurement in derived:
+            payload = pickle.loads(pickle.dumps(measurement._get_worker_payload(), 2))
+            self.assertTrue(payload._data is None)
+            rebuilt = payload._from_worker_payload()
+            self.assertEqual([a for a, _ in rebuilt.history], [a for a, _ in measurement.history])
+            numpy.testing.assert_allclose(rebuilt.data.values, measurement.data.values, rtol=1e-6)
+
+        modified = sample.copy()
+        modified.data = sample.data * 2
+        self.assertTrue(modified.gate(gate)._get_worker_payload()._data is not None)
+        self.assertTrue(sample.subsample(100)._get_worker_payload()._data is not None)
+
+        plate = FCPlate.from_dir('plate', test_data_dir, readdata=True)
+        expected = plate.gate(gate).counts()
+        self.assertTrue(plate.gate(gate, executor='processes', n_jobs=2).counts().equals(expected))
+
+    def test_existing_pool(self):
+        """ An existing pool of processes is used as executor='processes' """
+        plate = FCPlate.from_dir('plate', test_data_dir, readdata=True)
+        gate = ThresholdGate(1000, 'FSC-A', 'above')
+        expected = plate.gate(gate).counts()
+        pool = multiprocessing.Pool(2)
+        try:
+            gated = plate.gate(gate, executor=pool)
+            self.assertTrue(gated.counts(executor=pool).equals(expected))
+            self.assertTrue(_uses_processes(pool))
+            with self.assertRaises(ValueError):
+                plate.counts(setdata=True, executor=pool)
+        finally:
+            pool.close()
+            pool.join()
+        thread_pool = ThreadPool(2)
+        try:
+            self.assertFalse(_uses_processes(thread_pool))
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+    def test_from_files_error_reports_path(self):
+        """ The path of a file that cannot be parsed is part of the error """
+        datafiles = [test_data_file, corrupted_file]
+        with self.assertRaises(IOError) as context:
+            FCCollection.from_files('collection', datafiles, parser=lambda x: x, n_jobs=2)
+        self.assertTrue(corrupted_file in str(context.exception))
+        self.assertTrue('corrupted' in str(context.exception).split('\n')[1])
+
+    def test_subsample_seed(self):
+        """ Seeded subsampling of a collection is reproducible and differs between wells """
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        subsampled = plate.subsample(100, seed=0)
+        again = plate.subsample(100, seed=0, executor='processes', n_jobs=2)
+        for key in plate:
+            self.assertTrue(subsampled[key].data.equals(again[key].data))
+        keys = sorted(plate.keys())
+        self.assertFalse(numpy.array_equal(subsampled[keys[0]].data.index, subsampled[keys[1]].data.index))
+
+    def test_copy(self):
+        """ Copies of collections do not share the data, while gated collections do """
+        plate = FCPlate.from_dir('plate', test_data_dir, readdata=True)
+        key = sorted(plate.keys())[0]
+        copy = plate.copy()
+        self.assertFalse(copy[key].data is plate[key].data)
+        gated = plate.gate(ThresholdGate(1000, 'FSC-A', 'above'), materialize=False)
+        self.assertTrue(gated[key]._data is plate[key]._data)
+
+    def test_channel_ranges(self):
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        channels = ['FSC-A', 'SSC-A']
+        ranges = plate.channel_ranges(channels)
+        data = pandas.concat([plate[key].data[channels] for key in plate])
+        self.assertEqual(list(ranges.index), channels)
+        self.assertTrue(numpy.allclose(ranges['min'], data.min()))
+        self.assertTrue(numpy.allclose(ranges['max'], data.max()))
+        self.assertEqual(len(plate._channel_ranges), 1)
+        self.assertTrue(plate.channel_ranges(channels).equals(ranges))  # From the cache
+
+        ranges = plate.channel_ranges(channels, use_meta=True)
+        self.assertEqual(list(ranges['min']), [0, 0])
+        self.assertEqual(list(ranges['max']), [262144, 262144])
+
+        # Replacing the queued actions (with as many actions) invalidates the cached ranges
+        gated = plate.gate(ThresholdGate(10 ** 5, 'FSC-A', 'below'), apply_now=False)
+        self.assertTrue(gated.channel_ranges('FSC-A').loc['FSC-A', 'max'] < 10 ** 5)
+        for key in gated:
+            gated[key].queue = [('gate', {'gate': ThresholdGate(10 ** 5, 'FSC-A', 'above'),
+                                          'apply_now': True, 'materialize': True})]
+        self.assertTrue(gated.channel_ranges('FSC-A').loc['FSC-A', 'min'] > 10 ** 5)
+
+
+class TestDataCache(unittest.TestCase):
+    def tearDown(self):
+        data_cache.resize(0)
+        data_cache.clear()
+
+    def test_lru_eviction(self):
+        cache = DataCache(max_bytes=100)
+        cache.put('a', numpy.zeros(40, dtype='u1'))
+        cache.put('b', numpy.zeros(40, dtype='u1'))
+        cache.get('a')
+        cache.put('c', numpy.zeros(30, dtype='u1'))  # Does not fit together with a and b
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_measurement_data_is_cached(self):
+        data_cache.resize(10 ** 8)
+        gate = ThresholdGate(1000, 'FSC-A', 'above')
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        gated = sample.gate(gate, apply_now=False)
+
+        expected = gated.get_data()
+        misses = data_cache.misses
+        self.assertTrue(gated.get_data() is expected)
+        self.assertEqual(data_cache.misses, misses)
+        self.assertTrue(data_cache.hits >= 1)
+
+        # Transforming must not modify the cached data
+        raw = sample.get_data().copy()
+        sample.transform('hlog', channels=['FSC-A'], use_spln=False)
+        self.assertTrue(sample.get_data().equals(raw))
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        disk_cache.set_path(self.cache_dir)
+
+    def tearDown(self):
+        disk_cache.clear()
+        disk_cache.set_path(None)
+        shutil.rmtree(self.cache_dir)
+
+    def test_measurement_is_read_from_cache(self):
+        expected = FCMeasurement(ID='test', datafile=test_data_file).data
+        self.assertEqual((disk_cache.hits, disk_cache.misses), (0, 2))  # data and meta
+
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        self.assertTrue(sample.data.equals(expected))
+        self.assertEqual(int(sample.meta['$TOT']), 10000)
+        self.assertEqual((disk_cache.hits, disk_cache.misses), (2, 2))
+
+        sample = FCMeasurement(ID='test', datafile=test_data_file,
+                               readdata_kwargs={'channels': ['SSC-A', 'FSC-A']})
+        self.assertTrue(sample.data.equals(expected[['SSC-A', 'FSC-A']]))
+        self.assertEqual(int(sample.meta['$TOT']), 10000)
+        self.assertEqual((disk_cache.hits, disk_cache.misses), (4, 2))
+
+    def test_cached_data_is_memory_mapped(self):
+        """ Data read from the cache refers to the memory mapped cache file """
+        expected = FCMeasurement(ID='test', datafile=test_data_file).data  # Fills the cache
+        entry = disk_cache._get_entry_path(test_data_file, 'data', channel_naming='$PnS')
+        cache_file = os.path.realpath(os.path.join(entry, 'data.npy'))
+
+        def get_memmap(values):
+            while values is not None and not isinstance(values, numpy.memmap):
+                values = values.base
+            return values
+
+        for channels in (None, ['SSC-A', 'SSC-H']):
+            data = disk_cache.read_data(test_data_file, channels=channels)
+            memmap = get_memmap(data.values)
+            self.assertTrue(memmap is not None)
+            self.assertEqual(os.path.realpath(memmap.filename), cache_file)
+            self.assertTrue(numpy.shares_memory(data.values, memmap))
+
+        data = disk_cache.read_data(test_data_file)
+        data.iloc[:, 1] = 0  # Does not modify the cache
+        self.assertTrue(disk_cache.read_data(test_data_file).equals(expected))
+        data = disk_cache.read_data(test_data_file, channels=['SSC-A', 'FSC-A'])
+        self.assertTrue(data.equals(expected[['SSC-A', 'FSC-A']]))
+
+
+if __name__ == '__main__':
+    unittest.main()
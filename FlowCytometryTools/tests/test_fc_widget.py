@@ -0,0 +1,42 @@
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy
+
+from FlowCytometryTools import FCMeasurement, test_data_file
+from FlowCytometryTools.GUI.fc_widget import FCGateManager
+
+
+class TestFCGateManager(unittest.TestCase):
+    def setUp(self):
+        self.ax = plt.figure().add_subplot(111)
+        self.manager = FCGateManager(self.ax)
+        self.manager.load_measurement(FCMeasurement(ID='test', datafile=test_data_file))
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_density_image_is_reused(self):
+        manager = self.manager
+        manager.set_axes(['FSC-A', 'SSC-A'], None)
+        image = manager._plt_data[1]
+        hist = manager._histograms[(('FSC-A', 'SSC-A'), manager.bins, ())]
+
+        manager.change_axis(1, 'B1-A')
+        self.assertTrue(manager._plt_data[1] is image)
+        self.assertEqual(self.ax.get_ylabel(), 'B1-A')
+        expected = manager.sample.histogram(['FSC-A', 'B1-A'], bins=manager.bins).counts.T
+        numpy.testing.assert_array_equal(image.get_array().filled(0), expected)
+
+        manager.change_axis(1, 'SSC-A')  # From the cache
+        self.assertTrue(manager._get_histogram(['FSC-A', 'SSC-A']) is hist)
+        self.assertEqual(len(self.ax.images), 1)
+
+        manager.set_axes(['FSC-A'], None)  # 1d histogram
+        self.assertEqual(manager._plt_data, None)
+        manager.set_axes(['FSC-A', 'SSC-A'], None)
+        self.assertEqual(len(self.ax.images), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,20 @@
 from __future__ import print_function
 
 import os
+import pickle
 import timeit
 import unittest
 import warnings
 
 import numpy
 from numpy import array
+import pandas
 
 from fcsparser import parse as parse_fcs
 
+from FlowCytometryTools import FCMeasurement
+from FlowCytometryTools.IO.fcsreader import FCS_Parser, parse_fcs as parse_fcs_io
+
 base_path = os.path.dirname(os.path.realpath(__file__))
 
 file_formats = {
@@ -331,6 +336,89 @@ class TestFCSReader(unittest.TestCase):
                  -1.29600010e+01,   1.00000001e-01]], dtype=numpy.float32)
         self.assertTrue(check_data_segment('large fake fcs', values))
 
+class TestFCSParser(unittest.TestCase):
+    """ Tests for the FCS parser that ships with FlowCytometryTools (FlowCytometryTools.IO.fcsreader) """
+
+    def test_mmap_data_segment(self):
+        """ Memory mapped DATA segment matches the data read into memory """
+        for fname in file_formats.values():
+            meta, expected = parse_fcs_io(fname, output_format='ndarray')
+            meta, data = parse_fcs_io(fname, output_format='ndarray', mmap=True)
+            self.assertTrue(isinstance(data, numpy.memmap))
+            self.assertTrue(numpy.array_equal(data, expected))
+
+            meta, expected = parse_fcs_io(fname)
+            meta, data = parse_fcs_io(fname, mmap=True)
+            self.assertTrue(data.equals(expected))
+
+    def test_mmap_native_channels(self):
+        """ Channels of a big endian memory mapped file are converted to native byte order """
+        parser = FCS_Parser(file_formats['LSR II fcs 3.0'], mmap=True)
+        self.assertFalse(parser.data.dtype.isnative)
+
+        channel_names = parser.get_channel_names()
+        values = parser.get_channel_data(channel_names[1])
+        self.assertTrue(values.dtype.isnative)
+        self.assertTrue(numpy.array_equal(values, parser.data[:, 1]))
+        # The conversion is done once per channel
+        self.assertTrue(parser.get_channel_data(1) is values)
+
+    def test_read_channels(self):
+        """ Only the requested channels are decoded, in the requested order """
+        for fname in file_formats.values():
+            meta, expected = parse_fcs_io(fname)
+            channels = [expected.columns[3], expected.columns[1]]
+
+            meta, data = parse_fcs_io(fname, channels=channels)
+            self.assertTrue(data.equals(expected[channels]))
+
+            meta, data = parse_fcs_io(fname, channels=[3, 1], output_format='ndarray')
+            self.assertTrue(numpy.array_equal(data, expected[channels].values))
+
+        self.assertRaises(ValueError, parse_fcs_io, file_formats['mq fcs 3.1'], channels=['not a channel'])
+
+    def test_iter_chunks(self):
+        """ Blocks of events yielded by iter_chunks reassemble to the full data segment """
+        for fname in file_formats.values():
+            meta, expected = parse_fcs_io(fname)
+            parser = FCS_Parser(fname, read_data=False)
+
+            blocks = list(parser.iter_chunks(chunk_events=3000))
+            self.assertTrue(all(len(block) <= 3000 for block in blocks))
+            self.assertTrue(pandas.concat(blocks).equals(expected))
+
+            channels = list(expected.columns[:2])
+            blocks = list(parser.iter_chunks(chunk_events=3000, channels=channels, output_format='ndarray'))
+            self.assertTrue(numpy.array_equal(numpy.vstack(blocks), expected[channels].values))
+            self.assertTrue(parser._data is None)
+
+    def test_lazy_meta(self):
+        """ The lazily reformatted meta data matches the reformatted meta data """
+        for fname in file_formats.values():
+            expected = parse_fcs_io(fname, meta_data_only=True, reformat_meta=True)
+            meta = parse_fcs_io(fname, meta_data_only=True, reformat_meta='lazy')
+            self.assertTrue('_channels_' in meta)
+            self.assertEqual(meta['_channel_names_'], expected['_channel_names_'])
+            self.assertTrue(meta._channel_matrix is not None) # Not built yet
+
+            restored = pickle.loads(pickle.dumps(meta))
+            self.assertTrue(restored._channel_matrix is not None)
+            for m in (meta, restored):
+                self.assertEqual(set(m.keys()), set(expected.keys()))
+                self.assertEqual(len(m), len(expected))
+                self.assertTrue(m['_channels_'].equals(expected['_channels_']))
+            for m in (dict(parse_fcs_io(fname, meta_data_only=True, reformat_meta='lazy')),
+                      parse_fcs_io(fname, meta_data_only=True, reformat_meta='lazy').copy()):
+                self.assertEqual(type(m), dict)
+                self.assertEqual(set(m), set(expected))
+
+    def test_read_channels_from_measurement(self):
+        """ Channels specified in readdata_kwargs are passed on to the parser """
+        channels = ['FSC-A', 'SSC-A']
+        sample = FCMeasurement(ID='test', datafile=file_formats['LSR II fcs 3.0'],
+                               readdata_kwargs={'channels': channels})
+        self.assertEqual(list(sample.data.columns), channels)
+
 if __name__ == '__main__':
     import nose
     nose.runmodule(argv=[__file__,'-vvs','-x'],
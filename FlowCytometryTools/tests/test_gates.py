@@ -0,0 +1,181 @@
+import pickle
+import unittest
+
+import numpy
+import pandas
+
+from matplotlib.path import Path
+
+from FlowCytometryTools import (FCMeasurement, ThresholdGate, IntervalGate, PolyGate, EllipseGate,
+                                RectangleGate, test_data_file)
+from FlowCytometryTools import GateSet, QuadGate
+from FlowCytometryTools.core.gates import CompositeGate
+
+
+class CountingGate(ThresholdGate):
+    """ Threshold gate that counts how many times it is evaluated. """
+    evaluations = 0
+
+    def _identify(self, dataframe):
+        CountingGate.evaluations += 1
+        return super(CountingGate, self)._identify(dataframe)
+
+
+class TestCompositeGate(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.data = pandas.DataFrame(rng.uniform(0, 10, size=(1000, 3)), columns=['x', 'y', 'z'])
+        CountingGate.evaluations = 0
+
+    def test_repeated_gates_are_evaluated_once(self):
+        g1 = CountingGate(5, 'x', 'above')
+        g2 = CountingGate(3, 'y', 'above')
+        g3 = CountingGate(7, 'z', 'below')
+        gate = (g1 & g2) | (g1 & ~g3)
+        idx = gate._identify(self.data)
+        self.assertEqual(CountingGate.evaluations, 3)
+
+        x, y, z = self.data['x'], self.data['y'], self.data['z']
+        expected = ((x >= 5) & (y >= 3)) | ((x >= 5) & ~(z < 7))
+        self.assertTrue(numpy.array_equal(numpy.asarray(idx), expected.values))
+
+    def test_identical_gates_are_evaluated_once(self):
+        gate = CountingGate(5, 'x', 'above', name='a') & CountingGate(5, 'x', 'above', name='b')
+        gate._identify(self.data)
+        self.assertEqual(CountingGate.evaluations, 1)
+
+    def test_flattening(self):
+        g1 = ThresholdGate(5, 'x', 'above')
+        g2 = IntervalGate((2, 8), 'y', 'in')
+        g3 = ThresholdGate(4, 'z', 'below')
+        gate = (g1 & g2) & (g3 & g1)
+        self.assertEqual(gate._operands(), [g1, g2, g3, g1])
+        self.assertEqual(len(((g1 | g2) & g3)._operands()), 2)
+        expected = self.data[(self.data['x'] >= 5) & (self.data['y'] >= 2) &
+                             (self.data['y'] <= 8) & (self.data['z'] < 4)]
+        self.assertTrue(gate(self.data).equals(expected))
+
+
+class TestPolyGate(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.data = pandas.DataFrame(rng.uniform(-1, 11, size=(20000, 2)), columns=['x', 'y'])
+        # A star-shaped (non-convex) polygon
+        angles = numpy.linspace(0, 2 * numpy.pi, 40, endpoint=False)
+        radii = numpy.where(numpy.arange(40) % 2, 2, 5)
+        self.vert = list(zip(5 + radii * numpy.cos(angles), 5 + radii * numpy.sin(angles)))
+
+    def test_matches_matplotlib_path(self):
+        expected = Path(self.vert).contains_points(self.data.values)
+        for resolution in (None, 4, 64):
+            gate = PolyGate(self.vert, ['x', 'y'], resolution=resolution)
+            self.assertTrue(numpy.array_equal(gate._identify(self.data), expected))
+        gate = PolyGate(self.vert, ['x', 'y'], region='out')
+        self.assertTrue(numpy.array_equal(gate._identify(self.data), ~expected))
+
+    def test_prepared_polygon_follows_vertices(self):
+        gate = PolyGate(self.vert, ['x', 'y'])
+        gate._identify(self.data)
+        polygon = gate._polygon
+        gate._identify(self.data)
+        self.assertTrue(gate._polygon is polygon)
+
+        gate.vert = [(0, 0), (5, 0), (5, 5), (0, 5)]
+        expected = ((self.data['x'] >= 0) & (self.data['x'] <= 5) &
+                    (self.data['y'] >= 0) & (self.data['y'] <= 5))
+        self.assertTrue(numpy.array_equal(gate._identify(self.data), expected.values))
+
+        # The prepared polygon is not pickled
+        self.assertFalse('_polygon' in pickle.loads(pickle.dumps(gate)).__dict__)
+
+
+class TestAnalyticGates(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.data = pandas.DataFrame(rng.uniform(0, 10, size=(5000, 3)), columns=['x', 'y', 'z'])
+
+    def test_ellipse(self):
+        x, y = self.data['x'] - 5, self.data['y'] - 4
+        gate = EllipseGate((5, 4), (3, 1), ['x', 'y'])
+        expected = (x / 3) ** 2 + (y / 1) ** 2 <= 1
+        self.assertTrue(numpy.array_equal(gate._identify(self.data), expected.values))
+
+        rotated = EllipseGate((5, 4), (1, 3), ['x', 'y'], angle=90, region='out')
+        self.assertEqual((rotated._identify(self.data) != ~expected.values).sum(), 0)
+
+        rotated = EllipseGate((5, 4), (3, 1), ['x', 'y'], angle=30)
+        u = x * numpy.cos(numpy.pi / 6) + y * numpy.sin(numpy.pi / 6)
+        v = -x * numpy.sin(numpy.pi / 6) + y * numpy.cos(numpy.pi / 6)
+        expected = (u / 3) ** 2 + v ** 2 <= 1
+        self.assertTrue(numpy.array_equal(rotated._identify(self.data), expected.values))
+
+        with self.assertRaises(ValueError):
+            EllipseGate((5, 4), (3, 0), ['x', 'y'])
+
+    def test_rectangle(self):
+        gate = RectangleGate([(1, 6), (2, 8), (0, 5)], ['x', 'y', 'z'])
+        x, y, z = self.data['x'], self.data['y'], self.data['z']
+        expected = (x >= 1) & (x <= 6) & (y >= 2) & (y <= 8) & (z >= 0) & (z <= 5)
+        self.assertTrue(gate(self.data).equals(self.data[expected]))
+
+        rotated = RectangleGate([(2, 8), (3, 5)], ['x', 'y'], angle=90)
+        square = RectangleGate([(4, 6), (1, 7)], ['x', 'y'])
+        self.assertTrue(numpy.array_equal(rotated._identify(self.data), square._identify(self.data)))
+
+        with self.assertRaises(ValueError):
+            RectangleGate([(1, 6), (2, 8), (0, 5)], ['x', 'y', 'z'], angle=10)
+
+    def test_measurement(self):
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        box = RectangleGate([(0, 2000), (0, 5000)], ['FSC-A', 'SSC-A'])
+        ellipse = EllipseGate((0, 1000), (1000, 2000), ['FSC-A', 'SSC-A'], angle=45)
+        gated = sample.gate(box & ellipse)
+        data = sample.data
+        expected = data[box._identify(data) & ellipse._identify(data)]
+        self.assertTrue(gated.data.equals(expected))
+        self.assertTrue(0 < gated.counts < sample.counts)
+
+        import matplotlib.pyplot as plt
+        sample.plot(['FSC-A', 'SSC-A'], gates=[box, ellipse])
+        sample.plot(['SSC-A', 'FSC-A'], gates=[box, ellipse])
+        sample.plot('FSC-A', gates=[box])
+        plt.close('all')
+
+
+class TestGateSet(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.data = pandas.DataFrame(rng.uniform(0, 10, size=(1000, 3)), columns=['x', 'y', 'z'])
+        self.data.iloc[::50, 0] = numpy.nan
+        CountingGate.evaluations = 0
+
+    def test_matches_individual_gates(self):
+        t1 = ThresholdGate(5, 'x', 'above')
+        repeated = CountingGate(2, 'z', 'below')
+        gates = [t1, ThresholdGate(3, 'x', 'below'), ThresholdGate(4, 'y', 'above'),
+                 IntervalGate((2, 8), 'x', 'in'), IntervalGate((1, 3), 'x', 'out'),
+                 QuadGate((5, 5), ['x', 'y'], 'top left'), QuadGate((4, 6), ['x', 'y'], 'bottom right'),
+                 PolyGate([(0, 0), (10, 0), (0, 10)], ['y', 'z']),
+                 repeated, t1 & ~repeated]
+        gate_set = GateSet(gates)
+        membership, counts = gate_set.evaluate(self.data)
+        self.assertEqual(membership.shape, (1000, len(gates)))
+        self.assertEqual(CountingGate.evaluations, 1)
+        for j, gate in enumerate(gates):
+            expected = numpy.asarray(gate._identify(self.data), dtype=bool)
+            self.assertTrue(numpy.array_equal(membership[:, j], expected))
+        self.assertEqual(list(counts.index), gate_set.names)
+        self.assertEqual(list(counts), list(membership.sum(axis=0)))
+
+        packed, packed_counts = gate_set.evaluate(self.data, packed=True)
+        self.assertEqual(packed.shape, (125, len(gates)))
+        self.assertTrue(numpy.array_equal(numpy.unpackbits(packed, axis=0)[:1000].astype(bool), membership))
+        self.assertTrue(packed_counts.equals(counts))
+
+    def test_missing_channel(self):
+        with self.assertRaises(ValueError):
+            GateSet([ThresholdGate(5, 'w', 'above')]).evaluate(self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy
+
+from FlowCytometryTools import (FCMeasurement, FCPlate, GatingTree, ThresholdGate, PolyGate,
+                                test_data_dir, test_data_file)
+
+
+class TestGatingTree(unittest.TestCase):
+    def setUp(self):
+        self.sample = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        self.cells = PolyGate([(0, 0), (10 ** 5, 0), (10 ** 5, 10 ** 5), (0, 10 ** 5)], ['FSC-A', 'SSC-A'])
+        self.bright = ThresholdGate(1000, 'Y2-A', 'above')
+        self.dim = ThresholdGate(1000, 'Y2-A', 'below')
+        self.tree = GatingTree()
+        self.tree.add('cells', self.cells)
+        self.tree.add('bright', self.bright, parent='cells')
+        self.tree.add('dim', self.dim, parent='cells')
+
+    def test_populations(self):
+        self.assertEqual(self.tree.populations, ['cells', 'bright', 'dim'])
+        self.assertEqual(self.tree.path('dim'), ['cells', 'dim'])
+        self.assertEqual(self.tree.descendants('cells'), ['bright', 'dim'])
+        self.assertRaises(ValueError, self.tree.add, 'orphan', self.dim, parent='unknown')
+
+    def test_counts(self):
+        counts = self.tree.counts(self.sample)
+        expected_cells = self.sample.gate(self.cells)
+        self.assertEqual(counts['cells'], expected_cells.counts)
+        self.assertEqual(counts['bright'], expected_cells.gate(self.bright).counts)
+        self.assertEqual(counts['bright'] + counts['dim'], counts['cells'])
+
+        bright = self.tree.get_population(self.sample, 'bright')
+        self.assertTrue(bright.data.equals(expected_cells.gate(self.bright).data))
+
+    def test_get_population_reads_once(self):
+        """ The data read to identify the events is used for the population """
+        reads = []
+
+        class Sample(FCMeasurement):
+            def read_data(self, **kwargs):
+                reads.append(self.datafile)
+                return FCMeasurement.read_data(self, **kwargs)
+
+        queued = Sample(ID='test', datafile=test_data_file).gate(self.cells, apply_now=False)
+        bright = self.tree.get_population(queued, 'bright')
+        self.assertEqual(len(reads), 1)
+        self.assertTrue(bright.data.equals(self.sample.gate(self.cells).gate(self.bright).data))
+
+    def test_cache_invalidation(self):
+        rows = self.tree.evaluate(self.sample)
+        self.assertTrue(self.tree.evaluate(self.sample)['bright'] is rows['bright'])
+
+        # Modifying a gate in place invalidates its subtree only
+        self.bright.vert = 2000
+        new_rows = self.tree.evaluate(self.sample)
+        self.assertTrue(new_rows['cells'] is rows['cells'])
+        self.assertTrue(new_rows['dim'] is rows['dim'])
+        self.assertFalse(new_rows['bright'] is rows['bright'])
+        self.assertEqual(len(new_rows['bright']),
+                         self.sample.gate(self.cells).gate(self.bright).counts)
+
+        self.tree.set_gate('cells', ThresholdGate(500, 'FSC-A', 'above'))
+        new_rows = self.tree.evaluate(self.sample)
+        self.assertFalse(new_rows['dim'] is rows['dim'])
+
+        # Replacing the queued actions (with as many actions) invalidates the cached events
+        queued = self.sample.gate(ThresholdGate(5000, 'SSC-A', 'above'), apply_now=False)
+        rows = self.tree.evaluate(queued)
+        queued.queue = [('gate', {'gate': ThresholdGate(5000, 'SSC-A', 'below'),
+                                  'apply_now': True, 'materialize': True})]
+        new_rows = self.tree.evaluate(queued)
+        self.assertFalse(new_rows['cells'] is rows['cells'])
+        self.assertEqual(len(new_rows['cells']), queued.apply_queued().gate(self.tree['cells']).counts)
+
+    def test_plate_counts(self):
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        counts = self.tree.counts(plate)
+        self.assertEqual(list(counts.columns), ['cells', 'bright', 'dim'])
+        self.assertEqual(sorted(counts.index), sorted(plate.keys()))
+        for key in plate:
+            self.assertEqual(counts['bright'][key], plate[key].gate(self.cells).gate(self.bright).counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
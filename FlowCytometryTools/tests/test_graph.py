@@ -0,0 +1,208 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy
+import pandas
+
+from FlowCytometryTools import FCMeasurement, FCPlate, ThresholdGate, test_data_dir, test_data_file
+from FlowCytometryTools.core.graph import Histogram, plotFCM, stratified_sample
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.data = pandas.DataFrame(rng.normal(0, 1, size=(10000, 2)), columns=['x', 'y'])
+        self.data.iloc[:20, 0] = numpy.linspace(-2, 2, 21)[:20]  # Values on the edges of the bins
+        self.data.iloc[-5:, 1] = numpy.nan
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_matches_numpy(self):
+        x = self.data['x'].values
+        hist = Histogram.from_data(self.data, 'x', bins=20, range=(-2, 2))
+        self.assertTrue(numpy.array_equal(hist.counts, numpy.histogram(x, bins=20, range=(-2, 2))[0]))
+        self.assertEqual(hist.events, 10000)
+
+        edges = [-3, -1, -0.5, 0, 0.1, 2, 3]
+        hist = Histogram.from_data(self.data, 'x', bins=edges)
+        self.assertTrue(numpy.array_equal(hist.counts, numpy.histogram(x, bins=edges)[0]))
+
+        hist = Histogram.from_data(self.data, ['x', 'y'], bins=[30, edges])
+        finite = self.data.dropna()
+        expected = numpy.histogram2d(finite['x'], finite['y'],
+                                     bins=[numpy.linspace(x.min(), x.max(), 31), edges])[0]
+        self.assertTrue(numpy.array_equal(hist.counts, expected))
+
+    def test_accumulation(self):
+        edges = [numpy.linspace(-3, 3, 41), numpy.linspace(-3, 3, 21)]
+        hist = Histogram(['x', 'y'], edges)
+        for i in range(0, 10000, 3000):
+            hist.add(self.data.iloc[i:i + 3000])
+        expected = Histogram(['x', 'y'], edges).add(self.data)
+        self.assertTrue(numpy.array_equal(hist.counts, expected.counts))
+        self.assertEqual(hist.counts.sum(), expected.counts.sum())
+
+    def test_plot(self):
+        counts, xedges, yedges, mesh = plotFCM(self.data, ['x', 'y'], bins=50)
+        expected = plt.hist2d(self.data['x'].values[:-5], self.data['y'].values[:-5], bins=50, cmin=1)[0]
+        numpy.testing.assert_array_equal(counts, expected)
+
+        n = plotFCM(self.data, 'x', bins=50)[0]
+        numpy.testing.assert_array_equal(n, plt.hist(self.data['x'].values, bins=50)[0])
+
+
+class TestStratifiedSample(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        dense = rng.normal(0, 1, size=(50000, 2))
+        outliers = rng.uniform(20, 30, size=(10, 2))
+        self.x, self.y = numpy.concatenate([dense, outliers]).T
+
+    def test_sample(self):
+        keep = stratified_sample(self.x, self.y, 2000, seed=1)
+        self.assertTrue(len(keep) <= 2000)
+        self.assertTrue(len(keep) > 1800)
+        self.assertTrue(numpy.all(numpy.diff(keep) > 0))
+        self.assertEqual((keep >= 50000).sum(), 10)  # Outliers are kept
+        # The density is preserved
+        self.assertAlmostEqual(numpy.mean(numpy.abs(self.x[keep[keep < 50000]]) < 1), 0.68, delta=0.05)
+
+        self.assertTrue(numpy.array_equal(keep, stratified_sample(self.x, self.y, 2000, seed=1)))
+        self.assertFalse(numpy.array_equal(keep, stratified_sample(self.x, self.y, 2000, seed=2)))
+        self.assertEqual(len(stratified_sample(self.x[:100], self.y[:100], 2000)), 100)
+
+    def test_plot(self):
+        data = pandas.DataFrame({'x': self.x, 'y': self.y})
+        collection = plotFCM(data, ['x', 'y'], kind='scatter', max_points=1000, c=self.x)
+        self.assertTrue(len(collection.get_offsets()) <= 1000)
+        self.assertEqual(len(collection.get_array()), len(collection.get_offsets()))
+        plt.close('all')
+
+
+class TestMeasurementHistogram(unittest.TestCase):
+    def tearDown(self):
+        plt.close('all')
+
+    def test_histogram_is_cached(self):
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        hist = sample.histogram(['FSC-A', 'SSC-A'], bins=100)
+        self.assertTrue(sample._data is None)  # Streamed from the file
+        self.assertTrue(sample.histogram(['FSC-A', 'SSC-A'], bins=100) is hist)
+        self.assertEqual(hist.counts.sum(), 10000)
+
+        gated = sample.gate(ThresholdGate(1000, 'FSC-A', 'above'))
+        gated_hist = gated.histogram(['FSC-A', 'SSC-A'], bins=hist.edges)
+        self.assertFalse(gated_hist is hist)
+        self.assertEqual(gated_hist.counts.sum(), gated.counts)
+
+    def test_histogram_cache_invalidation(self):
+        """ Cached histograms are not used after the data or the queued actions change """
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        above = sample.gate(ThresholdGate(1000, 'FSC-A', 'above'), apply_now=False)
+        edges = numpy.linspace(-10 ** 6, 10 ** 6, 51)
+        hist = above.histogram('FSC-A', bins=edges)
+        self.assertEqual(hist.counts.sum(), above.counts)
+
+        below = above.copy()  # A queue of the same length, with another gate
+        below.queue = [('gate', {'gate': ThresholdGate(1000, 'FSC-A', 'below'), 'apply_now': True,
+                                 'materialize': True})]
+        below._histograms = above._histograms
+        self.assertEqual(below.histogram('FSC-A', bins=edges).counts.sum(), below.counts)
+
+        loaded = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        hist = loaded.histogram('FSC-A', bins=50)
+        signature = loaded._get_data_signature()
+        self.assertTrue(loaded._copy_sharing_data()._get_data_signature() == signature)
+        self.assertFalse(loaded.copy()._get_data_signature() == signature)
+        loaded.data = loaded.data.iloc[:100]
+        self.assertEqual(loaded.histogram('FSC-A', bins=hist.edges[0]).counts.sum(), 100)
+        restored = pickle.loads(pickle.dumps(loaded, 2))
+        self.assertFalse(restored._get_data_signature() == loaded._get_data_signature())
+
+    def test_histogram_cache_is_not_copied(self):
+        sample = FCMeasurement(ID='test', datafile=test_data_file, readdata=True)
+        sample._data_from_file = True
+        sample.histogram(['FSC-A', 'SSC-A'], bins=100)
+        self.assertEqual(len(sample._histograms), 1)
+        derived = [sample.copy(), sample.copy(deep=False), sample._copy_sharing_data(),
+                   sample.gate(ThresholdGate(1000, 'FSC-A', 'above')),
+                   sample._get_worker_payload(), pickle.loads(pickle.dumps(sample, 2))]
+        for other in derived:
+            self.assertFalse('_histograms' in other.__dict__)
+        self.assertEqual(len(sample._histograms), 1)
+
+    def test_plate_plot(self):
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        plate.plot(['FSC-A', 'SSC-A'], bins=50)
+        sample = plate.values()[0]
+        cached = list(sample._histograms.values())[0][1]
+        plate.plot(['FSC-A', 'SSC-A'], bins=50)
+        self.assertTrue(list(sample._histograms.values())[0][1] is cached)
+        plate.plot('FSC-A')
+        plate.plot(['FSC-A', 'SSC-A'], kind='scatter', max_points=100)
+
+    def test_parallel_plot_reads_in_workers(self):
+        """ The ranges and the histograms of the wells are both computed by the workers """
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        threads = []
+        iter_data = FCMeasurement.iter_data
+
+        def recording_iter_data(self, *args, **kwargs):
+            threads.append(threading.current_thread())
+            return iter_data(self, *args, **kwargs)
+
+        FCMeasurement.iter_data = recording_iter_data
+        try:
+            for channels in (['FSC-A', 'SSC-A'], ['FSC-A']):
+                plate = FCPlate.from_dir('plate', test_data_dir)
+                del threads[:]
+                plate.plot(channels, bins=20, executor='threads', n_jobs=2)
+                self.assertEqual(len(threads), 2 * len(plate))  # Ranges, then histograms
+                self.assertFalse(threading.current_thread() in threads)
+        finally:
+            FCMeasurement.iter_data = iter_data
+
+    def test_parallel_plot_to_file(self):
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        expected = plate.histograms(['FSC-A', 'SSC-A'], bins=30)
+        plate = FCPlate.from_dir('plate', test_data_dir)
+        histograms = plate.histograms(['FSC-A', 'SSC-A'], bins=30, executor='processes', n_jobs=2)
+        for key in plate:
+            numpy.testing.assert_array_equal(histograms[key].counts, expected[key].counts)
+            self.assertTrue(plate[key].histogram(['FSC-A', 'SSC-A'], bins=histograms[key].edges)
+                            is histograms[key])  # Cached by the measurement
+        histograms = plate.histograms('FSC-A', bins=50, executor='processes', n_jobs=2)
+        for key in plate:
+            self.assertEqual(histograms[key].ndim, 1)
+            self.assertEqual(histograms[key].counts.sum(), plate[key].counts)
+
+        figure = plt.figure()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for ext in ('png', 'pdf'):
+                filename = os.path.join(tmpdir, 'plate.' + ext)
+                fig = plate.plot(['FSC-A', 'SSC-A'], bins=30, executor='threads', n_jobs=2,
+                                 filename=filename, figsize=(12, 8))
+                self.assertTrue(os.path.getsize(filename) > 0)
+            filename = os.path.join(tmpdir, 'plate_1d.svg')
+            plate.plot(['FSC-A'], filename=filename)
+            self.assertTrue(os.path.getsize(filename) > 0)
+            self.assertEqual(plt.get_fignums(), [figure.number])  # pyplot is not used
+            self.assertEqual(len(figure.axes), 0)
+            self.assertEqual(len(fig.axes), 1 + 96)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_view(self):
+        sample = FCMeasurement(ID='test', datafile=test_data_file)
+        sample.view(['FSC-A', 'SSC-A', 'B1-A'], offdiag_plot='scatter', max_points=500)
+
+
+if __name__ == '__main__':
+    unittest.main()
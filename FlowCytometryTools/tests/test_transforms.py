@@ -1,13 +1,17 @@
 '''
 @author: jonathanfriedman
 '''
+from multiprocessing.pool import ThreadPool
 import os
+import shutil
+import tempfile
 import unittest
 
 import numpy as np
 from numpy.testing import assert_almost_equal, assert_equal
+from scipy.optimize import brentq
 
-from FlowCytometryTools import FCMeasurement
+from FlowCytometryTools import FCCollection, FCMeasurement
 from FlowCytometryTools.core import transforms as trans
 from FlowCytometryTools.core.transforms import Transformation
 
@@ -16,6 +20,8 @@ base_path = os.path.dirname(os.path.realpath(__file__))
 
 test_path = os.path.join(base_path,'data', 'FlowCytometers', 
         'HTS_BD_LSR-II', 'HTS_BD_LSR_II_Mixed_Specimen_001_D6_D06.fcs')
+integer_test_path = os.path.join(base_path, 'data', 'FlowCytometers',
+        'FACSCaliburHTS', 'Sample_Well_A02.fcs')
 
 n = 1000
 _xmax = 2 ** 18  # max machine value
@@ -28,6 +34,15 @@ _yneg = -_ypos[::-1]
 _yall = np.r_[_yneg, _ypos]
 
 
+def make_hlog_brentq(b, r, d):
+    """
+    Returns a function that computes the hlog transformation by finding the root for each value
+    separately (the implementation replaced by the vectorized solver). Slow; used as a reference.
+    """
+    hlog_obj = lambda y, x: trans.hlog_inv(y, b, r, d) - x
+    return np.vectorize(lambda x: brentq(hlog_obj, -2 * r, 2 * r, args=(x,)))
+
+
 class TestTransforms(unittest.TestCase):
     def test_tlog(self):
         th = 2
@@ -110,3 +125,86 @@ class TestTransforms(unittest.TestCase):
         np.testing.assert_array_almost_equal(data, correct_output, 5,
                                              err_msg='the hlog transformation gives '
                                                      'an incorrect result')
+
+    def test_hlog_matches_brentq(self):
+        x = np.r_[_xall, 0, 1e-300, 1e7]
+        for b in [1, 10, 500, 1e4]:
+            expected = make_hlog_brentq(b, _ymax, np.log10(_xmax))(x)
+            result = trans.hlog(x, b=b)
+            np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-9)
+        # Values outside of the range of the brentq bracket
+        np.testing.assert_allclose(trans.hlog_inv(trans.hlog([1e12, 1e100])), [1e12, 1e100], rtol=1e-12)
+        result = trans.hlog(np.array([np.nan, np.inf, -np.inf]))
+        assert_equal(result, [np.nan, np.inf, -np.inf])
+        self.assertAlmostEqual(trans.hlog(1e3), make_hlog_brentq(500, _ymax, np.log10(_xmax))(1e3))
+
+    def test_lut(self):
+        transformation = Transformation(transform='hlog', direction='forward', b=10)
+        x = np.array([[0, 5, 1023], [7, 1, 2]], dtype=np.uint16)
+        expected = transformation(x)
+        result = transformation(x, lut_range=1024)
+        assert_almost_equal(result, expected)
+        self.assertTrue(transformation.get_lut(1024) is transformation.get_lut(1024))
+        # Values outside of the range are transformed without the table
+        assert_almost_equal(transformation(x, lut_range=1000), expected)
+
+    def test_lut_on_fc_measurement(self):
+        fc_measurement = FCMeasurement(ID='test', datafile=integer_test_path)
+        self.assertEqual(fc_measurement._get_lut_range(fc_measurement.data, ['FSC-H']), 1024)
+        expected = fc_measurement.transform('hlog', b=10, use_spln=False, use_lut=False).data
+        result = fc_measurement.transform('hlog', b=10, use_spln=False).data
+        assert_almost_equal(result.values, expected.values)
+
+    def test_lut_on_fc_collection(self):
+        """ The ranges of the data are not computed for a spline that the lookup table replaces """
+        collection = FCCollection.from_files('collection', [integer_test_path], parser=lambda x: x)
+        sample = collection.values()[0]
+        self.assertTrue(sample._lut_applies(['FSC-H']))
+        self.assertTrue(sample._data is None)
+        self.assertFalse(sample.transform('hlog', b=10)._lut_applies(['FSC-H']))
+        self.assertFalse(sample.transform('hlog', b=10, apply_now=False)._lut_applies(['FSC-H']))
+
+        def channel_ranges(*args, **kwargs):
+            raise AssertionError('channel_ranges should not be called')
+        collection.channel_ranges = channel_ranges
+        expected = sample.transform('hlog', channels=['FSC-H'], b=10, use_spln=False).data
+        result = collection.transform('hlog', channels=['FSC-H'], b=10).values()[0].data
+        assert_almost_equal(result.values, expected.values)
+
+    def test_lut_threads(self):
+        """ Threads looking up the same table share it """
+        transformation = Transformation(transform='hlog', direction='forward', b=30)
+        pool = ThreadPool(4)
+        try:
+            luts = pool.map(transformation.get_lut, [2048] * 8)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertTrue(all(lut is luts[0] for lut in luts))
+
+    def test_spline_registry(self):
+        trans.spline_registry.clear()
+        transformation = Transformation(transform='hlog', direction='forward', b=10)
+        transformation.set_spline(-100, 1000)
+        spln = transformation.spln
+        self.assertEqual(len(trans.spline_registry), 1)
+
+        other = Transformation(transform='hlog', direction='forward', b=10)
+        other.set_spline(-100, 1000)
+        self.assertTrue(other.spln is spln)
+        other = Transformation(transform='hlog', direction='forward', b=20)
+        other.set_spline(-100, 1000)
+        self.assertFalse(other.spln is spln)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'splines.pkl')
+            trans.spline_registry.save(path)
+            trans.spline_registry.clear()
+            trans.spline_registry.load(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(len(trans.spline_registry), 2)
+        transformation.set_spline(-100, 1000)
+        assert_almost_equal(transformation.spln(_xpos[:10]), spln(_xpos[:10]))
+        trans.spline_registry.clear()
@@ -0,0 +1,45 @@
+"""
+Benchmark of the polygon gate.
+
+Compares PolyGate (bounding box prefilter + crossing number test, with and
+without the raster lookup) with matplotlib's Path.contains_points.
+
+Usage: python benchmarks/bench_gates.py [number of events] [number of vertices]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from matplotlib.path import Path
+
+from FlowCytometryTools import PolyGate
+
+
+def main(n=10 ** 6, n_vert=50):
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.normal(5, 3, size=(n, 2)), columns=['x', 'y'])
+    angles = np.linspace(0, 2 * np.pi, n_vert, endpoint=False)
+    radii = np.where(np.arange(n_vert) % 2, 3, 4)
+    vert = list(zip(5 + radii * np.cos(angles), 5 + radii * np.sin(angles)))
+
+    def matplotlib_path():
+        return Path(vert).contains_points(data.filter(['x', 'y']))
+
+    expected = matplotlib_path()
+    t_path = min(timeit.repeat(matplotlib_path, number=1, repeat=3))
+    print('{} events, polygon of {} vertices'.format(n, n_vert))
+    print('  matplotlib Path:     {:.4f} s'.format(t_path))
+
+    for resolution in (None, 256):
+        gate = PolyGate(vert, ['x', 'y'], resolution=resolution)
+        assert np.array_equal(gate._identify(data), expected)
+        t_gate = min(timeit.repeat(lambda: gate._identify(data), number=1, repeat=3))
+        print('  PolyGate (resolution={}): {:.4f} s ({:.1f}x faster)'.format(
+            resolution, t_gate, t_path / t_gate))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,36 @@
+"""
+Benchmark of the hlog transformation.
+
+Compares the vectorized solver (FlowCytometryTools.core.transforms.hlog)
+with the previous implementation (one brentq root finding per value).
+
+Usage: python benchmarks/bench_transforms.py [number of events]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+import numpy as np
+
+from FlowCytometryTools.core import transforms
+from FlowCytometryTools.tests.test_transforms import make_hlog_brentq
+
+
+def main(n=10 ** 5):
+    x = np.random.RandomState(0).uniform(-10 ** 3, 2 ** 18, n)
+    b, r, d = 500, transforms._display_max, transforms._l_mmax
+    reference = make_hlog_brentq(b, r, d)
+
+    t_vectorized = min(timeit.repeat(lambda: transforms.hlog(x, b, r, d), number=1, repeat=3))
+    t_brentq = min(timeit.repeat(lambda: reference(x), number=1, repeat=1))
+    error = np.abs(transforms.hlog(x, b, r, d) - reference(x)).max()
+
+    print('hlog of {} events'.format(n))
+    print('  brentq:     {:.4f} s'.format(t_brentq))
+    print('  vectorized: {:.4f} s ({:.0f}x faster)'.format(t_vectorized, t_brentq / t_vectorized))
+    print('  max abs difference: {:.3g}'.format(error))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])